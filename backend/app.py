@@ -1,196 +1,813 @@
-import pandas as pd
+import math
+import os
+from datetime import datetime
+from typing import Any, Dict, List
 import numpy as np
-import gower
-from fastapi import FastAPI, HTTPException
-import joblib
-from real_estate_predictor.backend.schema import PropertyInput, PredictionResponse,SimilarListing
+from fastapi import BackgroundTasks, FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from real_estate_predictor.backend.schema import (
+    PropertyInput, PredictionResponse, SimilarListing,
+    BatchPredictionItem, BatchPredictionResponse,
+    ExplanationResponse, BatchExplanationItem, BatchExplanationResponse,
+    SensitivityRequest, SensitivityResponse
+)
+from real_estate_predictor.backend.comparables import ComparablesStore, SEARCH_COLUMNS
+from real_estate_predictor.backend.feature_encoder import (
+    add_features, encode_properties, FEATURE_COLUMNS, FEATURE_INDEX
+)
+from real_estate_predictor.backend.scheduler import MicroBatcher
+from real_estate_predictor.backend.cache import PredictionCache, canonical_key
+from real_estate_predictor.backend.model_registry import ModelRegistry
+from real_estate_predictor.backend.model_router import ModelRouter
+from real_estate_predictor.backend.metrics import (
+    CONTENT_TYPE, Metrics, MetricsMiddleware, StageTimer, process_memory, record_timings
+)
+from real_estate_predictor.backend.sensitivity import axis_size, axis_values, expand_grid
+from real_estate_predictor.backend.upload import (
+    MEDIA_TYPES, format_results, missing_columns, read_chunks, validate_chunk
+)
 
 
 app = FastAPI(title="Real Estate Price Predictor", version="1.0.0")
 
-def load_models():
-    try:
-        model = joblib.load('best_real_estate_model.pkl')
-        print("Model loaded successfully")
-    except Exception as e:
-        print(f"Error loading model: {e}")
-        model = None
+metrics = Metrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
 
-    return model
+MODEL_PATH = os.getenv('MODEL_PATH', 'best_real_estate_model.pkl')
+MODEL_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', 'models')
+MODEL_RUNTIME = os.getenv('MODEL_RUNTIME', 'trees')
+MODEL_EXPLAIN = os.getenv('MODEL_EXPLAIN', '1') != '0'
 
-model = load_models()
+registry = ModelRegistry(MODEL_REGISTRY_DIR, fallback_path=MODEL_PATH, runtime=MODEL_RUNTIME, explain=MODEL_EXPLAIN)
+registry.load_initial(os.getenv('MODEL_VERSION'))
 
-def smart_floor_feature(floor, total_floors):
-    
-    if total_floors == 1:
-        return 0.5
-    relative = (floor - 1) / (total_floors - 1)
-    
-    if total_floors <= 5: 
-        if floor == 1:
-            return relative * 0.7 
-        elif floor == total_floors:
-            return relative * 1.1  
-        else:
-            return relative
-            
-    else:  # высотки
-        if floor == 1:
-            return relative * 0.6  
-        elif floor == total_floors:
-            return relative * 1.4  
-        elif floor >= total_floors - 2:
-            return relative * 1.2 
-        else:
-            return relative
-
-def create_city_specific_features(df):
-    """Создает признаки учитывающие специфику городов"""
-    df = df.copy()
-    
-    # Питерские исторические дома (особый случай)
-    df['is_spb_historical'] = ((df['city'] == 'Питер') & 
-                              (df['house_age'] > 130) & 
-                              (df['house_type'])).astype(int)
-    
-    df['is_prestigious_historical'] = ((df['house_age'] > 100) & 
-                                      (df['city'].isin(['Питер', 'Москва'])) & 
-                                      (df['house_type'])).astype(int)
-    
-    
-    return df
+# модели городов: <CITY_MODELS_DIR>/<город>/<version>/, загружаются при первом запросе по городу
+CITY_MODELS_DIR = os.getenv('CITY_MODELS_DIR', os.path.join(MODEL_REGISTRY_DIR, 'cities'))
+CITY_MODELS_MEMORY_MB = float(os.getenv('CITY_MODELS_MEMORY_MB', '512'))
+CITY_MODELS_CHECK_INTERVAL = float(os.getenv('CITY_MODELS_CHECK_INTERVAL', '30'))
 
+router = ModelRouter(
+    CITY_MODELS_DIR, registry,
+    memory_budget=int(CITY_MODELS_MEMORY_MB * 1024 * 1024),
+    runtime=MODEL_RUNTIME, explain=MODEL_EXPLAIN,
+    check_interval=CITY_MODELS_CHECK_INTERVAL
+)
+router.refresh()
 
-def create_city_aware_age_features(df):
-    """Создает возрастные признаки с учетом специфики городов"""
-    df = df.copy()
-    
-    df['house_age'] = 2026 - df['build_year']
-    
-    def get_city_specific_age_group(city, age):
-        if city == 'Питер':
-            if age <= 5: return 'спб_новостройка'
-            elif age <= 30: return 'спб_современная'
-            elif age <= 60: return 'спб_советская'
-            elif age <= 100: return 'спб_дореволюционная'
-            else: return 'спб_историческая'
-        elif city == 'Москва':
-            if age <= 5: return 'мск_новостройка'
-            elif age <= 30: return 'мск_современная'
-            elif age <= 60: return 'мск_советская'
-            elif age <= 100: return 'мск_старая'
-            else: return 'мск_историческая'
-        else:  # Другие города
-            if age <= 5: return 'др_новостройка'
-            elif age <= 30: return 'др_современная'
-            elif age <= 60: return 'др_советская'
-            else: return 'др_старая'
-    
-    df['city_specific_age_group'] = df.apply(
-        lambda x: get_city_specific_age_group(x['city'], x['house_age']), axis=1
+COMPARABLES_PATH = os.getenv('COMPARABLES_PATH', 'real_estate_predictor/EDA&model_train/ready_to_train.csv')
+COMPARABLES_CHECK_INTERVAL = float(os.getenv('COMPARABLES_CHECK_INTERVAL', '5'))
+COMPARABLES_K = int(os.getenv('COMPARABLES_K', '3'))
+COMPARABLES_INDEX = os.getenv('COMPARABLES_INDEX', '1') != '0'
+
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '10000'))
+FAST_PATH_MAX_ROWS = int(os.getenv('FAST_PATH_MAX_ROWS', '64'))
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', '5000'))
+EXPLAIN_TOP_K = int(os.getenv('EXPLAIN_TOP_K', '5'))
+SENSITIVITY_MAX_POINTS = int(os.getenv('SENSITIVITY_MAX_POINTS', '2500'))
+
+comparables = ComparablesStore(COMPARABLES_PATH, check_interval=COMPARABLES_CHECK_INTERVAL, index=COMPARABLES_INDEX)
+comparables.reload()
+
+prediction_cache = PredictionCache(
+    max_size=int(os.getenv('PREDICTION_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('PREDICTION_CACHE_TTL', '600'))
+)
+# объяснения не зависят от аналогов: версия кэша — только версия модели
+explanation_cache = PredictionCache(
+    max_size=int(os.getenv('EXPLANATION_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('PREDICTION_CACHE_TTL', '600'))
+)
+
+def current_version():
+    """Версия, от которой зависит ответ: модель, набор моделей городов и снимок аналогов"""
+    snapshot = comparables.get()
+    entry = registry.active
+    return (
+        entry.version if entry is not None else None,
+        router.generation,
+        snapshot.version if snapshot is not None else None
     )
-    
-    df['age_city_premium'] = df.apply(calculate_age_city_premium, axis=1)
-    
-    return df
 
-def calculate_age_city_premium(row):
-    """Рассчитывает премию за возраст в зависимости от города"""
-    city = row['city']
-    age = row['house_age']
-    
-    if city == 'Питер':
-        if age > 100: return 1.4  
-        elif age > 80: return 1.2
-        elif age <= 5: return 1.1
-        else: return 1.0
-    elif city == 'Москва':
-        if age <= 5: return 1.3 
-        elif age > 100: return 1.1
-        else: return 1.0
-    else:  # Другие города
-        if age <= 5: return 1.1
-        elif age > 50: return 0.9 
-        else: return 1.0
-
-
-def transform_inf(resp):
+def transform_inf(resp, historical_age_fill=None):
+    # pandas — только у пакетов, загрузки файлов и проверки четности: /predict его не импортирует
+    import pandas as pd
+
     if isinstance(resp, dict):
         resp = pd.DataFrame([resp])
     
     resp['rooms'] = resp['rooms'].replace('студия', 0)
     resp[['cargo_lift', 'passenger_lift']] = resp[['cargo_lift', 'passenger_lift']].replace('нет', 0)
     resp[['cargo_lift', 'passenger_lift','rooms']] = resp[['cargo_lift', 'passenger_lift','rooms']].astype(int)
-    resp['smart_floor_ratio'] = resp.apply(lambda x: smart_floor_feature(x['floor'], x['floors_total']), axis=1)
-    resp = create_city_aware_age_features(resp)
-    resp = create_city_specific_features(resp)
-    resp = resp.drop('build_year', axis =1 )
+    resp = add_features(resp, historical_age_fill)
     
-    return resp[['rooms', 'total_area', 'kitchen_area', 'floor',
-       'renovation', 'house_type', 'passenger_lift', 'cargo_lift', 'parking',
-       'city', 'floors_total', 'smart_floor_ratio', 'house_age',
-       'city_specific_age_group', 'age_city_premium', 'is_spb_historical']]
+    return resp[FEATURE_COLUMNS]
 
 @app.get("/")
 async def root():
     return {"message": "Real Estate Price Prediction API", "status": "active"}
 
 
+def encode_inputs(inputs, age_fill=None):
+    """Признаки модели для списка PropertyInput: небольшие пакеты кодируются напрямую, без построения DataFrame"""
+    if len(inputs) <= FAST_PATH_MAX_ROWS:
+        return encode_properties(inputs, age_fill)
+    import pandas as pd
+
+    return transform_inf(pd.DataFrame([item.dict() for item in inputs]), age_fill)
+
+
+def group_features(processed_data, inputs, indices, age_fill, entry):
+    """Признаки строк indices для модели entry: из общего кодирования, если совпадает historical_age_fill"""
+    fill = entry.metadata.get('historical_age_fill')
+    if fill != age_fill:
+        return encode_inputs([inputs[i] for i in indices], fill)
+    if len(indices) == len(inputs):
+        return processed_data
+    if isinstance(processed_data, list):
+        return [processed_data[i] for i in indices]
+    return processed_data.iloc[indices]
+
+
+def predict_batch(inputs, timer=None):
+    """Прогноз цен, похожие объекты и версии моделей для списка PropertyInput за один проход
+
+    Строки делятся по моделям городов (router); цена строки без модели — None.
+    timer (StageTimer) получает длительности стадий route, encode, comparables_load,
+    index, distances, select, listings и predict.
+    """
+    timer = timer or StageTimer()
+    # модели фиксируются на весь пакет: подмена версии не разрывает пакет пополам
+    groups = router.route([item.city for item in inputs])
+    timer.lap('route')
+    entry = groups[0][0]
+    # средний возраст старых домов берется из датасета, на котором обучена версия
+    age_fill = entry.metadata.get('historical_age_fill') if entry is not None else None
+
+    processed_data = encode_inputs(inputs, age_fill)
+    if isinstance(processed_data, list):
+        query = {col: [row[FEATURE_INDEX[col]] for row in processed_data] for col in SEARCH_COLUMNS}
+    else:
+        query = processed_data
+    timer.lap('encode')
+
+    snapshot = comparables.get()
+    timer.lap('comparables_load')
+
+    if snapshot is not None:
+        neighbours = snapshot.nearest(query, k=COMPARABLES_K, timer=timer)
+        similar = [
+            [SimilarListing(**row) for row in snapshot.listings(indices)]
+            for indices in neighbours
+        ]
+        timer.lap('listings')
+    else:
+        similar = [[] for _ in inputs]
+
+    prices = [None] * len(inputs)
+    versions = [None] * len(inputs)
+    for group_entry, indices in groups:
+        if group_entry is None:
+            continue
+        prediction = group_entry.model.predict(group_features(processed_data, inputs, indices, age_fill, group_entry))
+        for i, price in zip(indices, np.expm1(prediction)):
+            prices[i] = round(float(price), -3)
+            versions[i] = group_entry.version
+    timer.lap('predict')
+    return prices, similar, versions
+
+
+def score_inputs(inputs):
+    """Возвращает (цена, похожие объекты, версия модели, ошибка, стадии) для каждого PropertyInput
+
+    Стадии — длительности прохода, в который попала строка (общие для всего пакета).
+    """
+    timer = StageTimer()
+    try:
+        prices, similar, versions = predict_batch(inputs, timer)
+        metrics.observe_stages(timer.stages)
+        return [(prices[k], similar[k], versions[k], None, timer.stages) for k in range(len(inputs))]
+    except Exception:
+        # Векторный проход упал — считаем построчно, чтобы локализовать ошибку
+        outcomes = []
+        for item in inputs:
+            timer = StageTimer()
+            try:
+                prices, similar, versions = predict_batch([item], timer)
+                metrics.observe_stages(timer.stages)
+                outcomes.append((prices[0], similar[0], versions[0], None, timer.stages))
+            except Exception as e:
+                outcomes.append((None, [], None, e, timer.stages))
+        return outcomes
+
+
+scheduler = MicroBatcher(
+    score_inputs,
+    max_batch_size=int(os.getenv('INFERENCE_MAX_BATCH', '64')),
+    max_wait_ms=float(os.getenv('INFERENCE_MAX_WAIT_MS', '2')),
+    max_workers=int(os.getenv('INFERENCE_WORKERS', '2'))
+)
+
+
+def explain_batch(entry, inputs, timer):
+    """SHAP-объяснения списка PropertyInput одним вызовом ShapValues"""
+    processed_data = encode_inputs(inputs, entry.metadata.get('historical_age_fill'))
+    timer.lap('encode')
+    explanations = entry.explainer.explain(processed_data)
+    timer.lap('explain')
+    return explanations
+
+
+def explain_inputs(inputs):
+    """Возвращает (объяснение, версия модели, ошибка, стадии) для каждого PropertyInput"""
+    # модели фиксируются на весь пакет, как в predict_batch
+    timer = StageTimer()
+    groups = router.route([item.city for item in inputs])
+    timer.lap('route')
+    outcomes = [None] * len(inputs)
+    for entry, indices in groups:
+        for i, outcome in zip(indices, explain_group(entry, [inputs[i] for i in indices], timer)):
+            outcomes[i] = outcome
+    metrics.observe_stages(timer.stages)
+    return outcomes
+
+
+def explain_group(entry, inputs, timer):
+    """Объяснения строк одной модели; у модели без объяснителя — ошибка в каждой строке"""
+    if entry is None or entry.explainer is None:
+        error = RuntimeError("Explanations are not available for the active model" if entry is None
+                             else f"Explanations are not available for model {entry.version}")
+        return [(None, None, error, {}) for _ in inputs]
+
+    try:
+        explanations = explain_batch(entry, inputs, timer)
+        return [(explanation, entry.version, None, timer.stages) for explanation in explanations]
+    except Exception:
+        # как в score_inputs: построчный пересчет локализует ошибку
+        outcomes = []
+        for item in inputs:
+            timer = StageTimer()
+            try:
+                explanation = explain_batch(entry, [item], timer)[0]
+                metrics.observe_stages(timer.stages)
+                outcomes.append((explanation, entry.version, None, timer.stages))
+            except Exception as e:
+                outcomes.append((None, None, e, timer.stages))
+        return outcomes
+
+
+# ShapValues на строку в разы дороже прогноза: пакеты меньше, чтобы не копить очередь
+explain_scheduler = MicroBatcher(
+    explain_inputs,
+    max_batch_size=int(os.getenv('EXPLAIN_MAX_BATCH', '8')),
+    max_wait_ms=float(os.getenv('INFERENCE_MAX_WAIT_MS', '2')),
+    max_workers=int(os.getenv('INFERENCE_WORKERS', '2'))
+)
+
+
 @app.post("/predict", response_model=PredictionResponse)
 async def predict_property_price(input_data: PropertyInput):
     """
     Предсказание цены недвижимости на основе параметров
     """
-    try:
-        input_dict = input_data.dict()
-        processed_data = transform_inf(input_dict)
-        df = pd.read_csv('real_estate_predictor/EDA&model_train/ready_to_train.csv.csv')
-        
-        col = ['rooms','total_area', 'kitchen_area','floor', 'renovation', 'house_type', 'city']
-        
-        distance_matrix = gower.gower_matrix(df[col], processed_data[col])
-        nearest_indices = distance_matrix.argsort(axis=0)[1:4] 
-        nearest_rows = df.iloc[nearest_indices.flatten()]
-
-        similar_listings = [
-            SimilarListing(
-                link=row['link'],
-                price=row.get('price', 0),
-                rooms=row['rooms'],
-                total_area=row['total_area']
-            )
-            for _, row in nearest_rows.iterrows()
-        ]
+    version = current_version()
+    key = canonical_key(input_data)
+    cached = prediction_cache.get(key, version)
+    if cached is not None:
+        price, similar_listings, used_version = cached
+        error = None
+    else:
+        price, similar_listings, used_version, error, stages = await scheduler.submit(input_data)
+        record_timings(stages)
+        if error is None and price is not None:
+            prediction_cache.put(key, (price, similar_listings, used_version), version)
 
-        if model is None:
-            return PredictionResponse(
-                predicted_price=0,
-                status="error",
-                message="Model not loaded",
-                similar_listings=similar_listings
-            )
-        
-        prediction = model.predict(processed_data)
-        predicted_price = round(float(np.expm1(prediction[0])), -3) 
-
-            
+    if error is not None:
+        metrics.count_error(error)
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Prediction error: {str(error)}"
+        )
+
+    if price is None:
         return PredictionResponse(
-            predicted_price=predicted_price,
-            status="success",
-            message="Price predicted successfully",
+            predicted_price=0,
+            status="error",
+            message="Model not loaded",
             similar_listings=similar_listings
         )
-    except Exception as e:
+
+    return PredictionResponse(
+        predicted_price=price,
+        status="success",
+        message="Price predicted successfully",
+        similar_listings=similar_listings,
+        model_version=used_version
+    )
+
+
+@app.post("/predict/batch", response_model=BatchPredictionResponse)
+async def predict_property_price_batch(rows: List[Dict[str, Any]]):
+    """
+    Пакетное предсказание: ошибка в строке не роняет весь пакет
+    """
+    if len(rows) > MAX_BATCH_SIZE:
         raise HTTPException(
-            status_code=500, 
-            detail=f"Prediction error: {str(e)}"
+            status_code=413,
+            detail=f"Batch too large: {len(rows)} > {MAX_BATCH_SIZE}"
         )
 
+    results = [None] * len(rows)
+    valid_indices = []
+    valid_inputs = []
+    for i, row in enumerate(rows):
+        try:
+            valid_inputs.append(PropertyInput(**row))
+            valid_indices.append(i)
+        except ValidationError as e:
+            metrics.count_error(e)
+            results[i] = BatchPredictionItem(index=i, status="error", message=str(e))
+
+    if valid_inputs:
+        version = current_version()
+        keys = [canonical_key(item) for item in valid_inputs]
+        outcomes = [None] * len(valid_inputs)
+        missing = []
+        for k, key in enumerate(keys):
+            cached = prediction_cache.get(key, version)
+            if cached is not None:
+                outcomes[k] = (*cached, None, None)
+            else:
+                missing.append(k)
+
+        if missing:
+            scored = await scheduler.run(score_inputs, [valid_inputs[k] for k in missing])
+            # стадии общие для прохода; при построчном пересчете в Server-Timing идет сумма
+            passes = {}
+            for k, outcome in zip(missing, scored):
+                outcomes[k] = outcome
+                price, similar_listings, used_version, error, stages = outcome
+                passes[id(stages)] = stages
+                if error is None and price is not None:
+                    prediction_cache.put(keys[k], (price, similar_listings, used_version), version)
+            for stages in passes.values():
+                record_timings(stages)
+
+        for i, (price, similar_listings, used_version, error, _) in zip(valid_indices, outcomes):
+            if error is not None:
+                metrics.count_error(error)
+                results[i] = BatchPredictionItem(
+                    index=i, status="error", message=f"Prediction error: {str(error)}"
+                )
+            elif price is None:
+                results[i] = BatchPredictionItem(
+                    index=i, status="error", message="Model not loaded",
+                    similar_listings=similar_listings
+                )
+            else:
+                results[i] = BatchPredictionItem(
+                    index=i, status="success", message="Price predicted successfully",
+                    predicted_price=price, similar_listings=similar_listings,
+                    model_version=used_version
+                )
+
+    return BatchPredictionResponse(results=results)
+
+
+def price_grid(entry, inputs, timer):
+    """Сетка кодируется encode_properties при любом размере: у transform_inf
+    постоянные накладные расходы pandas больше, чем весь расчет кривой"""
+    processed_data = encode_properties(inputs, entry.metadata.get('historical_age_fill'))
+    timer.lap('encode')
+    prediction = entry.model.predict(processed_data)
+    timer.lap('predict')
+    return [round(float(price), -3) for price in np.expm1(prediction)]
+
+
+def score_grid(inputs):
+    """Цены точек сетки проходом encode + predict на модель города, без поиска аналогов
+
+    Возвращает (цены, ошибки, версии моделей по точкам, стадии); цена точки с ошибкой — None.
+    """
+    timer = StageTimer()
+    groups = router.route([item.city for item in inputs])
+    timer.lap('route')
+    prices, errors, versions = [None] * len(inputs), [None] * len(inputs), [None] * len(inputs)
+    for entry, indices in groups:
+        if entry is None:
+            for i in indices:
+                errors[i] = RuntimeError("Model not loaded")
+            continue
+        try:
+            group_prices = price_grid(entry, [inputs[i] for i in indices], timer)
+            group_errors = [None] * len(indices)
+        except Exception:
+            # как в score_inputs: построчный пересчет локализует ошибку
+            group_prices, group_errors = [], []
+            for i in indices:
+                try:
+                    group_prices.append(price_grid(entry, [inputs[i]], timer)[0])
+                    group_errors.append(None)
+                except Exception as e:
+                    group_prices.append(None)
+                    group_errors.append(e)
+        for i, price, error in zip(indices, group_prices, group_errors):
+            prices[i], errors[i] = price, error
+            versions[i] = entry.version if error is None else None
+    metrics.observe_stages(timer.stages)
+    return prices, errors, versions, timer.stages
+
+
+@app.post("/predict/sensitivity", response_model=SensitivityResponse)
+async def predict_sensitivity(request: SensitivityRequest):
+    """
+    Цены при изменении одного или двух параметров базового объекта: кривая или поверхность
+    """
+    if registry.active is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    # размер сетки проверяется до того, как строится хоть одна ось
+    try:
+        size = math.prod(axis_size(axis, request.base) for axis in request.axes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if size > SENSITIVITY_MAX_POINTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Grid too large: {size:.0f} > {SENSITIVITY_MAX_POINTS}"
+        )
+    try:
+        values = [axis_values(axis, request.base) for axis in request.axes]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    points = math.prod(len(v) for v in values)
+
+    inputs, positions, errors = expand_grid(request.base, request.axes, values)
+    if errors:
+        metrics.count_error('ValidationError', len(errors))
+    # базовый объект — первой строкой того же прохода
+    prices, point_errors, versions, stages = await scheduler.run(score_grid, [request.base] + inputs)
+    record_timings(stages)
+    if point_errors[0] is not None:
+        metrics.count_error(point_errors[0])
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(point_errors[0])}")
+
+    grid = np.full([len(v) for v in values], None, dtype=object)
+    for position, price, error in zip(positions, prices[1:], point_errors[1:]):
+        if error is not None:
+            metrics.count_error(error)
+            errors.append((list(position), f"Prediction error: {str(error)}"))
+        grid[position] = price
+    scored = sum(error is None for error in point_errors[1:])
+
+    return SensitivityResponse(
+        base_price=prices[0],
+        status="success",
+        message=f"Scored {scored} of {points} grid points",
+        axes=[{"feature": axis.feature, "values": axis_vals} for axis, axis_vals in zip(request.axes, values)],
+        prices=grid.tolist(),
+        errors=[{"index": index, "message": message} for index, message in errors],
+        model_version=versions[0]
+    )
+
+
+def explanation_version(top_k):
+    """Версия моделей для кэша объяснений; 400/503, если глобальную модель объяснить нельзя"""
+    if not 1 <= top_k <= len(FEATURE_COLUMNS):
+        raise HTTPException(status_code=400, detail=f"top_k must be between 1 and {len(FEATURE_COLUMNS)}")
+    entry = registry.active
+    # can_explain не загружает объяснитель: это сделает поток explain_scheduler
+    if entry is None or not entry.can_explain:
+        raise HTTPException(status_code=503, detail="Explanations are not available for the active model")
+    return entry.version, router.generation
+
+
+@app.post("/explain", response_model=ExplanationResponse)
+async def explain_property_price(input_data: PropertyInput, top_k: int = EXPLAIN_TOP_K):
+    """
+    Цена и top_k признаков с наибольшим вкладом в рублях (SHAP относительно базовой цены модели)
+    """
+    version = explanation_version(top_k)
+    key = canonical_key(input_data)
+    cached = explanation_cache.get(key, version)
+    if cached is not None:
+        explanation, used_version = cached
+        error = None
+    else:
+        explanation, used_version, error, stages = await explain_scheduler.submit(input_data)
+        record_timings(stages)
+        if error is None:
+            explanation_cache.put(key, (explanation, used_version), version)
+
+    if error is not None:
+        metrics.count_error(error)
+        raise HTTPException(status_code=500, detail=f"Explanation error: {str(error)}")
+
+    return ExplanationResponse(
+        predicted_price=explanation['predicted_price'],
+        base_price=explanation['base_price'],
+        status="success",
+        message="Price explained successfully",
+        contributions=explanation['contributions'][:top_k],
+        model_version=used_version
+    )
+
+
+@app.post("/explain/batch", response_model=BatchExplanationResponse)
+async def explain_property_price_batch(rows: List[Dict[str, Any]], top_k: int = EXPLAIN_TOP_K):
+    """
+    Пакетные объяснения: непосчитанные строки идут одним вызовом ShapValues
+    """
+    version = explanation_version(top_k)
+    if len(rows) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(rows)} > {MAX_BATCH_SIZE}"
+        )
+
+    results = [None] * len(rows)
+    valid_indices = []
+    valid_inputs = []
+    for i, row in enumerate(rows):
+        try:
+            valid_inputs.append(PropertyInput(**row))
+            valid_indices.append(i)
+        except ValidationError as e:
+            metrics.count_error(e)
+            results[i] = BatchExplanationItem(index=i, status="error", message=str(e))
+
+    if valid_inputs:
+        keys = [canonical_key(item) for item in valid_inputs]
+        outcomes = [None] * len(valid_inputs)
+        missing = []
+        for k, key in enumerate(keys):
+            cached = explanation_cache.get(key, version)
+            if cached is not None:
+                outcomes[k] = (*cached, None, None)
+            else:
+                missing.append(k)
+
+        if missing:
+            scored = await explain_scheduler.run(explain_inputs, [valid_inputs[k] for k in missing])
+            passes = {}
+            for k, outcome in zip(missing, scored):
+                outcomes[k] = outcome
+                explanation, used_version, error, stages = outcome
+                passes[id(stages)] = stages
+                if error is None:
+                    explanation_cache.put(keys[k], (explanation, used_version), version)
+            for stages in passes.values():
+                record_timings(stages)
+
+        for i, (explanation, used_version, error, _) in zip(valid_indices, outcomes):
+            if error is not None:
+                metrics.count_error(error)
+                results[i] = BatchExplanationItem(
+                    index=i, status="error", message=f"Explanation error: {str(error)}"
+                )
+            else:
+                results[i] = BatchExplanationItem(
+                    index=i, status="success", message="Price explained successfully",
+                    predicted_price=explanation['predicted_price'], base_price=explanation['base_price'],
+                    contributions=explanation['contributions'][:top_k], model_version=used_version
+                )
+
+    return BatchExplanationResponse(results=results)
+
+
+def score_chunk(frame, start, timer):
+    """Кусок загруженного файла -> результаты по строкам (index, status, message, predicted_price, model_version)
+
+    Без поиска аналогов: только transform_inf и model.predict на модель города.
+    """
+    import pandas as pd
+
+    clean, errors = validate_chunk(frame)
+    valid = pd.isna(errors)
+    invalid = int((~valid).sum())
+    if invalid:
+        metrics.count_error('ValidationError', invalid)
+    timer.lap('validate')
+
+    prices = np.full(len(frame), np.nan)
+    versions = np.full(len(frame), None, dtype=object)
+    if len(clean):
+        # номера валидных строк в куске: clean[k] — строка rows[k]
+        rows = np.flatnonzero(valid)
+        groups = router.route(clean['city'].tolist())
+        timer.lap('route')
+        for entry, indices in groups:
+            targets = rows[indices]
+            if entry is None:
+                errors[targets] = "Model not loaded"
+                valid[targets] = False
+                continue
+            part = clean if len(groups) == 1 else clean.iloc[indices].reset_index(drop=True)
+            try:
+                processed_data = transform_inf(part, entry.metadata.get('historical_age_fill'))
+                timer.lap('encode')
+                prediction = entry.model.predict(processed_data)
+                prices[targets] = [round(float(price), -3) for price in np.expm1(prediction)]
+                versions[targets] = entry.version
+                timer.lap('predict')
+            except Exception as e:
+                metrics.count_error(e, len(targets))
+                errors[targets] = f"Prediction error: {str(e)}"
+                valid[targets] = False
+
+    return pd.DataFrame({
+        'index': np.arange(start, start + len(frame)),
+        'status': np.where(valid, 'success', 'error'),
+        'message': np.where(valid, 'Price predicted successfully', errors),
+        'predicted_price': prices,
+        'model_version': versions,
+    })
+
+
+def stream_upload(chunk, chunks, fmt):
+    """Результаты по кускам файла; следующий кусок читается после отправки предыдущего"""
+    import pandas as pd
+
+    start = 0
+    header = True
+    try:
+        while chunk is not None:
+            timer = StageTimer()
+            yield format_results(score_chunk(chunk, start, timer), fmt, header)
+            # время отправки клиенту не относится к стадиям
+            timer.skip()
+            start += len(chunk)
+            header = False
+            try:
+                chunk = next(chunks, None)
+            except Exception as e:
+                # статус ответа уже отправлен: ошибка чтения идет последней строкой
+                metrics.count_error(e)
+                chunk = None
+                yield format_results(pd.DataFrame([{
+                    'index': start, 'status': 'error', 'message': f"Cannot read file: {str(e)}",
+                    'predicted_price': None, 'model_version': None
+                }]), fmt, header)
+            timer.lap('read')
+            metrics.observe_stages(timer.stages)
+    finally:
+        # читатель закрывается, пока файл загрузки еще открыт (и при обрыве соединения)
+        chunks.close()
+
+
+@app.post("/predict/upload")
+async def predict_property_price_upload(file: UploadFile = File(...), format: str = 'ndjson',
+                                        chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Потоковая оценка CSV/Parquet с колонками PropertyInput: ответ NDJSON или CSV по мере готовности кусков
+    """
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown format {format}, expected one of {list(MEDIA_TYPES)}")
+    if not 1 <= chunk_size <= MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"chunk_size must be between 1 and {MAX_BATCH_SIZE}")
+    if registry.active is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+
+    chunks = read_chunks(file.file, file.filename or '', chunk_size)
+    try:
+        # первый кусок до начала ответа: нечитаемый файл или нет колонок — обычная ошибка 4xx
+        first = await run_in_threadpool(next, chunks, None)
+    except Exception as e:
+        metrics.count_error(e)
+        raise HTTPException(status_code=400, detail=f"Cannot read file: {str(e)}")
+    if first is not None:
+        missing = missing_columns(first)
+        if missing:
+            chunks.close()
+            raise HTTPException(status_code=422, detail=f"Missing columns: {', '.join(missing)}")
+
+    return StreamingResponse(stream_upload(first, chunks, format), media_type=MEDIA_TYPES[format])
+
+
+@app.post("/admin/comparables/reload")
+async def reload_comparables():
+    """Принудительная перезагрузка таблицы аналогов"""
+    reloaded = comparables.reload(force=True)
+    snapshot = comparables.snapshot
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="Comparables not loaded")
+    return {
+        "reloaded": reloaded,
+        "version": snapshot.version,
+        "rows": len(snapshot)
+    }
+
+def activate_model_version(version):
+    try:
+        registry.activate(version)
+    except Exception as e:
+        print(f"Error activating model version {version}: {e}")
+
+
+@app.get("/admin/models")
+async def list_models():
+    """Версии в реестре, активная и предыдущая модель"""
+    return {
+        "versions": registry.list_versions(),
+        "active": registry.active.describe() if registry.active is not None else None,
+        "previous": registry.previous.version if registry.previous is not None else None,
+        "loading": registry.loading
+    }
+
+
+@app.post("/admin/models/{version}/activate", status_code=202)
+async def activate_model(version: str, background_tasks: BackgroundTasks):
+    """Фоновая загрузка, прогрев и подмена модели без остановки запросов"""
+    if version not in registry.list_versions():
+        raise HTTPException(status_code=404, detail=f"Model version {version} not found")
+    registry.loading[version] = 'queued'
+    background_tasks.add_task(activate_model_version, version)
+    return {"version": version, "status": "queued"}
+
+
+@app.get("/admin/models/cities")
+async def list_city_models():
+    """Модели городов: доступные версии, загруженные модели, память, загрузки и попадания"""
+    return router.stats()
+
+
+@app.post("/admin/models/cities/reload")
+async def reload_city_models():
+    """Перечитать каталог моделей городов; новые версии загрузятся при следующем запросе"""
+    return {"reloaded": router.refresh(), "available": router.stats()['available']}
+
+
+@app.post("/admin/models/rollback")
+async def rollback_model():
+    """Возврат к предыдущей активной версии"""
+    try:
+        entry = registry.rollback()
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"version": entry.version, "status": "active"}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Метрики в текстовом формате Prometheus"""
+    entry = registry.active
+    snapshot = comparables.snapshot
+    resident, virtual = process_memory()
+    cache = prediction_cache.stats()
+    explanations = explanation_cache.stats()
+    routing = router.stats()
+    models = sorted(routing['models'].items())
+    gauges = [
+        ("model_loaded", "1 if a model is active", [({}, int(entry is not None))]),
+        ("model_info", "Active model version",
+         [({"version": entry.version, "runtime": entry.runtime}, 1)] if entry is not None else []),
+        ("comparables_rows", "Rows in the comparables snapshot", [({}, len(snapshot) if snapshot is not None else 0)]),
+        ("scheduler_queue_depth", "Requests waiting for the inference pool", [({}, scheduler.queue_depth)]),
+        ("prediction_cache_size", "Entries in the prediction cache", [({}, cache['size'])]),
+        ("prediction_cache_hits", "Prediction cache hits since start", [({}, cache['hits'])]),
+        ("prediction_cache_misses", "Prediction cache misses since start", [({}, cache['misses'])]),
+        ("explanation_cache_size", "Entries in the explanation cache", [({}, explanations['size'])]),
+        ("explanation_cache_hits", "Explanation cache hits since start", [({}, explanations['hits'])]),
+        ("explanation_cache_misses", "Explanation cache misses since start", [({}, explanations['misses'])]),
+        ("explain_queue_depth", "Requests waiting for explanations", [({}, explain_scheduler.queue_depth)]),
+        ("city_models_loaded", "City models held in memory", [({}, len(routing['loaded']))]),
+        ("city_models_memory_bytes", "Artifact size of loaded city models", [({}, routing['memory_used_bytes'])]),
+        ("city_models_memory_budget_bytes", "Memory budget for city models", [({}, routing['memory_budget_bytes'])]),
+        ("model_route_hits", "Rows routed to the model since start",
+         [({"model": name}, stats['hits']) for name, stats in models]),
+        ("model_loads", "City model loads since start",
+         [({"model": name}, stats['loads']) for name, stats in models]),
+        ("model_load_errors", "Failed city model loads since start",
+         [({"model": name}, stats['load_errors']) for name, stats in models]),
+        ("model_load_seconds", "Duration of the last city model load",
+         [({"model": name}, stats['load_seconds']) for name, stats in models]),
+        ("model_evictions", "City model evictions since start",
+         [({"model": name}, stats['evictions']) for name, stats in models]),
+        ("process_resident_memory_bytes", "Resident memory size in bytes", [({}, resident)]),
+        ("process_virtual_memory_bytes", "Virtual memory size in bytes", [({}, virtual)]),
+    ]
+    return Response(content=metrics.render(gauges), media_type=CONTENT_TYPE)
+
+
 @app.get("/health")
 async def health_check():
     """Проверка статуса API"""
+    snapshot = comparables.snapshot
+    routing = router.stats()
     return {
         "status": "healthy",
-        "model_loaded": model is not None,
-        "timestamp": pd.Timestamp.now().isoformat()
+        "model_loaded": registry.active is not None,
+        "model_version": registry.active.version if registry.active is not None else None,
+        "comparables_version": snapshot.version if snapshot is not None else None,
+        "comparables_rows": len(snapshot) if snapshot is not None else 0,
+        "scheduler": scheduler.stats(),
+        "cache": prediction_cache.stats(),
+        "explain_scheduler": explain_scheduler.stats(),
+        "explanation_cache": explanation_cache.stats(),
+        "city_models": {
+            "available": len(routing['available']),
+            "loaded": [entry['version'] for entry in routing['loaded']],
+            "memory_used_bytes": routing['memory_used_bytes'],
+        },
+        "timestamp": datetime.now().isoformat()
     }
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize_count(value):
+    """'студия'/'нет' -> 0, числа в строке -> int, остальное как есть"""
+    value = value.strip()
+    if value in ('студия', 'нет'):
+        return 0
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def canonical_key(item):
+    """Стабильный хэш валидированного PropertyInput"""
+    data = item.dict()
+    data['rooms'] = _normalize_count(data['rooms'])
+    data['passenger_lift'] = _normalize_count(data['passenger_lift'])
+    data['cargo_lift'] = _normalize_count(data['cargo_lift'])
+    data['total_area'] = float(data['total_area'])
+    data['kitchen_area'] = float(data['kitchen_area'])
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class PredictionCache:
+    """LRU-кэш результатов с TTL, сбрасывается при смене версии модели или аналогов"""
+
+    def __init__(self, max_size=10000, ttl=600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._data:
+                self.invalidations += 1
+            self._data.clear()
+            self._version = version
+
+    def get(self, key, version):
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            self._check_version(version)
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, version):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            # запрос начался до смены версии: его результат устарел, а записи новой версии трогать нельзя
+            if version != self._version:
+                self.stale_puts += 1
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'stale_puts': self.stale_puts,
+            }
@@ -0,0 +1,337 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # без scipy поиск идет перебором внутри блоков
+    cKDTree = None
+
+
+NUMERIC_COLUMNS = ['rooms', 'total_area', 'kitchen_area', 'floor']
+CATEGORICAL_COLUMNS = ['renovation', 'house_type', 'city']
+SEARCH_COLUMNS = NUMERIC_COLUMNS + CATEGORICAL_COLUMNS
+
+DEFAULT_K = 3
+# блоки меньше этого перебираются напрямую, дерево для них дороже перебора
+MIN_TREE_ROWS = 256
+# сколько лишних кандидатов берется из дерева, чтобы проверить границу top-k
+CANDIDATE_SLACK = 8
+# предел ячеек матрицы расстояний при полном переборе (~64 МБ float32)
+MAX_MATRIX_CELLS = 16_000_000
+
+
+def top_k(distances, k):
+    """Первые k индексов как у argsort(kind='stable'), но через argpartition
+
+    Равные расстояния на границе упорядочиваются по индексу.
+    """
+    if k >= len(distances):
+        return np.argsort(distances, kind='stable')[:k]
+    part = np.argpartition(distances, k - 1)[:k]
+    threshold = distances[part].max()
+    if np.isnan(threshold):
+        return np.argsort(distances, kind='stable')[:k]
+    candidates = np.flatnonzero(distances <= threshold)
+    order = np.lexsort((candidates, distances[candidates]))
+    return candidates[order[:k]]
+
+
+def _gather(values, rows):
+    """Столбец снимка для полной матрицы (n_rows, 1) или для кандидатов rows"""
+    return values[:, None] if rows is None else values[rows]
+
+
+class ComparablesSnapshot:
+    """Неизменяемый снимок таблицы аналогов, подготовленный для поиска по Gower
+
+    Индекс: строки группируются в блоки по точному совпадению city/house_type/renovation,
+    внутри крупного блока — KD-дерево (L1) по числовым признакам, нормированным
+    на диапазон столбца. У строки из чужого блока категориальная часть Gower не
+    меньше 1, поэтому top-k своего блока точен, пока его k-е числовое расстояние < 1;
+    иначе (и для запросов вне диапазона данных) запрос считается полным перебором.
+    """
+
+    def __init__(self, path, version, numeric, codes, categories, links, prices, rooms, total_area):
+        self.path = path
+        self.version = version
+        self.loaded_at = datetime.now().isoformat()
+        # numeric: (n_features, n_rows) float32, каждая строка непрерывна в памяти
+        self.numeric = numeric
+        self.codes = codes
+        self.categories = categories
+        self.category_codes = {col: {value: code for code, value in enumerate(index)}
+                               for col, index in categories.items()}
+        self.links = links
+        self.prices = prices
+        self.rooms = rooms
+        self.total_area = total_area
+        self.num_min = np.nanmin(numeric, axis=1)
+        self.num_max = np.nanmax(numeric, axis=1)
+        col_range = (self.num_max - self.num_min).astype(np.float64)
+        self.scale = np.where(col_range > 0, col_range, 1.0)
+        self.blocks = None
+
+    def __len__(self):
+        return len(self.links)
+
+    @classmethod
+    def from_csv(cls, path, index=True):
+        # pandas нужен только при загрузке снимка, поиск идет по массивам NumPy
+        import pandas as pd
+
+        with open(path, 'rb') as f:
+            raw = f.read()
+        version = hashlib.sha1(raw).hexdigest()[:12]
+
+        df = pd.read_csv(io.BytesIO(raw), usecols=SEARCH_COLUMNS + ['link', 'price'])
+
+        numeric = np.ascontiguousarray(df[NUMERIC_COLUMNS].to_numpy(dtype=np.float32).T)
+
+        codes = {}
+        categories = {}
+        for col in CATEGORICAL_COLUMNS:
+            cat = pd.Categorical(df[col])
+            codes[col] = np.ascontiguousarray(cat.codes)
+            categories[col] = pd.Index(cat.categories)
+
+        snapshot = cls(
+            path=path,
+            version=version,
+            numeric=numeric,
+            codes=codes,
+            categories=categories,
+            links=df['link'].to_numpy(dtype=object),
+            prices=df['price'].to_numpy(dtype=np.float64),
+            rooms=df['rooms'].to_numpy(dtype=np.int64),
+            total_area=df['total_area'].to_numpy(dtype=np.float64),
+        )
+        if index:
+            snapshot.build_index()
+        return snapshot
+
+    def _block_keys(self, codes):
+        """Один int64-ключ на сочетание кодов CATEGORICAL_COLUMNS; -1, если кода нет"""
+        key = np.zeros(len(codes[CATEGORICAL_COLUMNS[0]]), dtype=np.int64)
+        valid = np.ones(len(key), dtype=bool)
+        for col in CATEGORICAL_COLUMNS:
+            valid &= codes[col] >= 0
+            key = key * (len(self.categories[col]) + 1) + codes[col]
+        return np.where(valid, key, -1)
+
+    def build_index(self):
+        """Блоки по категориальным признакам и KD-деревья по числовым"""
+        keys = self._block_keys(self.codes)
+        keys[np.isnan(self.numeric).any(axis=0)] = -1
+        rows = np.flatnonzero(keys >= 0)
+        rows = rows[np.argsort(keys[rows], kind='stable')]
+        block_keys, starts = np.unique(keys[rows], return_index=True)
+
+        scaled = self.numeric.T.astype(np.float64) / self.scale
+        self.blocks = {}
+        for key, block_rows in zip(block_keys, np.split(rows, starts[1:])):
+            tree = None
+            if cKDTree is not None and len(block_rows) >= MIN_TREE_ROWS:
+                tree = cKDTree(scaled[block_rows])
+            self.blocks[int(key)] = (block_rows, tree)
+
+    def _query_codes(self, query):
+        # словарь вместо Index.get_indexer: на пакетах из пары строк тот тратит сотни микросекунд
+        return {
+            col: np.fromiter((self.category_codes[col].get(value, -1) for value in query[col]),
+                             dtype=np.int64, count=len(query[col]))
+            for col in CATEGORICAL_COLUMNS
+        }
+
+    def distances(self, query, rows=None):
+        """Матрица расстояний Gower (n_rows, n_queries) между снимком и запросами
+
+        query — DataFrame или словарь колонка -> массив значений.
+        rows — (n_queries, m) индексы кандидатов: тогда результат (n_queries, m)
+        с теми же значениями float32, что и в полной матрице.
+        """
+        q_num = np.column_stack([np.asarray(query[col], dtype=np.float32) for col in NUMERIC_COLUMNS])
+        return self._distances(q_num, self._query_codes(query), rows)
+
+    def _distances(self, q_num, q_codes, rows=None):
+        n_features = len(SEARCH_COLUMNS)
+        if rows is None:
+            out = np.zeros((len(self), len(q_num)), dtype=np.float32)
+            q_shape = (1, -1)
+        else:
+            out = np.zeros(rows.shape, dtype=np.float32)
+            q_shape = (-1, 1)
+
+        for j in range(len(NUMERIC_COLUMNS)):
+            # диапазон считается по данным и своему запросу, как gower.gower_matrix для одной строки
+            q = q_num[:, j]
+            col_range = (np.fmax(self.num_max[j], q) - np.fmin(self.num_min[j], q)).reshape(q_shape)
+            delta = np.abs(_gather(self.numeric[j], rows) - q.reshape(q_shape))
+            np.divide(delta, col_range, out=delta, where=col_range != 0)
+            out += delta
+
+        for col in CATEGORICAL_COLUMNS:
+            out += _gather(self.codes[col], rows) != q_codes[col].reshape(q_shape)
+
+        out /= n_features
+        return out
+
+    def nearest(self, query, k=DEFAULT_K, chunk_size=256, timer=None):
+        """Индексы k ближайших объектов для каждой строки запроса
+
+        timer (metrics.StageTimer) получает стадии index, distances и select.
+        """
+        columns = {col: np.asarray(query[col]) for col in SEARCH_COLUMNS}
+        n_queries = len(columns[SEARCH_COLUMNS[0]])
+        result = [None] * n_queries
+        exact = np.arange(n_queries)
+        if self.blocks is not None:
+            exact = self._nearest_indexed(columns, k, result)
+            if timer is not None:
+                timer.lap('index')
+        if len(exact):
+            self._nearest_exact(columns, exact, k, chunk_size, result, timer)
+        return result
+
+    def _nearest_indexed(self, columns, k, result):
+        """Поиск в своем блоке; возвращает позиции запросов, которым нужен полный перебор"""
+        q_num = np.column_stack([columns[col].astype(np.float64) for col in NUMERIC_COLUMNS])
+        q_num32 = q_num.astype(np.float32)
+        q_codes = self._query_codes(columns)
+        q_keys = self._block_keys(q_codes)
+        # вне диапазона данных нормировка Gower зависит от запроса — такие считаем перебором
+        in_range = ((q_num >= self.num_min) & (q_num <= self.num_max)).all(axis=1)
+        q_keys[~in_range] = -1
+        q_scaled = q_num / self.scale
+
+        exact = []
+        for key in np.unique(q_keys):
+            positions = np.flatnonzero(q_keys == key)
+            block = self.blocks.get(int(key)) if key >= 0 else None
+            if block is None or len(block[0]) < k:
+                exact.extend(positions)
+                continue
+
+            codes = {col: values[positions] for col, values in q_codes.items()}
+            top, kth = self._search_block(*block, q_scaled[positions], q_num32[positions], codes, k)
+            ok = kth < 1 - 1e-5
+            for position, row, good in zip(positions, top, ok):
+                if good:
+                    result[position] = row
+                else:
+                    exact.append(position)
+        return np.asarray(exact, dtype=np.int64)
+
+    def _search_block(self, block_rows, tree, q_scaled, q_num, q_codes, k):
+        """top-k внутри блока и k-е числовое расстояние (сумма по столбцам) для каждого запроса"""
+        top = np.empty((len(q_num), k), dtype=np.int64)
+        kth = np.empty(len(q_num))
+        pending = np.arange(len(q_num))
+        m = k + CANDIDATE_SLACK
+        while len(pending):
+            if tree is None or m >= len(block_rows):
+                candidates = np.broadcast_to(block_rows, (len(pending), len(block_rows)))
+                tree_distance = None
+            else:
+                tree_distance, idx = tree.query(q_scaled[pending], k=m, p=1)
+                candidates = block_rows[idx]
+
+            # точные значения float32 как в полной матрице, равные — по индексу строки
+            codes = {col: values[pending] for col, values in q_codes.items()}
+            distance = self._distances(q_num[pending], codes, candidates)
+            order = np.lexsort((candidates, distance), axis=-1)[:, :k]
+            found = np.take_along_axis(candidates, order, axis=-1)
+            found_kth = np.take_along_axis(distance, order[:, -1:], axis=-1)[:, 0] * float(len(SEARCH_COLUMNS))
+
+            if tree_distance is None:
+                done = np.ones(len(pending), dtype=bool)
+            else:
+                # равные или более близкие строки могли остаться за границей m — расширяем выборку
+                done = tree_distance[:, -1] > found_kth * (1 + 1e-4) + 1e-6
+            top[pending[done]] = found[done]
+            kth[pending[done]] = found_kth[done]
+            pending = pending[~done]
+            m *= 4
+        return top, kth
+
+    def _nearest_exact(self, columns, positions, k, chunk_size, result, timer):
+        """Полный перебор Gower и top-k через argpartition"""
+        # пакет режется на части, чтобы матрица расстояний не росла с размером пакета
+        chunk_size = max(1, min(chunk_size, MAX_MATRIX_CELLS // max(len(self), 1)))
+        for start in range(0, len(positions), chunk_size):
+            chunk_positions = positions[start:start + chunk_size]
+            chunk = {col: values[chunk_positions] for col, values in columns.items()}
+            distance_matrix = self.distances(chunk)
+            if timer is not None:
+                timer.lap('distances')
+            for i, position in enumerate(chunk_positions):
+                result[position] = top_k(distance_matrix[:, i], k)
+            if timer is not None:
+                timer.lap('select')
+
+    def listings(self, indices):
+        return [
+            {
+                'link': self.links[i],
+                'price': self.prices[i],
+                'rooms': int(self.rooms[i]),
+                'total_area': self.total_area[i],
+            }
+            for i in indices
+        ]
+
+
+class ComparablesStore:
+    """Держит актуальный снимок аналогов и атомарно подменяет его при изменении файла"""
+
+    def __init__(self, path, check_interval=5.0, index=True):
+        self.path = path
+        self.check_interval = check_interval
+        self.index = index
+        self._snapshot = None
+        self._stat = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def get(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+        return self._snapshot
+
+    def reload(self, force=False):
+        """Перечитывает файл, если он изменился; возвращает True при подмене снимка"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                st = os.stat(self.path)
+            except OSError as e:
+                print(f"Error reading comparables: {e}")
+                return False
+
+            stat = (st.st_mtime_ns, st.st_size)
+            if not force and stat == self._stat:
+                return False
+
+            try:
+                snapshot = ComparablesSnapshot.from_csv(self.path, index=self.index)
+            except Exception as e:
+                print(f"Error loading comparables: {e}")
+                return False
+
+            self._stat = stat
+            if self._snapshot is not None and snapshot.version == self._snapshot.version:
+                return False
+
+            self._snapshot = snapshot
+            print(f"Comparables loaded: version {snapshot.version}, {len(snapshot)} rows")
+            return True
@@ -0,0 +1,236 @@
+from bisect import bisect_left
+
+import numpy as np
+
+
+FEATURE_COLUMNS = ['rooms', 'total_area', 'kitchen_area', 'floor',
+       'renovation', 'house_type', 'passenger_lift', 'cargo_lift', 'parking',
+       'city', 'floors_total', 'smart_floor_ratio', 'house_age',
+       'city_specific_age_group', 'age_city_premium', 'is_spb_historical']
+
+FEATURE_INDEX = {col: i for i, col in enumerate(FEATURE_COLUMNS)}
+
+CURRENT_YEAR = 2026
+
+# Единые определения признаков для ETL (etl/build_dataset.py) и сервинга.
+# Совпадают с тем, на чем обучена модель (ready_to_train.csv из EDA.ipynb).
+
+# Границы возраста (age <= граница) и значения для каждого интервала
+AGE_GROUPS = {
+    'Питер': ([5, 20, 60, 100], ['спб_новостройка', 'спб_современная', 'спб_советская',
+                                 'спб_дореволюционная', 'спб_историческая']),
+    'Москва': ([5, 20, 60, 100], ['мск_новостройка', 'мск_современная', 'мск_советская',
+                                  'мск_старая', 'мск_историческая']),
+}
+DEFAULT_AGE_GROUPS = ([5, 20, 60], ['др_новостройка', 'др_современная', 'др_советская', 'др_старая'])
+
+AGE_PREMIUMS = {
+    'Питер': ([5, 80, 100], [1.5, 1.0, 1.1, 1.2]),
+    'Москва': ([5, 80], [1.6, 1.0, 1.1]),
+}
+DEFAULT_AGE_PREMIUMS = ([5, 50], [1.3, 1.0, 0.9])
+
+SPB_HISTORICAL_AGE = 100
+
+# Дома старше HISTORICAL_AGE получают средний возраст по городу (после расчета
+# групп и премий). Значения по умолчанию — из манифеста текущего ready_to_train.csv
+HISTORICAL_AGE = 100
+HISTORICAL_AGE_FILL = {
+    'Москва': 37.8481449525453,
+    'Питер': 38.57225433526011,
+    'Казань': 28.808596918085968,
+    'Нижний': 35.35300668151448,
+    'Новосиб': 25.02188328912467,
+    'ЕКБ': 28.13687707641196,
+}
+
+
+def _lookup(table, age):
+    bounds, values = table
+    return values[bisect_left(bounds, age)]
+
+
+def _smart_floor(floor, total_floors):
+    if total_floors == 1:
+        return 0.5
+    relative = floor / total_floors
+
+    if total_floors <= 5:  # хрущевки и малоэтажки
+        if floor == 1:
+            return relative * 0.7
+        elif floor == total_floors:
+            return relative * 1.1
+        return relative
+
+    if floor == 1:
+        return relative * 0.6
+    elif floor == total_floors:
+        return relative * 1.4
+    elif floor >= total_floors - 2:
+        return relative * 1.2
+    return relative
+
+
+def _house_age(city, age, historical_age_fill=None):
+    if age > HISTORICAL_AGE:
+        fill = (historical_age_fill or HISTORICAL_AGE_FILL).get(city)
+        if fill is not None:
+            return fill
+    return age
+
+
+def encode_property(item, historical_age_fill=None):
+    """Строка признаков в порядке FEATURE_COLUMNS для PropertyInput без pandas"""
+    city = item.city
+    age = CURRENT_YEAR - item.build_year
+    rooms = item.rooms
+    passenger_lift = item.passenger_lift
+    cargo_lift = item.cargo_lift
+
+    return [
+        int(0 if rooms == 'студия' else rooms),
+        item.total_area,
+        item.kitchen_area,
+        item.floor,
+        item.renovation,
+        item.house_type,
+        int(0 if passenger_lift == 'нет' else passenger_lift),
+        int(0 if cargo_lift == 'нет' else cargo_lift),
+        item.parking,
+        city,
+        item.floors_total,
+        _smart_floor(item.floor, item.floors_total),
+        _house_age(city, age, historical_age_fill),
+        _lookup(AGE_GROUPS.get(city, DEFAULT_AGE_GROUPS), age),
+        _lookup(AGE_PREMIUMS.get(city, DEFAULT_AGE_PREMIUMS), age),
+        int(city == 'Питер' and age > SPB_HISTORICAL_AGE and bool(item.house_type)),
+    ]
+
+
+def encode_properties(items, historical_age_fill=None):
+    return [encode_property(item, historical_age_fill) for item in items]
+
+
+def _lookup_column(cities, ages, tables, default):
+    """Векторный _lookup: searchsorted по границам своего города"""
+    result = np.empty(len(ages), dtype=object if isinstance(default[1][0], str) else float)
+    other = np.ones(len(ages), dtype=bool)
+    for city, (bounds, values) in tables.items():
+        mask = cities == city
+        other &= ~mask
+        result[mask] = np.asarray(values)[np.searchsorted(bounds, ages[mask], side='left')]
+    bounds, values = default
+    result[other] = np.asarray(values)[np.searchsorted(bounds, ages[other], side='left')]
+    return result
+
+
+def add_features(df, historical_age_fill=None):
+    """Инженерные признаки для DataFrame с build_year, без apply по строкам
+
+    Ожидает числовые rooms/лифты, floor, floors_total, city, house_type.
+    Возвращает копию с smart_floor_ratio, house_age, city_specific_age_group,
+    age_city_premium и is_spb_historical; build_year удаляется.
+    """
+    df = df.copy()
+    floor = df['floor'].to_numpy(dtype=float)
+    total = df['floors_total'].to_numpy(dtype=float)
+    city = df['city'].to_numpy(dtype=object)
+    age = (CURRENT_YEAR - df['build_year']).to_numpy(dtype=float)
+
+    relative = floor / total
+    low = total <= 5
+    df['smart_floor_ratio'] = np.select(
+        [total == 1,
+         low & (floor == 1), low & (floor == total),
+         ~low & (floor == 1), ~low & (floor == total), ~low & (floor >= total - 2)],
+        [0.5, relative * 0.7, relative * 1.1, relative * 0.6, relative * 1.4, relative * 1.2],
+        relative
+    )
+
+    df['city_specific_age_group'] = _lookup_column(city, age, AGE_GROUPS, DEFAULT_AGE_GROUPS)
+    df['age_city_premium'] = _lookup_column(city, age, AGE_PREMIUMS, DEFAULT_AGE_PREMIUMS)
+    df['is_spb_historical'] = ((city == 'Питер') & (age > SPB_HISTORICAL_AGE)
+                               & df['house_type'].fillna('').astype(bool).to_numpy()).astype(int)
+
+    fill = df['city'].map(historical_age_fill or HISTORICAL_AGE_FILL).to_numpy(dtype=float)
+    replace = (age > HISTORICAL_AGE) & ~np.isnan(fill)
+    df['house_age'] = np.where(replace, fill, age)
+
+    return df.drop('build_year', axis=1)
+
+
+def _mismatching_columns(expected, actual, exact):
+    """Столбцы, где признаки расходятся: побайтно (exact) или с точностью CSV"""
+    columns = []
+    for col in FEATURE_COLUMNS:
+        left = expected[col].to_numpy()
+        right = actual[col].to_numpy()
+        if left.dtype.kind in 'iufb' and exact:
+            same = left.astype(np.float64).tobytes() == right.astype(np.float64).tobytes()
+        elif left.dtype.kind in 'iufb':
+            # датасет прошел через CSV: последние знаки float могут отличаться
+            same = np.allclose(left.astype(np.float64), right.astype(np.float64), rtol=0, atol=1e-6)
+        else:
+            same = (left.astype(str) == right.astype(str)).all()
+        if not same:
+            columns.append(col)
+    return columns
+
+
+def check_parity(path, historical_age_fill=None):
+    """Сверяет encode_property с transform_inf и оба — с признаками обучающего датасета
+
+    encode_property и transform_inf получают один и тот же historical_age_fill
+    и должны совпадать побайтно. С датасетом сравнение с допуском 1e-6: он
+    прочитан из CSV. build_year восстанавливается как CURRENT_YEAR - house_age;
+    для домов, возраст которых заменен средним по городу, берется любой
+    возраст старше HISTORICAL_AGE.
+    """
+    import pandas as pd
+    from real_estate_predictor.backend.app import transform_inf
+    from real_estate_predictor.backend.schema import PropertyInput
+
+    df = pd.read_csv(path)
+    capped = df['house_age'] != df['house_age'].round()
+    build_year = np.where(capped, CURRENT_YEAR - HISTORICAL_AGE - 1, CURRENT_YEAR - df['house_age'])
+    inputs = [
+        PropertyInput(
+            total_area=row.total_area,
+            kitchen_area=row.kitchen_area,
+            floor=row.floor,
+            floors_total=row.floors_total,
+            rooms='студия' if row.rooms == 0 else str(row.rooms),
+            renovation=row.renovation,
+            house_type=row.house_type,
+            city=row.city,
+            passenger_lift='нет' if row.passenger_lift == 0 else str(row.passenger_lift),
+            cargo_lift='нет' if row.cargo_lift == 0 else str(row.cargo_lift),
+            parking=row.parking,
+            build_year=int(year),
+        )
+        for row, year in zip(df.itertuples(index=False), build_year)
+    ]
+
+    encoded = pd.DataFrame(encode_properties(inputs, historical_age_fill), columns=FEATURE_COLUMNS)
+    transformed = transform_inf(pd.DataFrame([item.dict() for item in inputs]), historical_age_fill)
+    checks = [
+        ('encode_property vs transform_inf', transformed, encoded, True),
+        ('dataset vs encode_property', df[FEATURE_COLUMNS], encoded, False),
+        ('dataset vs transform_inf', df[FEATURE_COLUMNS], transformed, False),
+    ]
+
+    mismatches = 0
+    for name, expected, actual, exact in checks:
+        for col in _mismatching_columns(expected, actual, exact):
+            mismatches += 1
+            print(f"{name}: mismatch in column {col}")
+
+    print(f"Checked {len(inputs)} rows, {mismatches} mismatching columns")
+    return mismatches == 0
+
+
+if __name__ == '__main__':
+    import sys
+
+    ok = check_parity(sys.argv[1] if len(sys.argv) > 1 else 'real_estate_predictor/EDA&model_train/ready_to_train.csv')
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,32 @@
+import gc
+import os
+
+
+# gunicorn -c gunicorn.conf.py app:app — несколько воркеров uvicorn в одном контейнере
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+timeout = int(os.getenv('WORKER_TIMEOUT', '60'))
+keepalive = 5
+
+# app импортируется один раз в мастере: модель, снимок аналогов и его индекс загружаются
+# до fork, и воркеры делят эти страницы copy-on-write вместо своих копий
+preload_app = os.getenv('PRELOAD_APP', '1') != '0'
+
+if preload_app:
+    # рецепт из документации gc.freeze: без сборок в мастере в страницах загруженных
+    # объектов не появляется освобожденных дыр, которые потом заполнят воркеры
+    gc.disable()
+
+
+def when_ready(server):
+    if preload_app:
+        # объекты мастера уходят в постоянное поколение: сборщик мусора в воркерах
+        # не пишет в их заголовки и не копирует страницы
+        gc.freeze()
+        print(f"Preloaded app shared with {workers} workers: {gc.get_freeze_count()} objects frozen")
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
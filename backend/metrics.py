@@ -0,0 +1,209 @@
+import os
+import resource
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+
+# границы в секундах: стадии кодирования укладываются в десятки микросекунд,
+# поиск аналогов по большой таблице — в секунды
+DURATION_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# тайминги текущего HTTP-запроса для заголовка Server-Timing
+_request_timings = ContextVar('request_timings', default=None)
+
+
+class StageTimer:
+    """Последовательные замеры стадий: lap(name) закрывает стадию, начатую предыдущим lap
+
+    Повторный lap с тем же именем суммируется (поиск аналогов идет кусками).
+    """
+
+    __slots__ = ('stages', '_last')
+
+    def __init__(self):
+        self.stages = {}
+        self._last = perf_counter()
+
+    def lap(self, name):
+        now = perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def skip(self):
+        """Начинает следующую стадию с текущего момента, не засчитывая прошедшее время"""
+        self._last = perf_counter()
+
+
+class Histogram:
+    """Гистограмма Prometheus: счетчики по границам (le), сумма и количество"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def process_memory():
+    """Резидентная и виртуальная память процесса в байтах"""
+    try:
+        with open('/proc/self/statm') as f:
+            size, resident = f.read().split()[:2]
+        page = os.sysconf('SC_PAGE_SIZE')
+        return int(resident) * page, int(size) * page
+    except (OSError, ValueError):
+        # не Linux: только пиковый RSS (ru_maxrss в килобайтах)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, None
+
+
+class Metrics:
+    """Счетчики и гистограммы сервиса в памяти процесса, выдача в текстовом формате Prometheus
+
+    Наблюдения — одна блокировка и bisect по границам, без аллокаций на горячем пути.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = list(buckets)
+        self._lock = threading.Lock()
+        self.stage_seconds = {}
+        self.request_seconds = {}
+        self.requests = {}
+        self.errors = {}
+
+    def _observe(self, histograms, key, value):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def observe_stages(self, stages):
+        with self._lock:
+            for stage, seconds in stages.items():
+                self._observe(self.stage_seconds, stage, seconds)
+
+    def observe_request(self, method, handler, status, seconds):
+        with self._lock:
+            self._observe(self.request_seconds, handler, seconds)
+            key = (method, handler, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def count_error(self, error, count=1):
+        name = error if isinstance(error, str) else type(error).__name__
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + count
+
+    def _render_histograms(self, lines, name, label, histograms):
+        for key, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels((label, "le"), (key, bound))} {cumulative}')
+            lines.append(f'{name}_sum{_labels((label,), (key,))} {histogram.sum!r}')
+            lines.append(f'{name}_count{_labels((label,), (key,))} {histogram.count}')
+
+    def render(self, gauges=()):
+        """Текст для /metrics; gauges — (имя, описание, [(labels dict, значение)])"""
+        lines = []
+        with self._lock:
+            lines += ['# HELP predict_stage_duration_seconds Duration of prediction pipeline stages per batch',
+                      '# TYPE predict_stage_duration_seconds histogram']
+            self._render_histograms(lines, 'predict_stage_duration_seconds', 'stage', self.stage_seconds)
+
+            lines += ['# HELP http_request_duration_seconds HTTP request latency',
+                      '# TYPE http_request_duration_seconds histogram']
+            self._render_histograms(lines, 'http_request_duration_seconds', 'handler', self.request_seconds)
+
+            lines += ['# HELP http_requests_total HTTP requests by method, handler and status',
+                      '# TYPE http_requests_total counter']
+            for key, count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{_labels(("method", "handler", "status"), key)} {count}')
+
+            lines += ['# HELP errors_total Errors by exception type',
+                      '# TYPE errors_total counter']
+            for name, count in sorted(self.errors.items()):
+                lines.append(f'errors_total{_labels(("type",), (name,))} {count}')
+
+        for name, description, samples in gauges:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} gauge']
+            for labels, value in samples:
+                if value is not None:
+                    lines.append(f'{name}{_labels(tuple(labels), tuple(labels.values()))} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def record_timings(stages):
+    """Добавляет стадии (секунды) в Server-Timing текущего запроса"""
+    timings = _request_timings.get()
+    if timings is not None and stages:
+        for stage, seconds in stages.items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def server_timing(timings):
+    return ', '.join(f'{stage};dur={seconds * 1000:.3f}' for stage, seconds in timings.items())
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: время и статус каждого запроса, заголовок Server-Timing
+
+    Чистый ASGI без BaseHTTPMiddleware, чтобы не добавлять задач и копий тела.
+    Необработанные исключения считаются по типу и пробрасываются дальше.
+    """
+
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+        timings = {}
+        token = _request_timings.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                timings['total'] = perf_counter() - started
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', server_timing(timings).encode('latin-1')))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except Exception as e:
+            self.metrics.count_error(e)
+            raise
+        finally:
+            _request_timings.reset(token)
+            route = scope.get('route')
+            handler = getattr(route, 'path', None) or 'unmatched'
+            self.metrics.observe_request(scope['method'], handler, str(status), perf_counter() - started)
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+from real_estate_predictor.backend.explain import ShapExplainer
+from real_estate_predictor.backend.feature_encoder import FEATURE_COLUMNS, encode_property
+from real_estate_predictor.backend.schema import PropertyInput
+from real_estate_predictor.backend.tree_model import TREES_SUFFIX, ObliviousTrees
+
+
+MODEL_FILE = 'model.pkl'
+TREES_FILE = 'model' + TREES_SUFFIX
+METADATA_FILE = 'metadata.json'
+# хеши объявлений, на которых версия обучалась и проверялась (train, holdout): для дообучения
+LISTINGS_FILE = 'listings.npz'
+
+# trees — выгруженные деревья на NumPy (model.trees), если они есть; catboost — pickle
+RUNTIMES = ('trees', 'catboost')
+
+WARMUP_INPUT = PropertyInput(
+    total_area=65.5,
+    kitchen_area=12.0,
+    floor=5,
+    floors_total=9,
+    rooms='2',
+    renovation='евро',
+    house_type='панельный',
+    city='Москва',
+    passenger_lift='1',
+    cargo_lift='нет',
+    parking='открытая во дворе',
+    build_year=2008,
+)
+
+
+def read_catboost_metrics(train_dir):
+    """Метрики последней итерации из catboost_training.json"""
+    path = os.path.join(train_dir, 'catboost_training.json')
+    try:
+        with open(path, encoding='utf-8') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    meta = info.get('meta', {})
+    iterations = info.get('iterations', [])
+    if not iterations:
+        return {}
+
+    last = iterations[-1]
+    metrics = {'iterations': last.get('iteration', len(iterations) - 1) + 1}
+    for key, names in (('learn', meta.get('learn_metrics', [])), ('test', meta.get('test_metrics', []))):
+        values = last.get(key)
+        if not values:
+            continue
+        for name, value in zip((m['name'] for m in names), values):
+            metrics[f'{key}_{name}'] = value
+    return metrics
+
+
+class ModelEntry:
+    """Загруженная модель вместе с версией и метаданными
+
+    explain_path — model.pkl для объяснений; None, если они выключены.
+    Объяснитель (ShapExplainer) строится при первом обращении к explainer,
+    а не при загрузке: /predict не платит за catboost и второй артефакт.
+    size_bytes — размер загруженных файлов, оценка памяти модели для
+    ModelRouter; растет, когда загружается pickle для объяснений.
+    """
+
+    def __init__(self, version, model, metadata, explain_path=None, size_bytes=0):
+        self.version = version
+        self.model = model
+        self.metadata = metadata
+        self.explain_path = explain_path
+        self.size_bytes = size_bytes
+        self.loaded_at = datetime.now().isoformat()
+        self.warmup_ms = None
+        self.explain_error = None
+        self._explainer = None
+        self._explainer_lock = threading.Lock()
+
+    def warm_up(self):
+        """Пробный прогноз: проверяет артефакт и прогревает модель до подмены"""
+        started = time.perf_counter()
+        self.model.predict([encode_property(WARMUP_INPUT)])
+        self.warmup_ms = (time.perf_counter() - started) * 1000
+        return self
+
+    @property
+    def can_explain(self):
+        """Объяснения включены и объяснитель еще не падал при построении; без загрузки"""
+        return self.explain_path is not None and self.explain_error is None
+
+    @property
+    def explainer(self):
+        """ShapExplainer, построенный при первом обращении; None, если объяснений нет"""
+        if self._explainer is not None or not self.can_explain:
+            return self._explainer
+        with self._explainer_lock:
+            if self._explainer is None and self.can_explain:
+                started = time.perf_counter()
+                try:
+                    model = self.model
+                    if isinstance(model, ObliviousTrees):
+                        model = joblib.load(self.explain_path)
+                        self.size_bytes += os.path.getsize(self.explain_path)
+                    self._explainer = ShapExplainer(model).warm_up([encode_property(WARMUP_INPUT)])
+                except Exception as e:
+                    self.explain_error = str(e)
+                    print(f"Error loading explainer for model {self.version}: {e}")
+                    return None
+                print(f"Explainer for model {self.version} loaded in "
+                      f"{(time.perf_counter() - started) * 1000:.0f} ms")
+        return self._explainer
+
+    @property
+    def runtime(self):
+        return 'trees' if isinstance(self.model, ObliviousTrees) else 'catboost'
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'runtime': self.runtime,
+            'loaded_at': self.loaded_at,
+            'warmup_ms': self.warmup_ms,
+            'explain': self.can_explain,
+            'explainer_loaded': self._explainer is not None,
+            'explain_error': self.explain_error,
+            'size_bytes': self.size_bytes,
+            'expected_value': self._explainer.expected_value if self._explainer is not None else None,
+            'metadata': self.metadata,
+        }
+
+
+class ModelRegistry:
+    """Каталог версий модели: models/<version>/{model.pkl, model.trees, metadata.json, listings.npz}
+
+    Активная модель подменяется атомарно; предыдущая остается для отката.
+    При runtime='trees' загружается model.trees (без catboost), иначе и при его
+    отсутствии — model.pkl. explain=True разрешает объяснения по model.pkl:
+    ShapExplainer строится при первом /explain для версии (при runtime='trees'
+    pickle загружается только тогда).
+    """
+
+    def __init__(self, root, fallback_path=None, runtime='trees', explain=False):
+        if runtime not in RUNTIMES:
+            raise ValueError(f"Unknown model runtime {runtime!r}, expected one of {RUNTIMES}")
+        self.root = root
+        self.fallback_path = fallback_path
+        self.runtime = runtime
+        self.explain = explain
+        self._active = None
+        self._previous = None
+        self._lock = threading.Lock()
+        self.loading = {}
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def previous(self):
+        return self._previous
+
+    def list_versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        versions = []
+        for name in sorted(os.listdir(self.root)):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.root, name)
+            if os.path.isfile(os.path.join(path, MODEL_FILE)) or os.path.isfile(os.path.join(path, TREES_FILE)):
+                versions.append(name)
+        return versions
+
+    def metadata(self, version):
+        path = os.path.join(self.root, version, METADATA_FILE)
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def listings(self, version):
+        """Хеши объявлений версии {'train': ..., 'holdout': ...}; None, если версия их не сохраняла"""
+        path = os.path.join(self.root, version, LISTINGS_FILE)
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    def _load_model(self, pickle_path, trees_path):
+        if self.runtime == 'trees' and os.path.isfile(trees_path):
+            return ObliviousTrees.load(trees_path)
+        return joblib.load(pickle_path)
+
+    def _explain_path(self, model, pickle_path):
+        """model.pkl для объяснений; сам объяснитель ModelEntry построит при первом /explain"""
+        if not self.explain:
+            return None
+        if isinstance(model, ObliviousTrees) and not os.path.isfile(pickle_path):
+            print(f"No {pickle_path} for explanations, /explain is disabled for this version")
+            return None
+        return pickle_path
+
+    @staticmethod
+    def _artifact_size(model, pickle_path, trees_path):
+        return os.path.getsize(trees_path if isinstance(model, ObliviousTrees) else pickle_path)
+
+    def load(self, version):
+        """Загружает и прогревает версию, не делая ее активной"""
+        path = os.path.join(self.root, version)
+        pickle_path, trees_path = os.path.join(path, MODEL_FILE), os.path.join(path, TREES_FILE)
+        if not os.path.isfile(pickle_path) and not os.path.isfile(trees_path):
+            raise FileNotFoundError(f"Model version {version} not found")
+        model = self._load_model(pickle_path, trees_path)
+        size = self._artifact_size(model, pickle_path, trees_path)
+        explain_path = self._explain_path(model, pickle_path)
+        return ModelEntry(version, model, self.metadata(version), explain_path, size).warm_up()
+
+    def load_fallback(self):
+        """Одиночный файл модели вне реестра (best_real_estate_model.pkl и .trees рядом)"""
+        trees_path = os.path.splitext(self.fallback_path)[0] + TREES_SUFFIX
+        source = self.fallback_path if os.path.isfile(self.fallback_path) else trees_path
+        with open(source, 'rb') as f:
+            version = 'legacy-' + hashlib.sha1(f.read()).hexdigest()[:12]
+        model = self._load_model(self.fallback_path, trees_path)
+        size = self._artifact_size(model, self.fallback_path, trees_path)
+        explain_path = self._explain_path(model, self.fallback_path)
+        return ModelEntry(version, model, {'path': source}, explain_path, size).warm_up()
+
+    def swap(self, entry):
+        with self._lock:
+            if self._active is not None and self._active.version != entry.version:
+                self._previous = self._active
+            self._active = entry
+        print(f"Model version {entry.version} activated")
+        return entry
+
+    def activate(self, version):
+        """Загружает версию, прогревает и атомарно делает активной"""
+        self.loading[version] = 'loading'
+        try:
+            entry = self.swap(self.load(version))
+        except Exception as e:
+            self.loading[version] = f'error: {e}'
+            raise
+        self.loading[version] = 'active'
+        return entry
+
+    def rollback(self):
+        with self._lock:
+            if self._previous is None:
+                raise LookupError("No previous model version to roll back to")
+            self._active, self._previous = self._previous, self._active
+            entry = self._active
+        print(f"Model rolled back to version {entry.version}")
+        return entry
+
+    def load_initial(self, version=None):
+        """Стартовая загрузка: заданная версия, иначе последняя в реестре, иначе fallback"""
+        versions = self.list_versions()
+        candidates = [version] if version else versions[::-1]
+        for candidate in candidates:
+            try:
+                return self.activate(candidate)
+            except Exception as e:
+                print(f"Error loading model version {candidate}: {e}")
+
+        if self.fallback_path:
+            try:
+                return self.swap(self.load_fallback())
+            except Exception as e:
+                print(f"Error loading model: {e}")
+        return None
+
+    def publish(self, model, metadata=None, version=None, train_dir=None, export_data=None, listings=None):
+        """Сохраняет новую версию артефакта в реестр и возвращает ее имя
+
+        export_data — признаки обучающей выборки: рядом с model.pkl выгружается
+        model.trees для вычисления без catboost. listings — хеши объявлений
+        {'train': ..., 'holdout': ...}, по ним дообучение находит новые объявления.
+        """
+        version = version or datetime.now().strftime('%Y%m%d-%H%M%S')
+        target = os.path.join(self.root, version)
+        if os.path.exists(target):
+            raise FileExistsError(f"Model version {version} already exists")
+
+        metadata = dict(metadata or {})
+        metadata.setdefault('version', version)
+        metadata.setdefault('training_date', datetime.now().isoformat())
+        metadata.setdefault('features', list(getattr(model, 'feature_names_', None) or FEATURE_COLUMNS))
+        if train_dir is not None:
+            metadata.setdefault('metrics', {}).update(read_catboost_metrics(train_dir))
+
+        # пишем во временный каталог и переименовываем, чтобы не увидеть полуготовую версию
+        tmp = os.path.join(self.root, f'.{version}.tmp')
+        os.makedirs(tmp, exist_ok=True)
+        try:
+            joblib.dump(model, os.path.join(tmp, MODEL_FILE))
+            if export_data is not None:
+                from real_estate_predictor.backend.tree_model import export_catboost
+                export_catboost(model, os.path.join(tmp, TREES_FILE), export_data)
+            if listings is not None:
+                np.savez(os.path.join(tmp, LISTINGS_FILE), **{name: np.unique(h) for name, h in listings.items()})
+            with open(os.path.join(tmp, METADATA_FILE), 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, ensure_ascii=False, indent=2, default=str)
+            os.rename(tmp, target)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return version
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from real_estate_predictor.backend.model_registry import ModelRegistry
+
+
+# метка глобальной модели в статистике маршрутизации
+GLOBAL_MODEL = 'global'
+
+
+class ModelRouter:
+    """Модели по городам: <root>/<город>/<version>/ — каталог версий как у ModelRegistry
+
+    Модель города загружается при первом запросе по этому городу (последняя версия
+    в каталоге) и вытесняется по LRU, когда сумма размеров загруженных моделей
+    больше memory_budget байт. Город без своей модели или с упавшей загрузкой
+    получает глобальную модель registry.active. На старте и раз в check_interval
+    секунд читается только список каталогов: новые города не добавляют ни памяти,
+    ни времени запуска.
+    """
+
+    def __init__(self, root, registry, memory_budget, runtime='trees', explain=False, check_interval=30.0):
+        self.root = root
+        self.registry = registry
+        self.memory_budget = memory_budget
+        self.runtime = runtime
+        self.explain = explain
+        self.check_interval = check_interval
+        # меняется вместе со списком моделей: входит в версию кэшей предсказаний
+        self.generation = 0
+        self._available = {}
+        self._failed = {}
+        self._loaded = OrderedDict()
+        self._stats = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _stat(self, name):
+        if name not in self._stats:
+            self._stats[name] = {
+                'hits': 0, 'loads': 0, 'load_errors': 0, 'evictions': 0,
+                'load_seconds': None, 'load_seconds_total': 0.0,
+            }
+        return self._stats[name]
+
+    def memory_used(self):
+        return sum(entry.size_bytes for entry in self._loaded.values())
+
+    def refresh(self):
+        """Перечитывает список городов и их последних версий; True, если он изменился"""
+        self._checked_at = time.monotonic()
+        available = {}
+        if os.path.isdir(self.root):
+            for city in sorted(os.listdir(self.root)):
+                if city.startswith('.'):
+                    continue
+                versions = ModelRegistry(os.path.join(self.root, city)).list_versions()
+                if versions:
+                    available[city] = versions[-1]
+
+        with self._lock:
+            if available == self._available:
+                return False
+            self._available = available
+            # модели устаревших версий выгружаются, новые загрузятся при следующем запросе
+            for city in [city for city, entry in self._loaded.items() if entry.version != f'{city}/{available.get(city)}']:
+                del self._loaded[city]
+            self._failed = {city: version for city, version in self._failed.items() if available.get(city) == version}
+            self.generation += 1
+        print(f"City models: {', '.join(f'{city}/{version}' for city, version in available.items()) or 'none'}")
+        return True
+
+    def get(self, city, rows=1):
+        """Модель для города: своя (загружается при первом обращении) или глобальная"""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+        with self._lock:
+            entry = self._loaded.get(city)
+            if entry is not None:
+                self._loaded.move_to_end(city)
+                self._stat(city)['hits'] += rows
+                return entry
+            version = self._available.get(city)
+            if version is None or self._failed.get(city) == version:
+                self._stat(GLOBAL_MODEL)['hits'] += rows
+                return self.registry.active
+        return self._load(city, version, rows)
+
+    def _load(self, city, version, rows):
+        # загрузки по одной: пиковая память — бюджет плюс одна модель
+        with self._load_lock:
+            with self._lock:
+                entry = self._loaded.get(city)
+                if entry is not None:
+                    # успел загрузить параллельный запрос
+                    self._loaded.move_to_end(city)
+                    self._stat(city)['hits'] += rows
+                    return entry
+
+            started = time.perf_counter()
+            try:
+                registry = ModelRegistry(os.path.join(self.root, city), runtime=self.runtime, explain=self.explain)
+                entry = registry.load(version)
+            except Exception as e:
+                print(f"Error loading model for {city} version {version}: {e}")
+                with self._lock:
+                    self._failed[city] = version
+                    self._stat(city)['load_errors'] += 1
+                    self._stat(GLOBAL_MODEL)['hits'] += rows
+                return self.registry.active
+            elapsed = time.perf_counter() - started
+            entry.version = f'{city}/{version}'
+
+            with self._lock:
+                stats = self._stat(city)
+                stats['loads'] += 1
+                stats['hits'] += rows
+                stats['load_seconds'] = elapsed
+                stats['load_seconds_total'] += elapsed
+                # пока шла загрузка, каталог мог смениться: такую версию не держим
+                if self._available.get(city) == version:
+                    self._loaded[city] = entry
+                    self._evict(keep=city)
+        print(f"Model for {city} version {version} loaded in {elapsed * 1000:.0f} ms ({entry.size_bytes} bytes)")
+        return entry
+
+    def _evict(self, keep):
+        """Вытесняет давно не использованные модели, пока не уложится в бюджет; keep остается всегда"""
+        used = self.memory_used()
+        for city in list(self._loaded):
+            if used <= self.memory_budget:
+                break
+            if city == keep:
+                continue
+            entry = self._loaded.pop(city)
+            used -= entry.size_bytes
+            self._stat(city)['evictions'] += 1
+            print(f"Model {entry.version} evicted, {used} of {self.memory_budget} bytes used")
+
+    def route(self, cities):
+        """Строки по моделям: [(ModelEntry или None, индексы строк)] в порядке первого появления"""
+        rows = {}
+        for i, city in enumerate(cities):
+            rows.setdefault(city, []).append(i)
+        groups = {}
+        for city, indices in rows.items():
+            entry = self.get(city, len(indices))
+            if id(entry) in groups:
+                groups[id(entry)][1].extend(indices)
+            else:
+                groups[id(entry)] = (entry, indices)
+        return list(groups.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'root': self.root,
+                'generation': self.generation,
+                'memory_budget_bytes': self.memory_budget,
+                'memory_used_bytes': self.memory_used(),
+                'available': dict(self._available),
+                'loaded': [
+                    {'version': entry.version, 'size_bytes': entry.size_bytes, 'loaded_at': entry.loaded_at}
+                    for entry in self._loaded.values()
+                ],
+                'failed': dict(self._failed),
+                'models': {name: dict(stats) for name, stats in self._stats.items()},
+            }
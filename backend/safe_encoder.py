@@ -1,69 +1,177 @@
 import pickle
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+
+
+def _exact_group_sums(codes, values, n_groups):
+    """Точные суммы values по группам codes в виде Fraction
+
+    Каждое float раскладывается на целую мантиссу и порядок, мантиссы
+    складываются без округления по (группа, порядок), так что от порядка
+    строк и разбиения на чанки результат не зависит.
+    """
+    sums = [Fraction(0)] * n_groups
+    mask = (codes >= 0) & np.isfinite(values)
+    if not mask.any():
+        return sums
+
+    mantissa, exponent = np.frexp(values[mask])
+    scaled = (mantissa * 2.0 ** 53).astype(np.int64)
+    high = scaled >> 26
+    low = scaled - (high << 26)
+
+    exp_min = int(exponent.min())
+    n_exp = int(exponent.max()) - exp_min + 1
+    key = codes[mask] * n_exp + (exponent - exp_min)
+
+    if len(key) < 2 ** 26:
+        # |high| < 2^27, |low| < 2^26: суммы меньше 2^53 и считаются в float64 без потерь
+        size = n_groups * n_exp
+        high_sums = np.bincount(key, weights=high, minlength=size)
+        low_sums = np.bincount(key, weights=low, minlength=size)
+        keys = np.flatnonzero(np.bincount(key, minlength=size))
+        parts = zip(keys, high_sums[keys], low_sums[keys])
+    else:
+        grouped = pd.DataFrame({'key': key, 'high': high, 'low': low}).groupby('key').sum()
+        parts = zip(grouped.index, grouped['high'], grouped['low'])
+
+    for k, high_sum, low_sum in parts:
+        code, exp = divmod(int(k), n_exp)
+        value = (int(high_sum) << 26) + int(low_sum)
+        shift = exp + exp_min - 53
+        sums[code] += Fraction(value << shift) if shift >= 0 else Fraction(value, 1 << -shift)
+    return sums
 
 
 class SafeCategoricalEncoder:
-    def __init__(self):
+    def __init__(self, smoothing=50):
+        self.smoothing = smoothing
         self.encoding_maps = {}
         self.fitted_columns = []
-    
+
     def fit(self, df, categorical_cols, target):
-        self.encoding_maps = {}
+        self.reset()
+        return self.partial_fit(df, categorical_cols, target).finalize()
+
+    def reset(self):
+        """Сбрасывает накопленную статистику partial_fit"""
+        self._stats = {}
+        self._target_sum = Fraction(0)
+        self._target_count = 0
+        return self
+
+    def partial_fit(self, df, categorical_cols, target):
+        """Добавляет к статистике один чанк данных, например из pd.read_csv(chunksize=...)
+
+        Хранятся только точные суммы цели, число непустых значений цели и число
+        строк по каждой категории, поэтому память не зависит от объема данных,
+        а finalize() дает тот же результат, что fit на склеенных данных.
+        """
+        if not hasattr(self, '_stats'):
+            self.reset()
         self.fitted_columns = categorical_cols
-        
+
+        y = df[target].to_numpy(dtype=float)
+        notnull = ~np.isnan(y)
+        self._target_sum += _exact_group_sums(np.zeros(len(y), dtype=np.int64), y, 1)[0]
+        self._target_count += int(notnull.sum())
+
         for col in categorical_cols:
-            n_categories = df[col].nunique()
-            
-            if n_categories <= 5:
+            # один проход по столбцу вместо nunique + трех groupby
+            codes, uniques = pd.factorize(df[col])
+            valid = codes >= 0
+            chunk = pd.DataFrame({
+                'sum': _exact_group_sums(codes, y, len(uniques)),
+                'count': np.bincount(codes[valid & notnull], minlength=len(uniques)),
+                'size': np.bincount(codes[valid], minlength=len(uniques)),
+            }, index=pd.Index(uniques))
+
+            acc = self._stats.get(col)
+            if acc is not None:
+                index = acc.index.union(chunk.index)
+                chunk = acc.reindex(index, fill_value=0) + chunk.reindex(index, fill_value=0)
+            self._stats[col] = chunk
+        return self
+
+    def finalize(self):
+        """Строит карты кодирования из накопленной статистики"""
+        self.encoding_maps = {}
+        if self._target_count:
+            global_mean = float(self._target_sum / self._target_count)
+        else:
+            global_mean = np.nan
+
+        for col in self.fitted_columns:
+            stats = self._stats[col].sort_index()
+            group_counts = stats['count'].astype('int64')
+            group_means = pd.Series(
+                [float(total / count) if count else np.nan
+                 for total, count in zip(stats['sum'], group_counts)],
+                index=stats.index
+            )
+
+            if len(stats) <= 5:
                 # Ordered Label Encoding
-                means = df.groupby(col)[target].mean().sort_values()
+                means = group_means.sort_values()
                 self.encoding_maps[col] = {
                     'type': 'ordered_label',
                     'mapping': {cat: i for i, cat in enumerate(means.index)}
                 }
             else:
                 # Bayesian Target Encoding
-                global_mean = df[target].mean()
-                group_means = df.groupby(col)[target].mean()
-                group_counts = df.groupby(col)[target].count()
-                
                 self.encoding_maps[col] = {
                     'type': 'bayesian',
                     'global_mean': global_mean,
                     'group_means': group_means.to_dict(),
-                    'group_counts': group_counts.to_dict()
+                    'group_counts': group_counts.to_dict(),
+                    'mapping': self._smooth(group_means, group_counts, global_mean).to_dict()
                 }
         return self
-    
-    def transform(self, df):
-        df_encoded = df.copy()
-        
+
+    def _smooth(self, group_means, group_counts, global_mean):
+        """Сглаженное значение категории, считается один раз при fit"""
+        smoothing = self.smoothing
+        return (group_means * group_counts + global_mean * smoothing) / (group_counts + smoothing)
+
+    def _bayesian_mapping(self, encoding_info):
+        # энкодеры, сохраненные до появления 'mapping', досчитываются при первом transform
+        if 'mapping' not in encoding_info:
+            smoothing = getattr(self, 'smoothing', 50)
+            group_counts = encoding_info['group_counts']
+            global_mean = encoding_info['global_mean']
+            encoding_info['mapping'] = {
+                cat: (mean * group_counts.get(cat, 0) + global_mean * smoothing) / (group_counts.get(cat, 0) + smoothing)
+                for cat, mean in encoding_info['group_means'].items()
+            }
+        return encoding_info['mapping']
+
+    def transform(self, df, inplace=False):
+        # столбцы заменяются целиком, поэтому поверхностной копии достаточно
+        df_encoded = df if inplace else df.copy(deep=False)
+
         for col, encoding_info in self.encoding_maps.items():
-            if col in df.columns:
+            if col in df_encoded.columns:
                 if encoding_info['type'] == 'ordered_label':
-                    df_encoded[col] = df[col].map(encoding_info['mapping'])
+                    df_encoded[col] = df_encoded[col].map(encoding_info['mapping'])
                 else:
-                    # Bayesian encoding
-                    global_mean = encoding_info['global_mean']
-                    group_means = encoding_info['group_means']
-                    group_counts = encoding_info['group_counts']
-                    
-                    def encode_value(x):
-                        if x in group_means:
-                            count = group_counts.get(x, 0)
-                            return (group_means[x] * count + global_mean * 50) / (count + 50)
-                        return global_mean
-                    
-                    df_encoded[col] = df[col].apply(encode_value)
-        
+                    # Bayesian encoding: поиск по кодам категорий, неизвестные -> глобальное среднее
+                    mapping = self._bayesian_mapping(encoding_info)
+                    codes = pd.Index(list(mapping)).get_indexer(df_encoded[col])
+                    values = np.append(np.fromiter(mapping.values(), dtype=float, count=len(mapping)),
+                                       encoding_info['global_mean'])
+                    df_encoded[col] = values[codes]
+
         return df_encoded
-    
+
     def fit_transform(self, df, categorical_cols, target):
         return self.fit(df, categorical_cols, target).transform(df)
-    
+
     def save(self, path):
         with open(path, 'wb') as f:
             pickle.dump(self, f)
-    
+
     @classmethod
     def load(cls, path):
         with open(path, 'rb') as f:
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+WAIT_MS_BUCKETS = [0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000]
+
+
+def _bucket(buckets, value):
+    for bound in buckets:
+        if value <= bound:
+            return str(bound)
+    return '+Inf'
+
+
+class MicroBatcher:
+    """Копит одиночные запросы в пакеты и считает их в ограниченном пуле потоков
+
+    handler получает список элементов и возвращает список результатов той же длины;
+    результат-исключение пробрасывается только своему вызывающему.
+    """
+
+    def __init__(self, handler, max_batch_size=64, max_wait_ms=2.0, max_workers=2):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='inference')
+
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._slots = None
+        self._in_flight = 0
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.batches_total = 0
+        self.items_total = 0
+        self.batch_size_histogram = {str(b): 0 for b in BATCH_SIZE_BUCKETS + ['+Inf']}
+        self.wait_ms_histogram = {str(b): 0 for b in WAIT_MS_BUCKETS + ['+Inf']}
+        self.wait_ms_sum = 0.0
+        self.wait_ms_max = 0.0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+        # цикл событий сменился (перезапуск, тестовый клиент) — поднимаем очередь заново
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_workers)
+        self._worker = loop.create_task(self._collect())
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, item):
+        """Ставит элемент в очередь и ждет его результат"""
+        self._ensure_started()
+        future = self._loop.create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def run(self, fn, *args):
+        """Выполняет произвольную CPU-задачу в том же пуле потоков"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            # пакет добирается, когда освободился поток: пока пул занят, очередь копится
+            await self._slots.acquire()
+            # без нагрузки окно не ждем: копить пакет имеет смысл, только пока пул занят
+            wait = self.max_wait if self._in_flight else 0.0
+            deadline = self._loop.time() + wait
+
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self._in_flight += 1
+            self._loop.create_task(self._execute(batch))
+
+    async def _execute(self, batch):
+        started = time.perf_counter()
+        self._record(batch, started)
+        items = [item for item, _, _ in batch]
+        try:
+            results = await self._loop.run_in_executor(self.executor, self.handler, items)
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _record(self, batch, started):
+        with self._stats_lock:
+            self.batches_total += 1
+            self.items_total += len(batch)
+            self.batch_size_histogram[_bucket(BATCH_SIZE_BUCKETS, len(batch))] += 1
+            for _, _, enqueued in batch:
+                wait_ms = (started - enqueued) * 1000
+                self.wait_ms_histogram[_bucket(WAIT_MS_BUCKETS, wait_ms)] += 1
+                self.wait_ms_sum += wait_ms
+                self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'queue_depth': self.queue_depth,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'workers': self.max_workers,
+                'batches_total': self.batches_total,
+                'items_total': self.items_total,
+                'batch_size_histogram': dict(self.batch_size_histogram),
+                'wait_ms_histogram': dict(self.wait_ms_histogram),
+                'wait_ms_avg': self.wait_ms_sum / self.items_total if self.items_total else 0.0,
+                'wait_ms_max': self.wait_ms_max,
+            }
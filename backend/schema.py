@@ -1,5 +1,7 @@
+import math
+
 from pydantic import BaseModel, validator
-from typing import List, Optional, Literal
+from typing import Any, List, Optional, Literal, Union, get_args, get_origin
 
 class PropertyInput(BaseModel):
     total_area: float
@@ -43,6 +45,13 @@ class PropertyInput(BaseModel):
             raise ValueError('Floor cannot be greater than total floors')
         return v
 
+# варианты Literal-полей PropertyInput
+FIELD_OPTIONS = {
+    name: list(get_args(field.annotation))
+    for name, field in PropertyInput.model_fields.items()
+    if get_origin(field.annotation) is Literal
+}
+
 class SimilarListing(BaseModel):
     link: str
     price: float
@@ -53,4 +62,97 @@ class PredictionResponse(BaseModel):
     predicted_price: float
     status: str
     message: str
-    similar_listings: List[SimilarListing]
\ No newline at end of file
+    similar_listings: List[SimilarListing]
+    model_version: Optional[str] = None
+
+class BatchPredictionItem(BaseModel):
+    index: int
+    status: str
+    message: str
+    predicted_price: Optional[float] = None
+    similar_listings: List[SimilarListing] = []
+    model_version: Optional[str] = None
+
+class BatchPredictionResponse(BaseModel):
+    results: List[BatchPredictionItem]
+
+class FeatureContribution(BaseModel):
+    feature: str
+    value: Union[float, str, None] = None
+    shap_value: float
+    contribution: float
+
+class ExplanationResponse(BaseModel):
+    predicted_price: float
+    base_price: float
+    status: str
+    message: str
+    contributions: List[FeatureContribution]
+    model_version: Optional[str] = None
+
+class BatchExplanationItem(BaseModel):
+    index: int
+    status: str
+    message: str
+    predicted_price: Optional[float] = None
+    base_price: Optional[float] = None
+    contributions: List[FeatureContribution] = []
+    model_version: Optional[str] = None
+
+class BatchExplanationResponse(BaseModel):
+    results: List[BatchExplanationItem]
+
+class SensitivityAxis(BaseModel):
+    feature: str
+    values: Optional[List[Union[int, float, str]]] = None
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    step: Optional[float] = None
+    num: Optional[int] = None
+
+    @validator('start', 'stop')
+    def validate_bounds(cls, v):
+        if v is not None and not math.isfinite(v):
+            raise ValueError('Bounds must be finite')
+        return v
+
+    @validator('step')
+    def validate_step(cls, v):
+        if v is not None and not (math.isfinite(v) and v > 0):
+            raise ValueError('Step must be positive')
+        return v
+
+    @validator('num')
+    def validate_num(cls, v):
+        if v is not None and v < 1:
+            raise ValueError('Num must be positive')
+        return v
+
+class SensitivityRequest(BaseModel):
+    base: PropertyInput
+    axes: List[SensitivityAxis]
+
+    @validator('axes')
+    def validate_axes(cls, v):
+        if not 1 <= len(v) <= 2:
+            raise ValueError('Expected one or two axes')
+        if len({axis.feature for axis in v}) != len(v):
+            raise ValueError('Axes must vary different features')
+        return v
+
+class SensitivityAxisValues(BaseModel):
+    feature: str
+    values: List[Union[int, float, str]]
+
+class SensitivityError(BaseModel):
+    index: List[int]
+    message: str
+
+class SensitivityResponse(BaseModel):
+    base_price: float
+    status: str
+    message: str
+    axes: List[SensitivityAxisValues]
+    prices: List[Any]
+    errors: List[SensitivityError] = []
+    model_version: Optional[str] = None
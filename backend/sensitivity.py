@@ -0,0 +1,97 @@
+import itertools
+import math
+
+import numpy as np
+from pydantic import ValidationError
+
+from real_estate_predictor.backend.schema import FIELD_OPTIONS, PropertyInput
+
+
+NUMERIC_FEATURES = {'total_area': float, 'kitchen_area': float, 'floor': int, 'floors_total': int, 'build_year': int}
+
+
+def _numeric_range(axis, base):
+    """(start, stop, число точек) числового диапазона; число считается без построения сетки
+
+    Если точек столько, что их число не помещается во float, возвращается inf.
+    """
+    feature = axis.feature
+    start, stop = axis.start, axis.stop
+    if feature == 'floor':
+        start = 1 if start is None else start
+        stop = base.floors_total if stop is None else stop
+    if start is None or stop is None:
+        raise ValueError(f"{feature}: start and stop are required")
+    if axis.num is not None:
+        return start, stop, axis.num
+    step = axis.step if axis.step is not None else 1
+    # допуск, чтобы stop, кратный шагу, не терялся из-за округления
+    count = np.floor((stop - start) / step + 1e-9) + 1
+    return start, stop, int(count) if np.isfinite(count) else math.inf
+
+
+def axis_size(axis, base):
+    """Число точек оси до дедупликации: проверяется до того, как строится сетка"""
+    feature = axis.feature
+    if feature not in PropertyInput.model_fields:
+        raise ValueError(f"Unknown feature {feature}")
+    if axis.values is not None:
+        return len(axis.values)
+    if feature in FIELD_OPTIONS:
+        return len(FIELD_OPTIONS[feature])
+    if feature in NUMERIC_FEATURES:
+        return max(_numeric_range(axis, base)[2], 0)
+    raise ValueError(f"{feature}: values are required")
+
+
+def axis_values(axis, base):
+    """Значения оси: явные values, все варианты Literal-поля или диапазон start..stop включительно
+
+    Диапазон задается шагом step (по умолчанию 1) или числом точек num.
+    Для floor без границ берется 1..floors_total базового объекта. Размер
+    оси нужно заранее проверить через axis_size: сетка строится целиком.
+    """
+    feature = axis.feature
+    if feature not in PropertyInput.model_fields:
+        raise ValueError(f"Unknown feature {feature}")
+    if axis.values is not None:
+        values = list(dict.fromkeys(axis.values))
+    elif feature in FIELD_OPTIONS:
+        values = list(FIELD_OPTIONS[feature])
+    elif feature in NUMERIC_FEATURES:
+        start, stop, count = _numeric_range(axis, base)
+        if axis.num is not None:
+            grid = np.linspace(start, stop, count)
+        else:
+            step = axis.step if axis.step is not None else 1
+            grid = start + step * np.arange(max(count, 0))
+        if NUMERIC_FEATURES[feature] is int:
+            values = list(dict.fromkeys(int(round(v)) for v in grid))
+        else:
+            values = [round(float(v), 6) for v in grid]
+    else:
+        raise ValueError(f"{feature}: values are required")
+    if not values:
+        raise ValueError(f"{feature}: empty axis")
+    return values
+
+
+def expand_grid(base, axes, values):
+    """Точки сетки как PropertyInput в порядке itertools.product осей
+
+    Возвращает (точки, их индексы на осях, [(индексы, сообщение)] для невалидных точек).
+    """
+    base_data = base.dict()
+    inputs, positions, errors = [], [], []
+    for position in itertools.product(*(range(len(v)) for v in values)):
+        data = dict(base_data)
+        for axis, axis_vals, i in zip(axes, values, position):
+            data[axis.feature] = axis_vals[i]
+        try:
+            inputs.append(PropertyInput(**data))
+            positions.append(position)
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = '.'.join(str(part) for part in error['loc'])
+            errors.append((list(position), f"{field}: {error['msg']}" if field else error['msg']))
+    return inputs, positions, errors
@@ -0,0 +1,439 @@
+"""Вычисление экспортированной модели CatBoost (oblivious trees) на NumPy
+
+Сервису для прогноза не нужны ни catboost, ни pandas: модель выгружается один
+раз (export_catboost) в файл model.trees, который открывается через np.memmap.
+Файл: магия, длина и JSON-заголовок (описание признаков и смещения массивов),
+затем выровненные сырые массивы — деревья, пороги, таблицы CTR.
+
+    python -m real_estate_predictor.backend.tree_model \\
+        --model best_real_estate_model.pkl \\
+        --dataset "real_estate_predictor/EDA&model_train/ready_to_train.csv" --check
+
+Логика повторяет применение модели в CatBoost (см. save_model(format='python')):
+  * числовые признаки и значения CTR сравниваются с порогами во float32;
+  * хеш проекции CTR — цепочка CalcHash по хешам категорий, затем по битам
+    числовых порогов и one-hot; значение CTR — (num + prior_num) /
+    (den + prior_denom), затем (ctr + shift) * scale, тоже во float32 —
+    считается при выгрузке для каждой записи таблицы;
+  * индекс листа — биты сплитов дерева, младший бит — первый сплит.
+Категории, которых не было в данных экспорта, получают значение CTR по
+умолчанию, как и в CatBoost (хеш неизвестной строки в таблице не найдется).
+"""
+import json
+import os
+
+import numpy as np
+
+
+MAGIC = b'CBTREES1'
+ALIGNMENT = 64
+TREES_SUFFIX = '.trees'
+
+# CalcHash из CatBoost: (MAGIC_MULT * (a + MAGIC_MULT * b)) mod 2^64
+MAGIC_MULT = np.uint64(0x4906ba494954cb65)
+# первый шаг цепочки от нуля: CalcHash(0, b) = MAGIC_MULT^2 * b
+MAGIC_MULT_SQUARED = np.uint64(0x4906ba494954cb65 ** 2 % 2 ** 64)
+EMPTY_HASH = 2 ** 64 - 1
+# хеш для строк, которых не было в данных экспорта (как в python-экспорте CatBoost)
+UNKNOWN_CAT_HASH = 0x7fFFffFF
+
+COUNTER_TYPES = ('Counter', 'FeatureFreq')
+MEAN_TYPES = ('BinarizedTargetMeanValue', 'FloatTargetMeanValue')
+
+
+def calc_hash(a, b):
+    """CalcHash по массивам uint64 (переполнение — по модулю 2^64, как в C++)"""
+    return MAGIC_MULT * (a + MAGIC_MULT * b)
+
+
+def _signed32(value):
+    """Хеш категории ui32 -> int32: CatBoost расширяет его знаком до 64 бит"""
+    value = int(value)
+    return value - 2 ** 32 if value >= 2 ** 31 else value
+
+
+def _align(position):
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class ObliviousTrees:
+    """Ансамбль симметричных деревьев CatBoost, вычисляемый векторно для пакета строк
+
+    predict принимает то же, что CatBoostRegressor.predict в сервисе: список
+    строк в порядке признаков модели (encode_properties) или DataFrame.
+    """
+
+    def __init__(self, header, arrays, path=None):
+        self.header = header
+        self.path = path
+        self.feature_names_ = header['feature_names']
+        self.tree_count_ = header['tree_count']
+        self.float_flat = header['float_flat_index']
+        self.cat_flat = header['cat_flat_index']
+        self.cat_hashes = header['cat_hashes']
+        self.scale = header['scale']
+        self.bias = header['bias']
+        self._nan_as_true = header['nan_as_true']
+
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self._salt = np.arange(1, len(self.ctr_projection) + 1, dtype=np.uint64)
+        # веса битов листа в самом узком типе: einsum по bool в uint8 на порядок быстрее int64
+        depth = self.split_threshold.shape[1]
+        dtype = np.uint8 if depth <= 8 else np.uint16 if depth <= 16 else np.int64
+        self._pow2 = (1 << np.arange(depth, dtype=np.int64)).astype(dtype)
+
+    @classmethod
+    def load(cls, path):
+        """Открывает model.trees через np.memmap, массивы не копируются в память процесса"""
+        raw = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(raw[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not an exported tree model")
+        start = len(MAGIC) + 8
+        size = int(np.frombuffer(raw[len(MAGIC):start], dtype='<u8')[0])
+        header = json.loads(bytes(raw[start:start + size]).decode('utf-8'))
+        data = _align(start + size)
+
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            offset = data + spec['offset']
+            # обычный ndarray поверх того же отображения: у подкласса memmap дорогая обвязка каждой операции
+            chunk = raw[offset:offset + count * dtype.itemsize].view(dtype=dtype, type=np.ndarray)
+            arrays[name] = chunk.reshape(spec['shape'])
+        return cls(header, arrays, path)
+
+    def save(self, path):
+        """Пишет заголовок и массивы во временный файл и переименовывает"""
+        names = sorted(self.header['arrays'])
+        arrays = {name: np.ascontiguousarray(getattr(self, name)) for name in names}
+        # смещения массивов — от начала выровненной области данных после заголовка
+        specs, position = {}, 0
+        for name in names:
+            array = arrays[name]
+            specs[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': position}
+            position = _align(position + array.nbytes)
+        header = {**self.header, 'arrays': specs}
+        encoded = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        data = _align(len(MAGIC) + 8 + len(encoded))
+
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(np.array([len(encoded)], dtype='<u8').tobytes())
+            f.write(encoded)
+            for name in names:
+                f.write(b'\0' * (data + specs[name]['offset'] - f.tell()))
+                f.write(arrays[name].tobytes())
+        os.replace(tmp, path)
+        self.header = header
+        return path
+
+    def _columns(self, X):
+        """Числовые признаки (float32) и хеши категорий (uint64) из строк или DataFrame"""
+        if hasattr(X, 'iloc'):
+            floats = X.iloc[:, self.float_flat].to_numpy(dtype=np.float32)
+            columns = [X.iloc[:, i].tolist() for i in self.cat_flat]
+        else:
+            floats = np.array([[row[i] for i in self.float_flat] for row in X], dtype=np.float32)
+            columns = [[row[i] for row in X] for i in self.cat_flat]
+        # хеши по столбцам: на DataFrame не нужен to_numpy(dtype=object) по строкам
+        lookup = self.cat_hashes.get
+        hashes = np.array([[lookup(v if isinstance(v, str) else str(v), UNKNOWN_CAT_HASH) for v in column]
+                           for column in columns], dtype=np.int64).reshape(len(self.cat_flat), len(X)).T
+        floats = floats.reshape(len(X), len(self.float_flat))
+        if self._nan_as_true:
+            # NaN с обработкой AsTrue проходит любой порог
+            values = floats[:, self._nan_as_true]
+            floats[:, self._nan_as_true] = np.where(np.isnan(values), np.inf, values)
+        return floats, hashes.view(np.uint64)
+
+    def _ctr_values(self, floats, hashes):
+        """Значения всех CTR-признаков (n, K) во float32"""
+        # атомы проекций: хеши категорий, биты числовых порогов, биты one-hot и ноль;
+        # проекции выровнены нулями слева — CalcHash(0, 0) = 0 не меняет цепочку
+        atoms = [hashes]
+        if len(self.atom_float_index):
+            atoms.append((floats[:, self.atom_float_index] > self.atom_float_border).astype(np.uint64))
+        if len(self.atom_cat_index):
+            atoms.append((hashes[:, self.atom_cat_index] == self.atom_cat_value).astype(np.uint64))
+        atoms.append(np.zeros((len(floats), 1), dtype=np.uint64))
+        elements = np.concatenate(atoms, axis=1)[:, self.projection_atom]
+
+        projection_hash = elements[:, :, 0] * MAGIC_MULT_SQUARED
+        for step in range(1, elements.shape[2]):
+            projection_hash = calc_hash(projection_hash, elements[:, :, step])
+
+        # одна отсортированная таблица на все CTR: хеш проекции смешан с номером CTR
+        keys = calc_hash(projection_hash[:, self.ctr_projection], self._salt)
+        position = np.searchsorted(self.ctr_keys, keys)
+        np.minimum(position, len(self.ctr_keys) - 1, out=position)
+        return np.where(self.ctr_keys[position] == keys, self.ctr_values[position], self.ctr_default)
+
+    def predict_raw(self, X):
+        """Сумма листьев с масштабом и сдвигом (в пространстве таргета модели, здесь log1p цены)"""
+        floats, hashes = self._columns(X)
+        values = [floats]
+        if len(self.ctr_projection):
+            values.append(self._ctr_values(floats, hashes))
+        if len(self.one_hot_index):
+            values.append((hashes[:, self.one_hot_index] == self.one_hot_value).astype(np.float32))
+        values = np.concatenate(values, axis=1) if len(values) > 1 else floats
+
+        # сравнения — один раз на уникальную пару (признак, порог), затем (n, деревья, глубина)
+        bits = (values[:, self.threshold_feature] > self.threshold_border)[:, self.split_threshold]
+        leaf = np.einsum('ntd,d->nt', bits, self._pow2) + self.leaf_offset
+        return self.leaf_values[leaf].sum(axis=1) * self.scale + self.bias
+
+    def predict(self, X):
+        if len(X) == 0:
+            return np.empty(0)
+        return self.predict_raw(X)
+
+
+def _counts(ctr_type, stride, entry, target_border_idx, denominator):
+    """(num, den) записи hash_map для типа CTR"""
+    if ctr_type in COUNTER_TYPES:
+        return entry[0], denominator
+    if ctr_type in MEAN_TYPES:
+        return entry[0], entry[1]
+    # Borders / Buckets: счетчики по классам таргета
+    classes = stride - 1
+    if ctr_type == 'Buckets':
+        return entry[target_border_idx], sum(entry[:classes])
+    if classes > 2:
+        return sum(entry[target_border_idx + 1:classes]), sum(entry[:classes])
+    return entry[1], entry[0] + entry[1]
+
+
+def _calc_ctr(num, den, ctr):
+    """Формула CTR CatBoost во float32"""
+    f = np.float32
+    num, den = np.asarray(num, dtype=f), np.asarray(den, dtype=f)
+    value = (num + f(ctr['prior_numerator'])) / (den + f(ctr['prior_denomerator']))
+    return (value + f(ctr['shift'])) * f(ctr['scale'])
+
+
+def _projection_atoms(ctr, float_atoms, cat_atoms):
+    """Элементы проекции CTR как (вид, номер атома); новые пороги и значения регистрируются"""
+    atoms = []
+    for element in ctr['elements']:
+        kind = element['combination_element']
+        if kind == 'cat_feature_value':
+            atoms.append(('cat', element['cat_feature_index']))
+        elif kind == 'float_feature':
+            key = (element['float_feature_index'], element['border'])
+            atoms.append(('float', float_atoms.setdefault(key, len(float_atoms))))
+        elif kind == 'cat_feature_exact_value':
+            key = (element['cat_feature_index'], _signed32(element['value']))
+            atoms.append(('one_hot', cat_atoms.setdefault(key, len(cat_atoms))))
+        else:
+            raise ValueError(f"Unsupported CTR element {kind}")
+    return tuple(atoms)
+
+
+def from_catboost_json(model_json, feature_names):
+    """ObliviousTrees из словаря save_model(format='json') с таблицей хешей категорий"""
+    info = model_json['features_info']
+    if info.get('text_features') or info.get('embedding_features') or info.get('estimated_features'):
+        raise ValueError("Text, embedding and estimated features are not supported")
+    float_features = info.get('float_features', [])
+    cat_features = info.get('categorical_features', [])
+    if cat_features and 'cat_features_hash' not in info:
+        raise ValueError("Categorical hash table missing: export the model with a pool")
+    cat_hashes = {item['value']: _signed32(item['hash']) for item in info.get('cat_features_hash', [])}
+    if _signed32(UNKNOWN_CAT_HASH) in cat_hashes.values():
+        raise ValueError("Unknown-category sentinel collides with a real category hash")
+
+    scale, bias = model_json.get('scale_and_bias', [1.0, [0.0]])
+    if isinstance(bias, list):
+        if len(bias) != 1:
+            raise ValueError("Only single-dimension models are supported")
+        bias = bias[0]
+
+    # бинарные признаки CatBoost по split_index: пороги числовых, one-hot, пороги CTR;
+    # в векторе значений для сплитов — числовые, затем CTR, затем индикаторы one-hot
+    ctrs = info.get('ctrs', [])
+    binary = []
+    for position, feature in enumerate(float_features):
+        binary += [(position, border) for border in feature.get('borders') or []]
+    one_hot = []
+    for feature in info.get('one_hot_features', []):
+        for value in feature['values']:
+            binary.append((len(float_features) + len(ctrs) + len(one_hot), 0.5))
+            one_hot.append((feature['cat_feature_index'], _signed32(value)))
+    for position, ctr in enumerate(ctrs):
+        binary += [(len(float_features) + position, border) for border in ctr['borders']]
+
+    # атомы проекций после хешей категорий: биты числовых порогов, биты one-hot, ноль
+    float_atoms, cat_atoms, projections = {}, {}, {}
+    ctr_atoms = [_projection_atoms(ctr, float_atoms, cat_atoms) for ctr in ctrs]
+    for atoms in ctr_atoms:
+        projections.setdefault(atoms, len(projections))
+
+    offsets = {'cat': 0, 'float': len(cat_features), 'one_hot': len(cat_features) + len(float_atoms)}
+    zero = len(cat_features) + len(float_atoms) + len(cat_atoms)
+    width = max([len(atoms) for atoms in projections] + [1])
+    projection_atom = np.full((len(projections), width), zero, dtype=np.int32)
+    for atoms, p in projections.items():
+        for step, (kind, index) in enumerate(atoms):
+            projection_atom[p, width - len(atoms) + step] = offsets[kind] + index
+
+    # таблицы CTR: ключ — CalcHash(хеш проекции, номер CTR + 1), значение — готовый CTR
+    ctr_data = model_json.get('ctr_data', {})
+    ctr_default, key_hashes, key_salts, values = [], [], [], []
+    for position, ctr in enumerate(ctrs):
+        data = ctr_data[ctr['identifier']]
+        ctr_type, stride = ctr['ctr_type'], data['hash_stride']
+        denominator = data.get('counter_denominator', 0)
+        # хеша нет в таблице: у счетчиков знаменатель остается
+        ctr_default.append(_calc_ctr(0, denominator if ctr_type in COUNTER_TYPES else 0, ctr))
+
+        hash_map = data['hash_map']
+        nums, dens = [], []
+        for start in range(0, len(hash_map), stride):
+            value = int(hash_map[start])
+            if value == EMPTY_HASH:
+                continue
+            num, den = _counts(ctr_type, stride, hash_map[start + 1:start + stride],
+                               ctr['target_border_idx'], denominator)
+            key_hashes.append(value)
+            key_salts.append(position + 1)
+            nums.append(num)
+            dens.append(den)
+        values.append(_calc_ctr(nums, dens, ctr))
+
+    keys = calc_hash(np.array(key_hashes, dtype=np.uint64), np.array(key_salts, dtype=np.uint64))
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    if (np.diff(keys) == 0).any():
+        raise ValueError("CTR table key collision")
+    values = np.concatenate(values)[order] if values else np.empty(0)
+
+    trees = model_json['oblivious_trees']
+    # у деревьев без разбиений (бывают после дообучения с init_model) splits — null
+    splits = [tree['splits'] or [] for tree in trees]
+    depth = max([len(tree_splits) for tree_splits in splits] + [1])
+    # уникальные пороги; нулевой (+inf) не проходит ни одно значение и заполняет
+    # лишние уровни коротких деревьев
+    thresholds = {(0, float('inf')): 0}
+    split_threshold = np.zeros((len(trees), depth), dtype=np.int32)
+    leaf_offset, leaf_values, total = [], [], 0
+    for t, (tree, tree_splits) in enumerate(zip(trees, splits)):
+        if len(tree['leaf_values']) != 2 ** len(tree_splits):
+            raise ValueError("Only single-dimension oblivious trees are supported")
+        for level, split in enumerate(tree_splits):
+            split_threshold[t, level] = thresholds.setdefault(binary[split['split_index']], len(thresholds))
+        leaf_offset.append(total)
+        leaf_values.append(np.asarray(tree['leaf_values'], dtype=np.float64))
+        total += len(tree['leaf_values'])
+
+    arrays = {
+        'threshold_feature': np.array([f for f, _ in thresholds], dtype=np.int32),
+        'threshold_border': np.array([b for _, b in thresholds], dtype=np.float32),
+        'split_threshold': split_threshold,
+        'leaf_offset': np.array(leaf_offset, dtype=np.int64),
+        'leaf_values': np.concatenate(leaf_values),
+        'atom_float_index': np.array([f for f, _ in float_atoms], dtype=np.int32),
+        'atom_float_border': np.array([b for _, b in float_atoms], dtype=np.float32),
+        'atom_cat_index': np.array([c for c, _ in cat_atoms], dtype=np.int32),
+        'atom_cat_value': np.array([v for _, v in cat_atoms], dtype=np.int64).view(np.uint64),
+        'projection_atom': projection_atom,
+        'ctr_projection': np.array([projections[atoms] for atoms in ctr_atoms], dtype=np.int32),
+        'ctr_default': np.array(ctr_default, dtype=np.float32),
+        'ctr_keys': keys,
+        'ctr_values': values.astype(np.float32),
+        'one_hot_index': np.array([c for c, _ in one_hot], dtype=np.int32),
+        'one_hot_value': np.array([v for _, v in one_hot], dtype=np.int64).view(np.uint64),
+    }
+    header = {
+        'format': 1,
+        'feature_names': list(feature_names),
+        'tree_count': len(trees),
+        'float_flat_index': [f['flat_feature_index'] for f in float_features],
+        'cat_flat_index': [f['flat_feature_index'] for f in cat_features],
+        'nan_as_true': [i for i, f in enumerate(float_features) if f.get('nan_value_treatment') == 'AsTrue'],
+        'cat_hashes': cat_hashes,
+        'scale': float(scale),
+        'bias': float(bias),
+        'catboost_version': model_json.get('model_info', {}).get('catboost_version_info'),
+        'arrays': {name: None for name in arrays},
+    }
+    return ObliviousTrees(header, arrays)
+
+
+def export_catboost(model, path, data):
+    """Выгружает CatBoostRegressor в model.trees и открывает результат
+
+    data — признаки обучающей выборки (DataFrame в порядке признаков модели):
+    по ним CatBoost строит таблицу хешей категорий, без нее строки нельзя
+    сопоставить с таблицами CTR.
+    """
+    import tempfile
+    from catboost import Pool
+
+    pool = Pool(data, cat_features=model.get_cat_feature_indices())
+    with tempfile.TemporaryDirectory(prefix='tree_export_') as tmp:
+        json_path = os.path.join(tmp, 'model.json')
+        model.save_model(json_path, format='json', pool=pool)
+        with open(json_path, encoding='utf-8') as f:
+            model_json = json.load(f)
+    from_catboost_json(model_json, model.feature_names_ or list(data.columns)).save(path)
+    return ObliviousTrees.load(path)
+
+
+def check_export(model, trees, data, repeats=2000):
+    """Максимальное расхождение с model.predict и медианная задержка прогноза одной строки, мс"""
+    import time
+
+    expected = model.predict(data)
+    rows = data.to_numpy(dtype=object).tolist()
+    diff = max(float(np.max(np.abs(trees.predict(data) - expected))),
+               float(np.max(np.abs(trees.predict(rows) - expected))))
+
+    timings = {}
+    for name, predictor in (('catboost', model), ('trees', trees)):
+        samples = []
+        for i in range(repeats):
+            row = [rows[i % len(rows)]]
+            started = time.perf_counter()
+            predictor.predict(row)
+            samples.append(time.perf_counter() - started)
+        timings[name] = float(np.median(samples) * 1000)
+    return diff, timings
+
+
+def main():
+    import argparse
+
+    import joblib
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Выгрузка модели CatBoost в model.trees для вычисления на NumPy")
+    parser.add_argument('--model', default='best_real_estate_model.pkl', help="Pickle CatBoostRegressor")
+    parser.add_argument('--dataset', default='real_estate_predictor/EDA&model_train/ready_to_train.csv',
+                        help="Данные обучения: категории для таблицы хешей и сверка прогнозов")
+    parser.add_argument('--output', default=None, help="По умолчанию рядом с моделью с расширением .trees")
+    parser.add_argument('--check', action='store_true', help="Сверить с model.predict и замерить одну строку")
+    parser.add_argument('--tolerance', type=float, default=1e-9)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    data = pd.read_csv(args.dataset)[model.feature_names_]
+    output = args.output or os.path.splitext(args.model)[0] + TREES_SUFFIX
+    trees = export_catboost(model, output, data)
+    print(f"Exported {trees.tree_count_} trees to {output} ({os.path.getsize(output)} bytes)")
+
+    if args.check:
+        diff, timings = check_export(model, trees, data)
+        print(f"Max abs difference on {len(data)} rows: {diff:.3e}")
+        print(f"Single row p50: catboost {timings['catboost']:.3f} ms, trees {timings['trees']:.3f} ms")
+        if diff > args.tolerance:
+            print(f"Difference exceeds tolerance {args.tolerance}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,132 @@
+import numpy as np
+
+from real_estate_predictor.backend.schema import FIELD_OPTIONS, PropertyInput
+
+
+INPUT_COLUMNS = list(PropertyInput.model_fields)
+# floors_total можно не передавать: как в схеме, берется floor
+OPTIONAL_COLUMNS = {'floors_total'}
+FLOAT_COLUMNS = ['total_area', 'kitchen_area']
+INT_COLUMNS = ['floor', 'floors_total', 'build_year']
+# слово, которое transform_inf заменяет нулем; остальные значения должны быть целыми
+COUNT_COLUMNS = {'rooms': 'студия', 'passenger_lift': 'нет', 'cargo_lift': 'нет'}
+
+RESULT_COLUMNS = ['index', 'status', 'message', 'predicted_price', 'model_version']
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+PARQUET_SUFFIXES = ('.parquet', '.pq')
+
+# первые куски меньше chunk_size, чтобы первые строки ответа ушли сразу
+FIRST_CHUNK_ROWS = 256
+
+
+def _chunk_sizes(chunk_size):
+    size = min(FIRST_CHUNK_ROWS, chunk_size)
+    while True:
+        yield size
+        size = min(size * 4, chunk_size)
+
+
+def read_chunks(file, filename, chunk_size):
+    """DataFrame по кускам из CSV или Parquet; в памяти только текущий кусок"""
+    # pandas импортируется при первой загрузке файла, а не вместе с приложением
+    import pandas as pd
+
+    sizes = _chunk_sizes(chunk_size)
+    if filename.lower().endswith(PARQUET_SUFFIXES):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(file)
+        columns = [col for col in INPUT_COLUMNS if col in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+            offset = 0
+            while offset < batch.num_rows:
+                size = next(sizes)
+                yield batch.slice(offset, size).to_pandas()
+                offset += size
+        return
+
+    # счетчики строками: '1' не должен стать 1.0 из-за пропусков в колонке
+    reader = pd.read_csv(file, iterator=True, usecols=lambda col: col in INPUT_COLUMNS,
+                         dtype={col: str for col in COUNT_COLUMNS})
+    with reader:
+        for size in sizes:
+            try:
+                yield reader.get_chunk(size)
+            except StopIteration:
+                return
+
+
+def missing_columns(frame):
+    return [col for col in INPUT_COLUMNS if col not in frame.columns and col not in OPTIONAL_COLUMNS]
+
+
+def validate_chunk(frame):
+    """Проверки PropertyInput по колонкам куска
+
+    Возвращает кусок с приведенными типами и массив сообщений (None — строка валидна);
+    у строки сообщается первая ошибка.
+    """
+    import pandas as pd
+
+    frame = frame.reset_index(drop=True)
+    errors = np.full(len(frame), None, dtype=object)
+
+    def fail(mask, message):
+        mask = np.asarray(mask, dtype=bool) & pd.isna(errors)
+        errors[mask] = message
+
+    clean = {}
+    for col in INPUT_COLUMNS:
+        if col in frame.columns:
+            raw = frame[col]
+        else:
+            raw = pd.Series(None, index=frame.index, dtype=object)
+        absent = raw.isna().to_numpy()
+        if col not in OPTIONAL_COLUMNS:
+            fail(absent, f"{col}: field required")
+
+        if col in FLOAT_COLUMNS or col in INT_COLUMNS:
+            number = pd.to_numeric(raw, errors='coerce')
+            fail(number.isna().to_numpy() & ~absent, f"{col}: not a number")
+            if col in INT_COLUMNS:
+                fail((number % 1 != 0).to_numpy() & number.notna().to_numpy(), f"{col}: not an integer")
+            clean[col] = number
+        else:
+            # значений в текстовых колонках единицы: проверяются уникальные, не строки
+            codes, uniques = pd.factorize(raw)
+            # Literal, как и схема, пробелов не прощает; счетчики transform_inf приводит через int
+            uniques = [str(value).strip() if col in COUNT_COLUMNS else str(value) for value in uniques]
+            if col in COUNT_COLUMNS:
+                word = COUNT_COLUMNS[col]
+                ok = [value == word or (value.isascii() and value.isdigit()) for value in uniques]
+                message = f"{col}: expected integer or '{word}'"
+            elif col in FIELD_OPTIONS:
+                ok = [value in FIELD_OPTIONS[col] for value in uniques]
+                message = f"{col}: expected one of " + ', '.join(repr(v) for v in FIELD_OPTIONS[col])
+            else:
+                ok, message = [True] * len(uniques), None
+            # код -1 у пропусков попадает на добавленный в конец True: они уже отмечены выше
+            fail(~np.array(ok + [True])[codes], message)
+            clean[col] = np.array(uniques + [None], dtype=object)[codes]
+
+    clean = pd.DataFrame(clean)
+    clean['floors_total'] = clean['floors_total'].fillna(clean['floor'])
+    fail((clean['floors_total'] < clean['floor']).to_numpy(), 'floors_total cannot be less than floor')
+    fail((clean['total_area'] <= 0).to_numpy(), 'Total area must be positive')
+    fail((clean['total_area'] > 1000).to_numpy(), 'Total area seems too large')
+
+    valid = pd.isna(errors)
+    clean = clean[valid].reset_index(drop=True)
+    for col in INT_COLUMNS:
+        clean[col] = clean[col].astype(np.int64)
+    return clean, errors
+
+
+def format_results(results, fmt, header=False):
+    """Кусок результатов -> NDJSON или CSV; заголовок CSV только у первого куска"""
+    if fmt == 'csv':
+        return results.to_csv(index=False, header=header)
+    if results.empty:
+        return ''
+    text = results.to_json(orient='records', lines=True, force_ascii=False)
+    return text if text.endswith('\n') else text + '\n'
@@ -0,0 +1,145 @@
+"""Поиск аналогов: индекс (блоки + KD-дерево) против полного перебора Gower
+
+    python -m real_estate_predictor.benchmarks.bench_comparables            # 10k/100k/1M строк
+    python -m real_estate_predictor.benchmarks.bench_comparables --quick    # только 10k
+
+Для каждого размера таблицы печатаются время построения индекса, задержка
+nearest() с индексом и без него (p50/p95/p99) и качество индекса относительно
+точного результата (stable argsort полной матрицы, первые k): recall@k, доля
+полностью совпавших ответов и доля запросов, ушедших в полный перебор.
+Для сравнения считается и recall старого среза [1:4].
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from real_estate_predictor.backend.comparables import (
+    DEFAULT_K, MAX_MATRIX_CELLS, SEARCH_COLUMNS, ComparablesSnapshot
+)
+from real_estate_predictor.benchmarks.bench_serving import measure
+from real_estate_predictor.benchmarks.data import DATASET_PATH, scaled_frame
+
+
+BATCH_SIZES = [1, 64, 4096]
+DATASET_SIZES = [10_000, 100_000, 1_000_000]
+
+# batch * rows, после которого полный перебор не замеряется
+DEFAULT_MAX_CELLS = 1e8
+
+
+def queries(df, n, seed):
+    """Запросы из датасета с шумом по площадям — как новые объявления, не копии строк"""
+    return scaled_frame(df, max(n, len(df) + 1), seed=seed)[SEARCH_COLUMNS].iloc[:n].reset_index(drop=True)
+
+
+def exact_reference(snapshot, query, k):
+    """Точный ответ и старый срез [1:4] по полной матрице, кусками"""
+    columns = {col: np.asarray(query[col]) for col in SEARCH_COLUMNS}
+    n_queries = len(query)
+    chunk_size = max(1, MAX_MATRIX_CELLS // len(snapshot))
+    reference, legacy = [], []
+    for start in range(0, n_queries, chunk_size):
+        chunk = {col: values[start:start + chunk_size] for col, values in columns.items()}
+        order = snapshot.distances(chunk).argsort(axis=0, kind='stable')
+        # копии: срез-представление держал бы в памяти всю матрицу порядка
+        reference.extend(order[:k, i].copy() for i in range(order.shape[1]))
+        legacy.extend(order[1:4, i].copy() for i in range(order.shape[1]))
+    return reference, legacy
+
+
+def recall(found, reference, k):
+    hits = [len(np.intersect1d(a, b)) for a, b in zip(found, reference)]
+    return float(np.mean(hits) / k)
+
+
+def quality(snapshot, query, k):
+    columns = {col: np.asarray(query[col]) for col in SEARCH_COLUMNS}
+    found = [None] * len(query)
+    fallback = snapshot._nearest_indexed(columns, k, found)
+    found = snapshot.nearest(query, k=k)
+    reference, legacy = exact_reference(snapshot, query, k)
+    return {
+        'recall_at_k': recall(found, reference, k),
+        'exact_match_rate': float(np.mean([np.array_equal(a, b) for a, b in zip(found, reference)])),
+        'fallback_rate': len(fallback) / len(query),
+        'legacy_slice_recall': recall(legacy, reference, min(k, 3)),
+    }
+
+
+def print_case(name, result):
+    print(f"{name:40s} p50 {result['p50_ms']:10.2f} ms  p95 {result['p95_ms']:10.2f} ms  "
+          f"p99 {result['p99_ms']:10.2f} ms  {result['throughput_rows_s']:12.0f} rows/s  "
+          f"rss {result['peak_rss_mb']:7.0f} MB  ({result['runs']} runs)", flush=True)
+
+
+def run(workdir, dataset_sizes, batch_sizes, k, recall_queries, repeats, budget_s, max_cells):
+    df = pd.read_csv(DATASET_PATH)
+    results = {}
+    for size in dataset_sizes:
+        path = os.path.join(workdir, f'comparables_{size}.csv')
+        scaled_frame(df, size).to_csv(path, index=False)
+        snapshot = ComparablesSnapshot.from_csv(path, index=False)
+
+        t0 = time.perf_counter()
+        snapshot.build_index()
+        build_ms = (time.perf_counter() - t0) * 1000
+        blocks = snapshot.blocks
+        trees = sum(tree is not None for _, tree in blocks.values())
+        print(f"n={size}: index built in {build_ms:.0f} ms, {len(blocks)} blocks, {trees} trees")
+        results[f'index_build/n{size}'] = {'ms': build_ms, 'blocks': len(blocks), 'trees': trees}
+
+        stats = quality(snapshot, queries(df, recall_queries, seed=1), k)
+        results[f'quality/n{size}'] = stats
+        print(f"{'quality/n%d' % size:40s} recall@{k} {stats['recall_at_k']:.4f}  "
+              f"exact {stats['exact_match_rate']:.4f}  fallback {stats['fallback_rate']:.4f}  "
+              f"legacy [1:4] recall {stats['legacy_slice_recall']:.4f}")
+
+        for batch in batch_sizes:
+            query = queries(df, batch, seed=batch)
+            snapshot.blocks = blocks
+            name = f'indexed/n{size}/b{batch}'
+            results[name] = measure(lambda: snapshot.nearest(query, k=k), batch, repeats, budget_s)
+            print_case(name, results[name])
+
+            name = f'exact/n{size}/b{batch}'
+            if batch * size > max_cells:
+                print(f"{name:40s} skipped: {batch * size:.0e} cells > --max-cells")
+                continue
+            snapshot.blocks = None
+            results[name] = measure(lambda: snapshot.nearest(query, k=k), batch, repeats, budget_s)
+            print_case(name, results[name])
+        del snapshot, blocks
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Индексированный поиск аналогов против полного перебора")
+    parser.add_argument('--quick', action='store_true', help="Только 10k строк")
+    parser.add_argument('--dataset-sizes', type=int, nargs='+', default=None)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=BATCH_SIZES)
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    parser.add_argument('--recall-queries', type=int, default=1000)
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--budget', type=float, default=5.0, help="Секунд на один случай (минимум 3 запуска)")
+    parser.add_argument('--max-cells', type=float, default=DEFAULT_MAX_CELLS)
+    parser.add_argument('--output', default=None, help="Куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    dataset_sizes = args.dataset_sizes or ([10_000] if args.quick else DATASET_SIZES)
+    with tempfile.TemporaryDirectory(prefix='bench_comparables_') as workdir:
+        results = run(workdir, dataset_sizes, args.batch_sizes, args.k, args.recall_queries,
+                      args.repeats, args.budget, args.max_cells)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,80 @@
+"""Сравнение SafeCategoricalEncoder.transform с прежней построчной реализацией
+
+    python -m real_estate_predictor.benchmarks.bench_safe_encoder --rows 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from real_estate_predictor.backend.safe_encoder import SafeCategoricalEncoder
+
+
+DATASET_PATH = 'real_estate_predictor/EDA&model_train/ready_to_train.csv'
+
+
+def legacy_transform(encoder, df):
+    """transform до векторизации: глубокая копия и apply с замыканием на каждую строку"""
+    df_encoded = df.copy()
+
+    for col, encoding_info in encoder.encoding_maps.items():
+        if col in df.columns:
+            if encoding_info['type'] == 'ordered_label':
+                df_encoded[col] = df[col].map(encoding_info['mapping'])
+            else:
+                global_mean = encoding_info['global_mean']
+                group_means = encoding_info['group_means']
+                group_counts = encoding_info['group_counts']
+
+                def encode_value(x):
+                    if x in group_means:
+                        count = group_counts.get(x, 0)
+                        return (group_means[x] * count + global_mean * 50) / (count + 50)
+                    return global_mean
+
+                df_encoded[col] = df[col].apply(encode_value)
+
+    return df_encoded
+
+
+def scaled_frame(path, rows, seed=0):
+    df = pd.read_csv(path)
+    rng = np.random.default_rng(seed)
+    return df.iloc[rng.integers(0, len(df), rows)].reset_index(drop=True)
+
+
+def best_of(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк SafeCategoricalEncoder.transform")
+    parser.add_argument('--data', default=DATASET_PATH)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    df = scaled_frame(args.data, args.rows)
+    categorical_cols = df.drop('link', axis=1).select_dtypes(include=['object', 'category']).columns.tolist()
+    encoder = SafeCategoricalEncoder().fit(df, categorical_cols, 'price')
+
+    legacy_time, expected = best_of(lambda: legacy_transform(encoder, df), args.repeats)
+    new_time, actual = best_of(lambda: encoder.transform(df), args.repeats)
+    inplace_time, _ = best_of(lambda: encoder.transform(df.copy(), inplace=True), args.repeats)
+
+    pd.testing.assert_frame_equal(expected, actual)
+
+    print(f"rows: {args.rows}, columns: {categorical_cols}")
+    print(f"legacy transform:     {legacy_time * 1000:10.1f} ms")
+    print(f"vectorized transform: {new_time * 1000:10.1f} ms  (x{legacy_time / new_time:.1f})")
+    print(f"inplace (incl. copy): {inplace_time * 1000:10.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
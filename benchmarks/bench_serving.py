@@ -0,0 +1,370 @@
+"""Бенчмарк горячего пути /predict: по стадиям и end-to-end через TestClient
+
+    python -m real_estate_predictor.benchmarks.bench_serving                    # замер + сравнение с baseline
+    python -m real_estate_predictor.benchmarks.bench_serving --quick            # только малые размеры
+    python -m real_estate_predictor.benchmarks.bench_serving --update-baseline  # перезаписать baseline
+    python -m real_estate_predictor.benchmarks.bench_serving --runtime trees    # сервис на model.trees
+
+Все офлайн: маленькая CatBoost-модель обучается на ready_to_train.csv во
+временном каталоге, таблица аналогов синтетически масштабируется до 1M строк.
+Для каждого случая печатаются p50/p95/p99, пропускная способность (строк/с)
+и пиковый RSS; если p50 стадии хуже baseline больше допуска, код выхода 1.
+model_predict — модель, которой отвечает сервис (--runtime), trees_predict —
+та же модель, выгруженная в model.trees и вычисляемая на NumPy; explain —
+нативные ShapValues CatBoost для /explain.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from real_estate_predictor.benchmarks.data import DATASET_PATH, sample_payloads, scaled_frame, train_small_model
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_serving.json')
+
+BATCH_SIZES = [1, 64, 4096]
+DATASET_SIZES = [10_000, 100_000, 1_000_000]
+
+DEFAULT_TOLERANCE = 0.5
+DEFAULT_MIN_DELTA_MS = 0.5
+
+# batch * rows, после которого поиск аналогов полным перебором (без индекса) не запускается
+DEFAULT_MAX_CELLS = 1e8
+
+
+class PeakRss:
+    """Пиковый RSS процесса за время блока: опрос /proc/self/statm в фоне"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._page = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    def _current(self):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * self._page
+        except OSError:
+            # не Linux: ru_maxrss — пик за все время жизни процесса
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._current())
+
+    def __enter__(self):
+        self.peak = self._current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._current())
+
+
+def calibrate(repeats=7):
+    """Время фиксированной нагрузки (pandas + numpy + чистый Python), медиана в мс
+
+    Сохраняется вместе с baseline: при сравнении пороги масштабируются на
+    отношение текущей калибровки к сохраненной, так что общая медленность
+    машины (другой CPU, троттлинг) не выглядит как регрессия.
+    """
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({'key': rng.integers(0, 100, 200_000), 'value': rng.random(200_000)})
+    matrix = rng.random((2000, 256), dtype=np.float32)
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        frame.groupby('key')['value'].mean()
+        np.abs(matrix[:, :, None] - matrix[:, None, :64]).sum(axis=1).argsort(axis=0)
+        sum(i * i for i in range(200_000))
+        timings.append(time.perf_counter() - t0)
+    return float(np.median(timings) * 1000)
+
+
+def measure(fn, rows, repeats, budget_s, before=None):
+    """Прогрев + до repeats запусков (не дольше budget_s); before() вызывается вне замера"""
+    if before:
+        before()
+    fn()
+
+    timings = []
+    started = time.perf_counter()
+    with PeakRss() as rss:
+        while len(timings) < repeats:
+            if before:
+                before()
+            t0 = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - t0)
+            if len(timings) >= 3 and time.perf_counter() - started > budget_s:
+                break
+
+    timings = np.array(timings) * 1000
+    return {
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'p99_ms': float(np.percentile(timings, 99)),
+        'throughput_rows_s': float(rows * len(timings) / (timings.sum() / 1000)),
+        'peak_rss_mb': rss.peak / 2 ** 20,
+        'runs': len(timings),
+        'rows': rows,
+    }
+
+
+class Suite:
+    def __init__(self, workdir, batch_sizes, dataset_sizes, repeats, budget_s, max_cells, runtime='catboost'):
+        self.workdir = workdir
+        self.runtime = runtime
+        self.batch_sizes = batch_sizes
+        self.dataset_sizes = dataset_sizes
+        self.repeats = repeats
+        self.budget_s = budget_s
+        self.max_cells = max_cells
+        self.results = {}
+        self.skipped = []
+
+    def run_case(self, name, fn, rows, repeats=None, before=None):
+        result = measure(fn, rows, repeats or self.repeats, self.budget_s, before)
+        self.results[name] = result
+        print(f"{name:45s} p50 {result['p50_ms']:10.2f} ms  p95 {result['p95_ms']:10.2f} ms  "
+              f"p99 {result['p99_ms']:10.2f} ms  {result['throughput_rows_s']:12.0f} rows/s  "
+              f"rss {result['peak_rss_mb']:7.0f} MB  ({result['runs']} runs)", flush=True)
+
+    def prepare(self):
+        """Модель в реестре, масштабированные таблицы аналогов и переменные окружения для app"""
+        from real_estate_predictor.backend.feature_encoder import FEATURE_COLUMNS
+        from real_estate_predictor.backend.model_registry import ModelRegistry
+
+        self.df = pd.read_csv(DATASET_PATH)
+        models_dir = os.path.join(self.workdir, 'models')
+        registry = ModelRegistry(models_dir)
+        self.model_version = registry.publish(train_small_model(self.df), {'source': 'bench_serving'},
+                                              export_data=self.df[FEATURE_COLUMNS])
+        self.trees_path = os.path.join(models_dir, self.model_version, 'model.trees')
+
+        self.comparables_paths = {}
+        for size in self.dataset_sizes:
+            path = os.path.join(self.workdir, f'comparables_{size}.csv')
+            scaled_frame(self.df, size).to_csv(path, index=False)
+            self.comparables_paths[size] = path
+
+        os.environ['MODEL_REGISTRY_DIR'] = models_dir
+        os.environ['MODEL_PATH'] = os.path.join(self.workdir, 'missing.pkl')
+        os.environ['MODEL_RUNTIME'] = self.runtime
+        os.environ['COMPARABLES_PATH'] = self.comparables_paths[self.dataset_sizes[0]]
+        os.environ['COMPARABLES_CHECK_INTERVAL'] = '1e9'
+
+    def run(self):
+        self.prepare()
+
+        from fastapi.testclient import TestClient
+        from real_estate_predictor.backend import app as app_module
+        from real_estate_predictor.backend.comparables import ComparablesSnapshot, ComparablesStore
+        from real_estate_predictor.backend.feature_encoder import encode_properties
+        from real_estate_predictor.backend.safe_encoder import SafeCategoricalEncoder
+        from real_estate_predictor.backend.schema import PropertyInput
+        from real_estate_predictor.backend.tree_model import ObliviousTrees
+
+        registry = app_module.registry
+        client = TestClient(app_module.app)
+
+        self.run_case('model_load', lambda: registry.load(self.model_version), 1, repeats=5)
+
+        categorical_cols = self.df.drop('link', axis=1).select_dtypes(include=['object']).columns.tolist()
+        encoder = SafeCategoricalEncoder().fit(self.df, categorical_cols, 'price')
+
+        payloads = {batch: sample_payloads(self.df, batch, seed=batch) for batch in self.batch_sizes}
+        inputs = {batch: [PropertyInput(**p) for p in payloads[batch]] for batch in self.batch_sizes}
+        features = {
+            batch: app_module.transform_inf(pd.DataFrame([item.dict() for item in inputs[batch]]))
+            for batch in self.batch_sizes
+        }
+        model = registry.active.model
+        explainer = registry.active.explainer
+        trees = ObliviousTrees.load(self.trees_path)
+        rows = {batch: encode_properties(inputs[batch]) for batch in self.batch_sizes}
+
+        # один прогон на самом большом пакете: состояние pandas/аллокатора после него
+        # не зависит от того, какие размеры пакетов выбраны для замера
+        warmup = [PropertyInput(**p) for p in sample_payloads(self.df, max(BATCH_SIZES), seed=0)]
+        app_module.transform_inf(pd.DataFrame([item.dict() for item in warmup]))
+
+        for batch in self.batch_sizes:
+            items = inputs[batch]
+            self.run_case(f'encode_properties/b{batch}', lambda: encode_properties(items), batch)
+            self.run_case(f'transform_inf/b{batch}',
+                          lambda: app_module.transform_inf(pd.DataFrame([item.dict() for item in items])), batch)
+            self.run_case(f'model_predict/b{batch}', lambda: model.predict(features[batch]), batch)
+            # как в predict_batch: малые пакеты — списком строк, большие — DataFrame
+            trees_input = rows[batch] if batch <= app_module.FAST_PATH_MAX_ROWS else features[batch]
+            self.run_case(f'trees_predict/b{batch}', lambda: trees.predict(trees_input), batch)
+            self.run_case(f'safe_encoder_transform/b{batch}',
+                          lambda: encoder.transform(features[batch]), batch)
+            if explainer is not None:
+                self.run_case(f'explain/b{batch}', lambda: explainer.explain(features[batch]), batch)
+
+        if explainer is not None:
+            self.run_case('http_explain/b1',
+                          lambda: client.post('/explain', json=payloads[1][0]).raise_for_status(),
+                          1, before=app_module.explanation_cache.clear)
+
+        for size in self.dataset_sizes:
+            path = self.comparables_paths[size]
+            self.run_case(f'comparables_load/n{size}', lambda: ComparablesSnapshot.from_csv(path), size, repeats=3)
+
+            store = ComparablesStore(path, check_interval=1e9)
+            store.reload()
+            app_module.comparables = store
+            snapshot = store.snapshot
+
+            for batch in self.batch_sizes:
+                if snapshot.blocks is None and batch * size > self.max_cells:
+                    self.skipped.append(f'n{size}/b{batch}')
+                    print(f"{'*/n%d/b%d' % (size, batch):45s} skipped: {batch * size:.0e} cells > --max-cells")
+                    continue
+
+                self.run_case(f'comparables_nearest/n{size}/b{batch}',
+                              lambda: snapshot.nearest(features[batch]), batch)
+                self.run_case(f'predict_batch/n{size}/b{batch}',
+                              lambda: app_module.predict_batch(inputs[batch]), batch)
+
+                clear = app_module.prediction_cache.clear
+                if batch == 1:
+                    self.run_case(f'http_predict/n{size}/b1',
+                                  lambda: client.post('/predict', json=payloads[1][0]).raise_for_status(),
+                                  1, before=clear)
+                else:
+                    self.run_case(f'http_predict_batch/n{size}/b{batch}',
+                                  lambda: client.post('/predict/batch', json=payloads[batch]).raise_for_status(),
+                                  batch, before=clear)
+
+            del snapshot, store
+
+        return self.results
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def compare(results, baseline, tolerance=None, calibration_ms=None):
+    """Стадии, у которых p50 вырос больше допуска; допуск стадии — tolerances[<стадия>]"""
+    default = tolerance if tolerance is not None else baseline.get('tolerance', DEFAULT_TOLERANCE)
+    min_delta = baseline.get('min_delta_ms', DEFAULT_MIN_DELTA_MS)
+    overrides = baseline.get('tolerances', {})
+    scale = 1.0
+    if calibration_ms and baseline.get('calibration_ms'):
+        # только замедление машины ослабляет порог; на быстрой машине порог не ужесточается
+        scale = max(1.0, calibration_ms / baseline['calibration_ms'])
+
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('cases', {}).get(name)
+        if base is None:
+            continue
+        stage = name.split('/')[0]
+        allowed = overrides.get(stage, default)
+        limit = base['p50_ms'] * scale * (1 + allowed)
+        if result['p50_ms'] > limit and result['p50_ms'] - base['p50_ms'] * scale > min_delta:
+            regressions.append(
+                f"{name}: p50 {result['p50_ms']:.2f} ms > {base['p50_ms']:.2f} ms * {scale:.2f} * (1 + {allowed:.2f})"
+            )
+    return regressions
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк горячего пути /predict")
+    parser.add_argument('--quick', action='store_true', help="Только batch 1/64 и 10k аналогов")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=None)
+    parser.add_argument('--dataset-sizes', type=int, nargs='+', default=None)
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--budget', type=float, default=5.0, help="Секунд на один случай (минимум 3 запуска)")
+    parser.add_argument('--max-cells', type=float, default=DEFAULT_MAX_CELLS)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=None, help="Допуск вместо значения из baseline")
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--output', default=None, help="Куда сохранить результаты в JSON")
+    parser.add_argument('--runtime', choices=('catboost', 'trees'), default='catboost',
+                        help="MODEL_RUNTIME сервиса; baseline снят с catboost")
+    args = parser.parse_args()
+    # PropertyInput.dict() в transform_inf-пути сыплет DeprecationWarning на каждый запуск
+    warnings.simplefilter('ignore', DeprecationWarning)
+
+    batch_sizes = args.batch_sizes or ([1, 64] if args.quick else BATCH_SIZES)
+    dataset_sizes = args.dataset_sizes or ([10_000] if args.quick else DATASET_SIZES)
+
+    calibration_ms = calibrate()
+    print(f"calibration: {calibration_ms:.1f} ms")
+    with tempfile.TemporaryDirectory(prefix='bench_serving_') as workdir:
+        suite = Suite(workdir, batch_sizes, dataset_sizes, args.repeats, args.budget, args.max_cells, args.runtime)
+        results = suite.run()
+    # калибровка до и после: берем худшую, если машину тормозили во время замера
+    calibration_ms = max(calibration_ms, calibrate())
+
+    report = {'environment': environment(), 'calibration_ms': calibration_ms,
+              'cases': results, 'skipped': suite.skipped}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    baseline = load_baseline(args.baseline)
+    if args.update_baseline:
+        updated = {
+            'tolerance': DEFAULT_TOLERANCE,
+            'min_delta_ms': DEFAULT_MIN_DELTA_MS,
+            'tolerances': {},
+        }
+        if baseline:
+            updated.update({k: baseline[k] for k in ('tolerance', 'min_delta_ms', 'tolerances') if k in baseline})
+            updated['cases'] = dict(baseline.get('cases', {}))
+        updated.setdefault('cases', {}).update(results)
+        updated['environment'] = environment()
+        updated['calibration_ms'] = calibration_ms
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(updated, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"No baseline at {args.baseline}, run with --update-baseline")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance, calibration_ms)
+    if regressions:
+        print("Regressions:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
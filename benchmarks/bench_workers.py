@@ -0,0 +1,253 @@
+"""Бенчмарк нескольких воркеров gunicorn: память на воркер и общая пропускная способность
+
+    python -m real_estate_predictor.benchmarks.bench_workers                          # 1/2/4/8 воркеров, preload и без
+    python -m real_estate_predictor.benchmarks.bench_workers --workers 1 4 --modes preload
+    python -m real_estate_predictor.benchmarks.bench_workers --output workers.json
+
+Все офлайн, только Linux: маленькая модель обучается во временном реестре (как в
+bench_serving), таблица аналогов масштабируется до --comparables-rows строк. Для
+каждого числа воркеров сервер поднимается с backend/gunicorn.conf.py (preload —
+app загружается в мастере до fork, no-preload — каждый воркер загружает свое),
+--concurrency потоков шлют /predict по keep-alive соединениям (кэш предсказаний
+выключен), после прогрева замер идет --duration секунд. Затем по
+/proc/<pid>/smaps_rollup снимаются RSS, PSS и частная память мастера и воркеров:
+PSS делит общие страницы между процессами, сумма PSS — память всего сервиса,
+частная память воркера — цена еще одного воркера. Генератор нагрузки работает на
+той же машине: пропускная способность растет с воркерами, только пока хватает ядер.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from real_estate_predictor.benchmarks.bench_serving import environment
+from real_estate_predictor.benchmarks.data import DATASET_PATH, sample_payloads, scaled_frame, train_small_model
+
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', 'gunicorn.conf.py')
+APP = 'real_estate_predictor.backend.app:app'
+
+WORKER_COUNTS = [1, 2, 4, 8]
+MODES = ['preload', 'no-preload']
+
+
+def process_memory(pid):
+    """RSS, PSS и частная память (USS) процесса в МБ"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss_mb': values.get('Rss', 0.0),
+        'pss_mb': values.get('Pss', 0.0),
+        'private_mb': values.get('Private_Clean', 0.0) + values.get('Private_Dirty', 0.0),
+    }
+
+
+def child_pids(pid):
+    pids = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # имя процесса в скобках может содержать пробелы: ppid — второе поле после ')'
+        if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+            pids.append(int(name))
+    return sorted(pids)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def memory_report(master_pid):
+    """Память мастера и воркеров; total_pss_mb — сколько весь сервис занимает на самом деле"""
+    master = process_memory(master_pid)
+    workers = [process_memory(pid) for pid in child_pids(master_pid)]
+    report = {'master': master, 'workers': workers,
+              'total_pss_mb': master['pss_mb'] + sum(w['pss_mb'] for w in workers)}
+    for key in ('rss_mb', 'pss_mb', 'private_mb'):
+        report[f'worker_{key}'] = float(np.mean([w[key] for w in workers])) if workers else 0.0
+    return report
+
+
+class Server:
+    """gunicorn в подпроцессе; вход в контекст ждет, пока все воркеры поднимут приложение"""
+
+    def __init__(self, workers, preload, env, log_path, startup_timeout=300.0):
+        self.workers = workers
+        self.preload = preload
+        self.env = env
+        self.log_path = log_path
+        self.startup_timeout = startup_timeout
+        self.port = None
+        self.process = None
+
+    def __enter__(self):
+        self.port = free_port()
+        env = dict(os.environ, **self.env, WEB_CONCURRENCY=str(self.workers), PRELOAD_APP='1' if self.preload else '0')
+        self._log = open(self.log_path, 'w')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', CONFIG_PATH, '--bind', f'127.0.0.1:{self.port}', APP],
+            env=env, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with code {self.process.returncode}, see {self.log_path}")
+            with open(self.log_path, encoding='utf-8', errors='replace') as f:
+                started = f.read().count('Application startup complete')
+            if started >= self.workers:
+                return self
+            time.sleep(0.2)
+        self.__exit__()
+        raise TimeoutError(f"{self.workers} workers did not start in {self.startup_timeout:.0f} s, see {self.log_path}")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._log.close()
+
+
+def run_load(port, bodies, concurrency, duration):
+    """concurrency потоков шлют /predict без пауз duration секунд; задержки и ошибки"""
+    deadline = time.perf_counter() + duration
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+
+    def client(n):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        i = n
+        while time.perf_counter() < deadline:
+            body = bodies[i % len(bodies)]
+            i += concurrency
+            t0 = time.perf_counter()
+            try:
+                conn.request('POST', '/predict', body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                ok = False
+            if ok:
+                latencies[n].append(time.perf_counter() - t0)
+            else:
+                errors[n] += 1
+        conn.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    timings = np.concatenate([np.array(t) for t in latencies]) * 1000
+    result = {'requests': int(len(timings)), 'errors': int(sum(errors)), 'throughput_rps': len(timings) / elapsed}
+    for p in (50, 95, 99):
+        result[f'p{p}_ms'] = float(np.percentile(timings, p)) if len(timings) else None
+    return result
+
+
+def prepare(workdir, comparables_rows, runtime):
+    """Модель в реестре, таблица аналогов и переменные окружения сервера"""
+    from real_estate_predictor.backend.feature_encoder import FEATURE_COLUMNS
+    from real_estate_predictor.backend.model_registry import ModelRegistry
+
+    df = pd.read_csv(DATASET_PATH)
+    models_dir = os.path.join(workdir, 'models')
+    ModelRegistry(models_dir).publish(train_small_model(df), {'source': 'bench_workers'},
+                                      export_data=df[FEATURE_COLUMNS])
+    comparables_path = os.path.join(workdir, 'comparables.csv')
+    scaled_frame(df, comparables_rows).to_csv(comparables_path, index=False)
+
+    env = {
+        'MODEL_REGISTRY_DIR': models_dir,
+        'MODEL_PATH': os.path.join(workdir, 'missing.pkl'),
+        'CITY_MODELS_DIR': os.path.join(workdir, 'cities'),
+        'MODEL_RUNTIME': runtime,
+        'COMPARABLES_PATH': comparables_path,
+        'COMPARABLES_CHECK_INTERVAL': '1e9',
+        # каждый запрос должен доходить до модели
+        'PREDICTION_CACHE_SIZE': '0',
+    }
+    return df, env
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память и пропускная способность gunicorn с N воркерами")
+    parser.add_argument('--workers', type=int, nargs='+', default=WORKER_COUNTS)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--concurrency', type=int, default=16, help="Потоков генератора нагрузки")
+    parser.add_argument('--duration', type=float, default=10.0, help="Секунд замера на один запуск")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Секунд нагрузки до замера")
+    parser.add_argument('--comparables-rows', type=int, default=100_000)
+    parser.add_argument('--payloads', type=int, default=2000)
+    parser.add_argument('--runtime', choices=('catboost', 'trees'), default='trees')
+    parser.add_argument('--output', default=None, help="Куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    runs = {}
+    with tempfile.TemporaryDirectory(prefix='bench_workers_') as workdir:
+        df, env = prepare(workdir, args.comparables_rows, args.runtime)
+        bodies = [json.dumps(p, ensure_ascii=False).encode('utf-8')
+                  for p in sample_payloads(df, args.payloads, seed=1)]
+
+        for mode in args.modes:
+            for workers in args.workers:
+                name = f'{mode}/w{workers}'
+                log_path = os.path.join(workdir, f"gunicorn_{mode}_{workers}.log")
+                started = time.perf_counter()
+                with Server(workers, mode == 'preload', env, log_path) as server:
+                    startup_s = time.perf_counter() - started
+                    idle = memory_report(server.process.pid)
+                    run_load(server.port, bodies, args.concurrency, args.warmup)
+                    load = run_load(server.port, bodies, args.concurrency, args.duration)
+                    # после нагрузки: copy-on-write успел скопировать все, что воркеры пишут
+                    memory = memory_report(server.process.pid)
+                runs[name] = {'workers': workers, 'mode': mode, 'startup_s': startup_s,
+                              'idle': idle, 'memory': memory, **load}
+                print(f"{name:16s} {load['throughput_rps']:8.0f} req/s  p50 {load['p50_ms']:7.2f} ms  "
+                      f"p99 {load['p99_ms']:7.2f} ms  errors {load['errors']:4d}  "
+                      f"worker rss {memory['worker_rss_mb']:6.0f} MB  pss {memory['worker_pss_mb']:6.0f} MB  "
+                      f"private {memory['worker_private_mb']:6.0f} MB  total pss {memory['total_pss_mb']:6.0f} MB  "
+                      f"startup {startup_s:5.1f} s", flush=True)
+
+    report = {
+        'environment': environment(),
+        'settings': {key: getattr(args, key) for key in
+                     ('concurrency', 'duration', 'warmup', 'comparables_rows', 'payloads', 'runtime')},
+        'runs': runs,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
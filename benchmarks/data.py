@@ -0,0 +1,60 @@
+"""Данные для бенчмарков: запросы из ready_to_train.csv, синтетическое масштабирование, маленькая модель"""
+import numpy as np
+import pandas as pd
+
+from real_estate_predictor.backend.feature_encoder import CURRENT_YEAR, FEATURE_COLUMNS
+
+
+DATASET_PATH = 'real_estate_predictor/EDA&model_train/ready_to_train.csv'
+
+
+def to_payloads(df):
+    """Строки датасета -> JSON-запросы /predict (обратное преобразование признаков)"""
+    payloads = pd.DataFrame({
+        'total_area': df['total_area'].astype(float),
+        'kitchen_area': df['kitchen_area'].astype(float),
+        'floor': df['floor'].astype(int),
+        'floors_total': df['floors_total'].astype(int),
+        'rooms': df['rooms'].astype(int).astype(str).replace('0', 'студия'),
+        'renovation': df['renovation'],
+        'house_type': df['house_type'],
+        'city': df['city'],
+        'passenger_lift': df['passenger_lift'].astype(int).astype(str).replace('0', 'нет'),
+        'cargo_lift': df['cargo_lift'].astype(int).astype(str).replace('0', 'нет'),
+        'parking': df['parking'],
+        'build_year': (CURRENT_YEAR - df['house_age'].round()).astype(int),
+    })
+    return payloads.to_dict('records')
+
+
+def sample_payloads(df, n, seed=0):
+    rng = np.random.default_rng(seed)
+    return to_payloads(df.iloc[rng.integers(0, len(df), n)])
+
+
+def scaled_frame(df, rows, seed=0):
+    """Синтетический датасет на rows строк: выборка с возвращением и шум ±5% по площадям
+
+    Ссылки делаются уникальными, чтобы аналоги не совпадали побайтно.
+    """
+    if rows <= len(df):
+        return df.iloc[:rows].reset_index(drop=True)
+    rng = np.random.default_rng(seed)
+    scaled = df.iloc[rng.integers(0, len(df), rows)].reset_index(drop=True)
+    noise = rng.uniform(0.95, 1.05, size=(rows, 2))
+    scaled['total_area'] = (scaled['total_area'] * noise[:, 0]).round(1)
+    scaled['kitchen_area'] = (scaled['kitchen_area'] * noise[:, 1]).round(1)
+    scaled['link'] = scaled['link'].str.split('?').str[0] + '#' + pd.Series(np.arange(rows)).astype(str)
+    return scaled
+
+
+def train_small_model(df, iterations=100, seed=0):
+    """Небольшая CatBoost-модель на log1p(price) для офлайн-замеров"""
+    from catboost import CatBoostRegressor
+
+    X = df[FEATURE_COLUMNS]
+    categorical_cols = X.select_dtypes(include=['object', 'category']).columns.tolist()
+    model = CatBoostRegressor(iterations=iterations, depth=6, random_seed=seed, verbose=False,
+                              cat_features=categorical_cols, allow_writing_files=False)
+    model.fit(X, np.log1p(df['price']))
+    return model
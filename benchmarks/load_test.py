@@ -0,0 +1,251 @@
+"""Нагрузочный тест API: открытый поток запросов с заданной частотой и кривая насыщения
+
+    python -m real_estate_predictor.benchmarks.load_test --url http://127.0.0.1:8000
+    python -m real_estate_predictor.benchmarks.load_test --serve 4 --rates 50 100 200 400 --output load.json
+    python -m real_estate_predictor.benchmarks.load_test --endpoint batch --batch-size 64 --rates 5 10 20
+
+Запросы — объекты из ready_to_train.csv, переведенные обратно в форму PropertyInput
+(rooms и лифты строками, build_year из house_age). Нагрузка открытая: моменты
+отправки заранее разыгрываются с частотой --rate (пуассоновский поток или
+равномерно) и не ждут ответов на предыдущие запросы; в полете не больше
+--concurrency запросов. Задержка считается от запланированного момента
+отправки, поэтому очередь на стороне клиента при перегрузке тоже попадает в
+нее (без coordinated omission); service — от фактической отправки.
+
+Каждая частота из --rates гоняется --duration секунд. Шаг держит SLO, если p99
+не больше --slo-p99-ms, ошибок не больше --max-error-rate и выполнено не
+меньше 95% запланированного; после первого шага, который его не держит, ramp
+останавливается (--keep-going — пройти все частоты). client_lag_ms — насколько
+сам генератор опаздывает с отправкой, client_cpu — доля ядра, которую он занял:
+если они большие, упирается клиент, а не сервер. --serve N поднимает gunicorn
+с N воркерами (backend/gunicorn.conf.py) на свободном порту с текущими
+переменными окружения (MODEL_PATH, COMPARABLES_PATH и т.д.); иначе
+нагружается уже запущенный --url.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from real_estate_predictor.benchmarks.bench_serving import environment
+from real_estate_predictor.benchmarks.bench_workers import Server
+from real_estate_predictor.benchmarks.data import DATASET_PATH, sample_payloads
+
+
+ENDPOINTS = {'predict': '/predict', 'batch': '/predict/batch', 'explain': '/explain'}
+DEFAULT_RATES = [10, 25, 50, 100, 200, 400, 800]
+# доля выполненных запросов от запланированных, ниже которой шаг считается насыщенным
+MIN_COMPLETION = 0.95
+
+
+def build_bodies(payloads, endpoint, batch_size):
+    """Готовые тела запросов: JSON кодируется заранее, чтобы не нагружать генератор"""
+    if endpoint == 'batch':
+        chunks = [payloads[i:i + batch_size] for i in range(0, len(payloads) - batch_size + 1, batch_size)]
+        return [json.dumps(chunk, ensure_ascii=False).encode('utf-8') for chunk in chunks]
+    return [json.dumps(p, ensure_ascii=False).encode('utf-8') for p in payloads]
+
+
+def failed_rows(endpoint, response):
+    """Строки ответа со status != success (при HTTP 200 модель может быть не загружена)"""
+    data = response.json()
+    if endpoint == 'batch':
+        return sum(item['status'] != 'success' for item in data['results'])
+    return int(data.get('status') != 'success')
+
+
+def arrival_offsets(rate, duration, arrival, rng):
+    """Моменты отправки (с от начала шага): пуассоновский поток или равномерная сетка"""
+    if arrival == 'uniform':
+        return np.arange(int(rate * duration)) / rate
+    # с запасом: сумма экспоненциальных интервалов может не дотянуть до duration
+    gaps = rng.exponential(1.0 / rate, int(rate * duration * 1.5) + 10)
+    offsets = np.cumsum(gaps)
+    return offsets[offsets < duration]
+
+
+def percentiles(values):
+    if not values:
+        return {'p50_ms': None, 'p90_ms': None, 'p99_ms': None, 'max_ms': None}
+    values = np.array(values) * 1000
+    return {
+        'p50_ms': float(np.percentile(values, 50)),
+        'p90_ms': float(np.percentile(values, 90)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+    }
+
+
+async def run_step(client, endpoint, bodies, rate, duration, concurrency, arrival, seed, rows_per_request):
+    """Один шаг кривой: открытый поток с частотой rate в течение duration секунд"""
+    loop = asyncio.get_running_loop()
+    offsets = arrival_offsets(rate, duration, arrival, np.random.default_rng(seed))
+    slots = asyncio.Semaphore(concurrency)
+    latencies, service, lag = [], [], []
+    errors = Counter()
+    path = ENDPOINTS[endpoint]
+    headers = {'Content-Type': 'application/json'}
+
+    async def fire(scheduled, body):
+        async with slots:
+            sent = loop.time()
+            try:
+                response = await client.post(path, content=body, headers=headers)
+            except httpx.TimeoutException:
+                errors['timeout'] += 1
+                return
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] += 1
+                return
+            done = loop.time()
+        if response.status_code != 200:
+            errors[f'http_{response.status_code}'] += 1
+            return
+        failed = failed_rows(endpoint, response)
+        if failed:
+            errors['row_error'] += failed
+            if failed == rows_per_request:
+                return
+        latencies.append(done - scheduled)
+        service.append(done - sent)
+
+    started = loop.time()
+    cpu_started = time.process_time()
+    tasks = []
+    for i, offset in enumerate(offsets):
+        scheduled = started + offset
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lag.append(max(0.0, loop.time() - scheduled))
+        tasks.append(asyncio.create_task(fire(scheduled, bodies[i % len(bodies)])))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - started
+    client_cpu = (time.process_time() - cpu_started) / elapsed
+
+    total = len(offsets)
+    failed_requests = total - len(latencies)
+    return {
+        'offered_rps': rate,
+        'scheduled': total,
+        'completed': len(latencies),
+        'throughput_rps': len(latencies) / elapsed,
+        'throughput_rows_s': len(latencies) * rows_per_request / elapsed,
+        'error_rate': failed_requests / total if total else 0.0,
+        'errors': dict(errors),
+        'latency': percentiles(latencies),
+        'service': percentiles(service),
+        'client_lag_ms': {'mean': float(np.mean(lag) * 1000) if lag else 0.0,
+                          'max': float(np.max(lag) * 1000) if lag else 0.0},
+        'client_cpu': client_cpu,
+        'elapsed_s': elapsed,
+    }
+
+
+def within_slo(step, slo_p99_ms, max_error_rate):
+    p99 = step['latency']['p99_ms']
+    return (
+        p99 is not None and p99 <= slo_p99_ms
+        and step['error_rate'] <= max_error_rate
+        and step['completed'] >= MIN_COMPLETION * step['scheduled']
+    )
+
+
+async def run_curve(url, args, bodies, rows_per_request):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    params = {'top_k': args.top_k} if args.endpoint == 'explain' else None
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits, params=params) as client:
+        health = (await client.get('/health')).json()
+        if not health.get('model_loaded'):
+            print("Warning: model is not loaded, every request will fail")
+
+        if args.warmup > 0:
+            await run_step(client, args.endpoint, bodies, args.rates[0], args.warmup, args.concurrency,
+                           args.arrival, args.seed, rows_per_request)
+
+        steps = []
+        for n, rate in enumerate(args.rates):
+            step = await run_step(client, args.endpoint, bodies, rate, args.duration, args.concurrency,
+                                  args.arrival, args.seed + n + 1, rows_per_request)
+            step['within_slo'] = within_slo(step, args.slo_p99_ms, args.max_error_rate)
+            steps.append(step)
+            latency = step['latency']
+            print(f"{rate:8.1f} req/s offered  {step['throughput_rps']:8.1f} req/s done  "
+                  f"p50 {latency['p50_ms'] or 0:8.2f} ms  p99 {latency['p99_ms'] or 0:8.2f} ms  "
+                  f"errors {step['error_rate']:6.1%}  lag {step['client_lag_ms']['max']:7.1f} ms  "
+                  f"client cpu {step['client_cpu']:5.0%}  "
+                  f"{'ok' if step['within_slo'] else 'SATURATED'}", flush=True)
+            if not step['within_slo'] and not args.keep_going:
+                break
+        return health, steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API с открытым потоком запросов")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--serve', type=int, default=None, metavar='WORKERS',
+                        help="Поднять gunicorn с WORKERS воркерами вместо --url")
+    parser.add_argument('--no-cache', action='store_true', help="С --serve: выключить кэш предсказаний сервера")
+    parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='predict')
+    parser.add_argument('--batch-size', type=int, default=64, help="Объектов в запросе --endpoint batch")
+    parser.add_argument('--top-k', type=int, default=5, help="top_k для --endpoint explain")
+    parser.add_argument('--rates', type=float, nargs='+', default=DEFAULT_RATES, help="Запросов в секунду по шагам")
+    parser.add_argument('--duration', type=float, default=10.0, help="Секунд на шаг")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Секунд на первой частоте до замера")
+    parser.add_argument('--concurrency', type=int, default=64, help="Запросов в полете не больше")
+    parser.add_argument('--arrival', choices=('poisson', 'uniform'), default='poisson')
+    parser.add_argument('--timeout', type=float, default=10.0, help="Таймаут запроса, с")
+    parser.add_argument('--slo-p99-ms', type=float, default=100.0)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--keep-going', action='store_true', help="Не останавливаться на первом насыщенном шаге")
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--payloads', type=int, default=5000, help="Разных объектов в выборке")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="Куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    payloads = sample_payloads(pd.read_csv(args.dataset), args.payloads, seed=args.seed)
+    rows_per_request = args.batch_size if args.endpoint == 'batch' else 1
+    bodies = build_bodies(payloads, args.endpoint, rows_per_request)
+
+    if args.serve:
+        env = {'PREDICTION_CACHE_SIZE': '0', 'EXPLANATION_CACHE_SIZE': '0'} if args.no_cache else {}
+        with tempfile.TemporaryDirectory(prefix='load_test_') as workdir:
+            with Server(args.serve, True, env, os.path.join(workdir, 'gunicorn.log')) as server:
+                url = f'http://127.0.0.1:{server.port}'
+                health, steps = asyncio.run(run_curve(url, args, bodies, rows_per_request))
+    else:
+        url = args.url
+        health, steps = asyncio.run(run_curve(url, args, bodies, rows_per_request))
+
+    sustained = [step['offered_rps'] for step in steps if step['within_slo']]
+    report = {
+        'environment': environment(),
+        'url': url,
+        'model_version': health.get('model_version'),
+        'settings': {key: getattr(args, key) for key in (
+            'endpoint', 'batch_size', 'duration', 'warmup', 'concurrency', 'arrival', 'timeout',
+            'slo_p99_ms', 'max_error_rate', 'payloads', 'seed', 'serve', 'no_cache'
+        )},
+        'max_rate_within_slo': max(sustained) if sustained else None,
+        'steps': steps,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    print(f"Max rate within SLO (p99 <= {args.slo_p99_ms:.0f} ms): "
+          f"{report['max_rate_within_slo'] if sustained else 'none'} req/s")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
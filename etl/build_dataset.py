@@ -0,0 +1,307 @@
+"""Сборка ready_to_train.csv из выгрузок парсера (замена ячеек EDA.ipynb)
+
+    python -m real_estate_predictor.etl.build_dataset \\
+        --input real_estate_predictor/parser_data \\
+        --output "real_estate_predictor/EDA&model_train/ready_to_train.csv"
+
+Данные читаются чанками в три прохода: статистики для заполнения пропусков
+до фильтра по цене, статистики после него (парковка, возраст домов по
+городу) и собственно преобразование с дозаписью результата. В памяти
+держатся только агрегаты, хэши строк для дедупликации, столбец цен и
+значения для средних (доля кухни, площадь студии). Результат и манифест не
+зависят от --chunksize.
+Рядом с датасетом пишется манифест с версией (sha1 содержимого).
+"""
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from real_estate_predictor.backend.feature_encoder import CURRENT_YEAR, add_features
+
+
+# порядок городов = порядок конкатенации в ноутбуке
+CITY_NAMES = {
+    'moskva': 'Москва',
+    'sankt-peterburg': 'Питер',
+    'kazan': 'Казань',
+    'nizhniy_novgorod': 'Нижний',
+    'novosibirsk': 'Новосиб',
+    'ekaterinburg': 'ЕКБ',
+}
+
+RAW_COLUMNS = ['Цена', 'Ссылка', 'Количество комнат', 'Общая площадь', 'Площадь кухни',
+               'Этаж', 'Ремонт', 'Тип дома', 'Год постройки', 'Пассажирский лифт',
+               'Грузовой лифт', 'Парковка']
+
+OUTPUT_COLUMNS = ['price', 'link', 'rooms', 'total_area', 'kitchen_area', 'floor', 'renovation',
+                  'house_type', 'passenger_lift', 'cargo_lift', 'parking', 'city', 'floors_total',
+                  'smart_floor_ratio', 'house_age', 'city_specific_age_group', 'age_city_premium',
+                  'is_spb_historical']
+
+LIFT_COLUMNS = ['passenger_lift', 'cargo_lift']
+
+PRICE_QUANTILES = (0.01, 0.95)
+
+FILLED_ZERO = -1
+
+ETL_VERSION = 1
+
+AREA_PATTERN = r'^\s*(\d+(?:\.\d+)?)'
+FLOOR_PATTERN = r'^\s*(\d+)\D+(\d+)\s*$'
+
+
+def city_files(input_dir):
+    """CSV парсера в порядке CITY_NAMES, затем остальные по алфавиту"""
+    files = {}
+    for path in sorted(glob.glob(os.path.join(input_dir, 'avito_apartments*.csv'))):
+        slug = os.path.basename(path)[len('avito_apartments'):-len('.csv')]
+        files[slug] = path
+    order = [slug for slug in CITY_NAMES if slug in files] + sorted(set(files) - set(CITY_NAMES))
+    return [(CITY_NAMES.get(slug, slug), files[slug]) for slug in order]
+
+
+def parse_chunk(raw, city):
+    """Сырые строки парсера -> типизированный чанк (str.extract вместо apply)"""
+    floors = raw['Этаж'].str.extract(FLOOR_PATTERN).astype(float)
+    lifts = {
+        col: pd.to_numeric(raw[name].replace('нет', '0'), errors='coerce')
+        for col, name in (('passenger_lift', 'Пассажирский лифт'), ('cargo_lift', 'Грузовой лифт'))
+    }
+    # все числа float64: иначе в чанке без пропусков price и build_year станут int64,
+    # и hash_pandas_object разведет одинаковые строки из разных чанков
+    return pd.DataFrame({
+        'price': pd.to_numeric(raw['Цена'], errors='coerce').astype(float),
+        'link': raw['Ссылка'],
+        'rooms': raw['Количество комнат'],
+        'total_area': raw['Общая площадь'].str.extract(AREA_PATTERN, expand=False).astype(float),
+        'kitchen_area': raw['Площадь кухни'].str.extract(AREA_PATTERN, expand=False).astype(float),
+        'floor': floors[0],
+        'floors_total': floors[1],
+        'renovation': raw['Ремонт'],
+        'house_type': raw['Тип дома'],
+        'build_year': pd.to_numeric(raw['Год постройки'], errors='coerce').astype(float),
+        'passenger_lift': lifts['passenger_lift'].astype(float),
+        'cargo_lift': lifts['cargo_lift'].astype(float),
+        'parking': raw['Парковка'],
+        'city': city,
+    })
+
+
+def iter_chunks(input_dir, chunksize):
+    """Дедуплицированные чанки всех городов: один проход по файлам
+
+    Как в ноутбуке: строки без цены отбрасываются, дубликаты ищутся по всем
+    столбцам, кроме ссылки, причем по всем городам сразу.
+    """
+    seen = set()
+    for city, path in city_files(input_dir):
+        for raw in pd.read_csv(path, usecols=RAW_COLUMNS, dtype=str, chunksize=chunksize):
+            chunk = parse_chunk(raw, city)
+            chunk = chunk[chunk['price'].notna()]
+            hashes = pd.util.hash_pandas_object(chunk.drop(columns='link'), index=False).to_numpy()
+            keep = np.zeros(len(chunk), dtype=bool)
+            for i, h in enumerate(hashes):
+                if h not in seen:
+                    seen.add(h)
+                    keep[i] = True
+            yield chunk[keep]
+
+
+def _mode(counts, keys):
+    """Мода по группам из накопленных value_counts; при равенстве — меньшее значение, как Series.mode()[0]"""
+    if counts is None or counts.empty:
+        return {}
+    frame = counts.rename('n').reset_index()
+    frame = frame.sort_values(keys + ['n', 'value'], ascending=[True] * len(keys) + [False, True], kind='mergesort')
+    first = frame.drop_duplicates(keys)
+    index = first[keys[0]] if len(keys) == 1 else pd.MultiIndex.from_frame(first[keys])
+    return pd.Series(first['value'].to_numpy(), index=index).to_dict()
+
+
+def _nested(series):
+    """Series с индексом (город, тип дома) -> {город: {тип дома: значение}} для JSON-манифеста"""
+    nested = {}
+    for (outer, inner), value in series.items():
+        nested.setdefault(outer, {})[inner] = float(value)
+    return nested
+
+
+def _add_counts(acc, frame, keys, value):
+    counts = frame.dropna(subset=keys + [value]).groupby(keys + [value], sort=False).size()
+    counts.index = counts.index.set_names(keys + ['value'])
+    return counts if acc is None else acc.add(counts, fill_value=0)
+
+
+def _add_sums(acc, frame, keys, value):
+    sums = frame.dropna(subset=keys).groupby(keys, sort=False)[value].agg(['sum', 'count'])
+    return sums if acc is None else acc.add(sums, fill_value=0)
+
+
+def _fill_low_rise_lifts(chunk):
+    """Пропуск лифта в доме до 5 этажей -> 0"""
+    low = chunk['floors_total'] <= 5
+    for col in LIFT_COLUMNS:
+        chunk.loc[chunk[col].isna() & low, col] = 0
+    return chunk
+
+
+def collect_base_stats(input_dir, chunksize):
+    """Проход 1: статистики заполнения пропусков и цены для квантилей"""
+    # значения, а не частичные суммы: math.fsum точен, и результат не зависит от chunksize
+    kitchen_ratio = []
+    studio_area = []
+    renovation = build_year = None
+    lifts = {col: None for col in LIFT_COLUMNS}
+    prices = []
+
+    for chunk in iter_chunks(input_dir, chunksize):
+        both = chunk['kitchen_area'].notna() & chunk['total_area'].notna()
+        ratio = chunk.loc[both, 'kitchen_area'] / chunk.loc[both, 'total_area']
+        kitchen_ratio.append(ratio.to_numpy())
+
+        studio = chunk.loc[chunk['rooms'] == 'студия', 'total_area'].dropna()
+        studio_area.append(studio.to_numpy())
+
+        renovation = _add_counts(renovation, chunk, ['city'], 'renovation')
+        build_year = _add_sums(build_year, chunk, ['city', 'house_type'], 'build_year')
+
+        # в ноутбуке мода считается, когда пропуски малоэтажек уже равны 0, а 'нет'
+        # еще строка: это разные значения, поэтому заполненные нули считаются отдельно
+        low = chunk['floors_total'] <= 5
+        tokens = chunk[['house_type']].copy()
+        for col in LIFT_COLUMNS:
+            tokens[col] = chunk[col].mask(chunk[col].isna() & low, FILLED_ZERO)
+            lifts[col] = _add_counts(lifts[col], tokens, ['house_type'], col)
+        prices.append(chunk['price'].to_numpy())
+
+    prices = np.concatenate(prices) if prices else np.array([])
+    low = np.quantile(prices, PRICE_QUANTILES[0])
+    high = np.quantile(prices[prices > low], PRICE_QUANTILES[1])
+
+    kitchen_ratio = np.concatenate(kitchen_ratio) if kitchen_ratio else np.array([])
+    studio_area = np.concatenate(studio_area) if studio_area else np.array([])
+    return {
+        'kitchen_ratio': math.fsum(kitchen_ratio) / len(kitchen_ratio),
+        'studio_area': math.fsum(studio_area) / len(studio_area),
+        'renovation_mode': _mode(renovation, ['city']),
+        'build_year_mean': _nested(build_year['sum'] / build_year['count']),
+        'lift_mode': {
+            col: {key: max(value, 0) for key, value in _mode(lifts[col], ['house_type']).items()}
+            for col in LIFT_COLUMNS
+        },
+        'price_low': float(low),
+        'price_high': float(high),
+    }
+
+
+def clean_chunk(chunk, stats):
+    """Очистка и заполнение пропусков по статистикам прохода 1"""
+    chunk = chunk[(chunk['price'] > stats['price_low']) & (chunk['price'] < stats['price_high'])].copy()
+
+    missing = chunk['kitchen_area'].isna()
+    chunk.loc[missing, 'kitchen_area'] = (chunk.loc[missing, 'total_area'] * stats['kitchen_ratio']).round(1)
+
+    free = chunk['rooms'] == 'свободная планировка'
+    free_rooms = np.floor((chunk['total_area'] - chunk['kitchen_area']) / stats['studio_area'])
+    chunk['rooms'] = chunk['rooms'].where(~free, free_rooms.astype('Int64').astype(str))
+    chunk['rooms'] = chunk['rooms'].replace('студия', '0').str.split(' ').str[0]
+
+    chunk['renovation'] = chunk['renovation'].fillna(chunk['city'].map(stats['renovation_mode']))
+
+    year_mean = pd.Series([stats['build_year_mean'].get(city, {}).get(house_type, np.nan)
+                           for city, house_type in zip(chunk['city'], chunk['house_type'])],
+                          index=chunk.index, dtype=float)
+    chunk['build_year'] = chunk['build_year'].fillna(year_mean).round(0)
+
+    chunk = _fill_low_rise_lifts(chunk)
+    for col in LIFT_COLUMNS:
+        chunk[col] = chunk[col].fillna(chunk['house_type'].map(stats['lift_mode'][col]))
+    return chunk
+
+
+def collect_filtered_stats(input_dir, chunksize, stats):
+    """Проход 2: мода парковки и средний возраст дома по городу после фильтра цены"""
+    parking = age = None
+    for chunk in iter_chunks(input_dir, chunksize):
+        chunk = clean_chunk(chunk, stats)
+        chunk['house_age'] = CURRENT_YEAR - chunk['build_year']
+        parking = _add_counts(parking, chunk, ['city'], 'parking')
+        age = _add_sums(age, chunk, ['city'], 'house_age')
+
+    return {
+        'parking_mode': _mode(parking, ['city']),
+        'historical_age_fill': (age['sum'] / age['count']).to_dict(),
+    }
+
+
+def transform_chunk(chunk, stats):
+    """Проход 3: итоговые признаки в формате ready_to_train.csv"""
+    chunk = clean_chunk(chunk, stats)
+    chunk['parking'] = chunk['parking'].fillna(chunk['city'].map(stats['parking_mode'])).str.split(',').str[0]
+    chunk[['rooms', 'passenger_lift', 'cargo_lift', 'floor', 'floors_total']] = (
+        chunk[['rooms', 'passenger_lift', 'cargo_lift', 'floor', 'floors_total']].astype(int)
+    )
+    chunk['price'] = chunk['price'].astype(float)
+    chunk = add_features(chunk, stats['historical_age_fill'])
+
+    # выбросы по площади
+    chunk = chunk[~((chunk['total_area'] > 200) & (chunk['price'] < 10000000)) & (chunk['total_area'] < 400)]
+    return chunk[OUTPUT_COLUMNS]
+
+
+def file_sha1(path):
+    """SHA-1 файла, читается блоками: выгрузки парсера могут быть большими"""
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha1').hexdigest()
+
+
+def build_dataset(input_dir, output, chunksize=100_000):
+    stats = collect_base_stats(input_dir, chunksize)
+    stats.update(collect_filtered_stats(input_dir, chunksize, stats))
+
+    tmp = output + '.tmp'
+    digest = hashlib.sha1()
+    rows = 0
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        for i, chunk in enumerate(iter_chunks(input_dir, chunksize)):
+            chunk = transform_chunk(chunk, stats)
+            text = chunk.to_csv(index=False, header=(i == 0), lineterminator='\n')
+            f.write(text)
+            digest.update(text.encode('utf-8'))
+            rows += len(chunk)
+    os.replace(tmp, output)
+
+    manifest = {
+        'version': digest.hexdigest()[:12],
+        'etl_version': ETL_VERSION,
+        'rows': rows,
+        'inputs': {
+            city: file_sha1(path)[:12]
+            for city, path in city_files(input_dir)
+        },
+        'stats': stats,
+    }
+    with open(os.path.splitext(output)[0] + '.manifest.json', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True, default=str)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ETL: выгрузки парсера -> ready_to_train.csv")
+    parser.add_argument('--input', default='real_estate_predictor/parser_data')
+    parser.add_argument('--output', default='real_estate_predictor/EDA&model_train/ready_to_train.csv')
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    args = parser.parse_args()
+
+    manifest = build_dataset(args.input, args.output, args.chunksize)
+    print(f"Dataset {args.output}: {manifest['rows']} rows, version {manifest['version']}")
+
+
+if __name__ == '__main__':
+    main()
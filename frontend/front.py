@@ -1,11 +1,21 @@
+import io
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import streamlit as st
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
 
 
 BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:8000')
 
+# пакетный режим: строк в одном запросе /predict/batch и запросов одновременно
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '500'))
+BULK_WORKERS = int(os.getenv('BULK_WORKERS', '4'))
+BULK_TIMEOUT = float(os.getenv('BULK_TIMEOUT', '120'))
+HEALTH_TTL = int(os.getenv('HEALTH_TTL', '30'))
+
 
 # Настройки страницы
 st.set_page_config(
@@ -20,151 +30,313 @@ st.markdown("Предсказание стоимости недвижимост
 
 CITY_MAPPING = {
     'Москва': 'Москва',
-    'Санкт-Петербург': 'Питер', 
+    'Санкт-Петербург': 'Питер',
     'Казань': 'Казань',
     'Нижний Новгород': 'Нижний',
     'Новосибирск': 'Новосиб',
     'Екатеринбург': 'ЕКБ'
 }
 
-col1, col2 = st.columns(2)
-
-with col1:
-    st.header("Основные параметры")
-    
-    # Числовые параметры
-    total_area = st.number_input("Общая площадь (м²)", min_value=10.0, max_value=500.0, value=65.0, step=0.5)
-    kitchen_area = st.number_input("Площадь кухни (м²)", min_value=5.0, max_value=100.0, value=12.0, step=0.5)
-    floor = st.number_input("Этаж", min_value=1, max_value=50, value=5)
-    floors_total = st.number_input("Всего этажей в доме", min_value=1, max_value=50, value=9)
-    build_year = st.number_input("Год постройки", min_value=1900, max_value=2026, value=2008)
-
-with col2:
-    st.header("Категориальные параметры")
-    
-    # Выпадающие меню для категориальных признаков
-    rooms = st.selectbox("Количество комнат", options=["студия", "1", "2", "3", "4", "5+"])
-    
-    renovation = st.selectbox(
-        "Ремонт", 
-        options=['дизайнерский', 'евро', 'требует ремонта', 'косметический']
-    )
-    
-    house_type = st.selectbox(
-        "Тип дома", 
-        options=['монолитный', 'панельный', 'кирпичный', 'монолитно-кирпичный', 'блочный', 'деревянный']
-    )
-    
-    # Город с полными названиями
-    city_full = st.selectbox(
-        "Город", 
-        options=list(CITY_MAPPING.keys())
-    )
-    
-    passenger_lift = st.selectbox("Пассажирский лифт", options=["1", "2", "3", "нет"])
-    cargo_lift = st.selectbox("Грузовой лифт", options=["1", "0", "нет"])
-    
-    parking = st.selectbox(
-        "Парковка", 
-        options=['подземная', 'открытая во дворе', 'наземная многоуровневая', 'за шлагбаумом во дворе']
-    )
+ROOMS_OPTIONS = ["студия", "1", "2", "3", "4", "5+"]
+RENOVATION_OPTIONS = ['дизайнерский', 'евро', 'требует ремонта', 'косметический']
+HOUSE_TYPE_OPTIONS = ['монолитный', 'панельный', 'кирпичный', 'монолитно-кирпичный', 'блочный', 'деревянный']
+PASSENGER_LIFT_OPTIONS = ["1", "2", "3", "нет"]
+CARGO_LIFT_OPTIONS = ["1", "0", "нет"]
+PARKING_OPTIONS = ['подземная', 'открытая во дворе', 'наземная многоуровневая', 'за шлагбаумом во дворе']
+
+# колонки файла для пакетной оценки, как в PropertyInput
+INPUT_COLUMNS = ['total_area', 'kitchen_area', 'floor', 'floors_total', 'rooms', 'renovation',
+                 'house_type', 'city', 'passenger_lift', 'cargo_lift', 'parking', 'build_year']
+TEXT_COLUMNS = ['rooms', 'renovation', 'house_type', 'city', 'passenger_lift', 'cargo_lift', 'parking']
+# старое имя колонки из примеров запроса
+COLUMN_ALIASES = {'total_floor': 'floors_total'}
+RESULT_COLUMNS = ['predicted_price', 'status', 'message', 'model_version']
+
 
-# Кнопка для предсказания
-if st.button("🎯 Предсказать стоимость", type="primary"):
-    city_api = CITY_MAPPING[city_full]
-    
-    input_data = {
-        "total_area": total_area,
-        "kitchen_area": kitchen_area,
-        "floor": floor,
-        "total_floor": floors_total,
-        "rooms": rooms,
-        "renovation": renovation,
-        "house_type": house_type,
-        "city": city_api,  
-        "passenger_lift": passenger_lift,
-        "cargo_lift": cargo_lift,
-        "parking": parking,
-        "build_year": build_year
-    }
-    
+@st.cache_resource
+def http_session():
+    """Общая keep-alive сессия: пул соединений на все перезапуски скрипта и потоки пакетного режима"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(BULK_WORKERS, 1))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+@st.cache_data(ttl=HEALTH_TTL, show_spinner=False)
+def fetch_health():
+    """Ответ /health или None, если API недоступен; перезапуски страницы берут его из кэша"""
     try:
-        response = requests.post(
-           f"{BACKEND_URL}/predict",
-            json=input_data
-        )
-        
+        response = http_session().get(f"{BACKEND_URL}/health", timeout=5)
         if response.status_code == 200:
-            result = response.json()
-            predicted_price = result['predicted_price']
-            
-            # Красиво отображаем результат
-            st.success("✅ Предсказание выполнено успешно!")
-            
-            # Красивый вывод цены
-            st.markdown(f"""
-            <div style='
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                padding: 2rem;
-                border-radius: 15px;
-                text-align: center;
-                color: white;
-                margin: 1rem 0;
-            '>
-                <h2 style='margin: 0; font-size: 2.5rem;'>💰 {predicted_price:,.0f} ₽</h2>
-                <p style='margin: 0.5rem 0 0 0; opacity: 0.9;'>Предсказанная стоимость в {city_full}</p>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Вывод похожих объектов
-            if 'similar_listings' in result and result['similar_listings']:
-                st.header("🏘️ Похожие объекты")
-                
-                similar_cols = st.columns(3)
-                
-                for idx, similar in enumerate(result['similar_listings']):
-                    with similar_cols[idx]:
-                        st.markdown(f"""
-                        <div style='
-                            border: 1px solid #ddd;
-                            border-radius: 10px;
-                            padding: 1rem;
-                            margin: 0.5rem 0;
-                            background-color: #f9f9f9;
-                        '>
-                            <h4 style='margin-top: 0;'>Объект {idx + 1}</h4>
-                            <p><strong>💰 Цена:</strong> {similar['price']:,.0f} ₽</p>
-                            <p><strong>🚪 Комнат:</strong> {similar['rooms']}</p>
-                            <p><strong>📐 Площадь:</strong> {similar['total_area']} м²</p>
-                            <p><a href="{similar['link']}" target="_blank">🔗 Ссылка на объявление</a></p>
-                        </div>
-                        """, unsafe_allow_html=True)
-            else:
-                st.info("ℹ️ Похожие объекты не найдены")
-            
-            with st.expander("📊 Детали запроса"):
-                st.write("**Параметры недвижимости:**")
-                st.json({
-                    "Город": city_full,
-                    "Общая площадь": f"{total_area} м²",
-                    "Площадь кухни": f"{kitchen_area} м²", 
-                    "Этаж": f"{floor} из {floors_total}",
-                    "Комнаты": rooms,
-                    "Ремонт": renovation,
-                    "Тип дома": house_type,
-                    "Год постройки": build_year,
-                    "Парковка": parking
-                })
-                st.write("**Полный ответ API:**")
-                st.json(result)
-                
-        else:
-            st.error(f"❌ Ошибка API: {response.status_code} - {response.text}")
-            
-    except requests.exceptions.ConnectionError:
-        st.error("🚫 Не удалось подключиться к API. Убедитесь, что сервер запущен на localhost:8000")
+            return response.json()
+    except requests.exceptions.RequestException:
+        pass
+    return None
+
+
+@st.cache_data(show_spinner=False)
+def read_table(content, name):
+    """CSV или XLSX из загруженного файла; кэш по содержимому, чтобы перезапуски не парсили его заново"""
+    if name.lower().endswith('.xlsx'):
+        return pd.read_excel(io.BytesIO(content))
+    return pd.read_csv(io.BytesIO(content))
+
+
+def prepare_rows(table):
+    """Строки файла -> JSON для /predict/batch; названия городов как в форме, пустые ячейки -> None"""
+    table = table.rename(columns=COLUMN_ALIASES)
+    missing = [col for col in INPUT_COLUMNS if col not in table.columns]
+    if 'floors_total' in missing:
+        # схема подставит floors_total = floor
+        missing.remove('floors_total')
+    if missing:
+        return None, missing
+
+    table = table[[col for col in INPUT_COLUMNS if col in table.columns]].copy()
+    table['city'] = table['city'].replace(CITY_MAPPING)
+    for col in TEXT_COLUMNS:
+        # Excel отдает 2 и 1.0 вместо "2" и "1"
+        table[col] = table[col].map(
+            lambda v: None if pd.isna(v) else str(int(v)) if isinstance(v, float) and v.is_integer() else str(v)
+        )
+    table = table.astype(object).where(table.notna(), None)
+    return table.to_dict('records'), []
+
+
+def post_chunk(start, rows):
+    """Один запрос /predict/batch; ошибка запроса становится ошибкой каждой строки куска"""
+    try:
+        response = http_session().post(f"{BACKEND_URL}/predict/batch", json=rows, timeout=BULK_TIMEOUT)
+        if response.status_code != 200:
+            raise RuntimeError(f"API {response.status_code}: {response.text[:200]}")
+        return start, response.json()['results'], None
     except Exception as e:
-        st.error(f"❌ Произошла ошибка: {str(e)}")
+        return start, None, str(e)
+
+
+def predict_rows(rows, progress):
+    """Пакетная оценка кусками по BULK_CHUNK_SIZE в BULK_WORKERS потоков с общим пулом соединений"""
+    results = [None] * len(rows)
+    chunks = [(start, rows[start:start + BULK_CHUNK_SIZE]) for start in range(0, len(rows), BULK_CHUNK_SIZE)]
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(BULK_WORKERS, 1)) as executor:
+        futures = [executor.submit(post_chunk, start, chunk) for start, chunk in chunks]
+        # вызовы Streamlit только из основного потока
+        for future in as_completed(futures):
+            start, items, error = future.result()
+            size = min(BULK_CHUNK_SIZE, len(rows) - start)
+            if error is not None:
+                for i in range(start, start + size):
+                    results[i] = {'status': 'error', 'message': error}
+            else:
+                for item in items:
+                    results[start + item['index']] = item
+            done += size
+            progress.progress(done / len(rows), text=f"Оценено {done} из {len(rows)}")
+    return pd.DataFrame([{col: item.get(col) for col in RESULT_COLUMNS} for item in results])
+
+
+@st.cache_data(show_spinner=False)
+def result_file(table, fmt):
+    """Таблица результата в байтах для скачивания"""
+    if fmt == 'xlsx':
+        buffer = io.BytesIO()
+        table.to_excel(buffer, index=False)
+        return buffer.getvalue()
+    # BOM, чтобы Excel открыл кириллицу без мастера импорта
+    return table.to_csv(index=False).encode('utf-8-sig')
+
+
+tab_single, tab_bulk = st.tabs(["🏠 Один объект", "📄 Файл"])
+
+with tab_single:
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.header("Основные параметры")
+
+        # Числовые параметры
+        total_area = st.number_input("Общая площадь (м²)", min_value=10.0, max_value=500.0, value=65.0, step=0.5)
+        kitchen_area = st.number_input("Площадь кухни (м²)", min_value=5.0, max_value=100.0, value=12.0, step=0.5)
+        floor = st.number_input("Этаж", min_value=1, max_value=50, value=5)
+        floors_total = st.number_input("Всего этажей в доме", min_value=1, max_value=50, value=9)
+        build_year = st.number_input("Год постройки", min_value=1900, max_value=2026, value=2008)
+
+    with col2:
+        st.header("Категориальные параметры")
+
+        # Выпадающие меню для категориальных признаков
+        rooms = st.selectbox("Количество комнат", options=ROOMS_OPTIONS)
+
+        renovation = st.selectbox("Ремонт", options=RENOVATION_OPTIONS)
+
+        house_type = st.selectbox("Тип дома", options=HOUSE_TYPE_OPTIONS)
+
+        # Город с полными названиями
+        city_full = st.selectbox(
+            "Город",
+            options=list(CITY_MAPPING.keys())
+        )
+
+        passenger_lift = st.selectbox("Пассажирский лифт", options=PASSENGER_LIFT_OPTIONS)
+        cargo_lift = st.selectbox("Грузовой лифт", options=CARGO_LIFT_OPTIONS)
+
+        parking = st.selectbox("Парковка", options=PARKING_OPTIONS)
+
+    # Кнопка для предсказания
+    if st.button("🎯 Предсказать стоимость", type="primary"):
+        city_api = CITY_MAPPING[city_full]
+
+        input_data = {
+            "total_area": total_area,
+            "kitchen_area": kitchen_area,
+            "floor": floor,
+            "floors_total": floors_total,
+            "rooms": rooms,
+            "renovation": renovation,
+            "house_type": house_type,
+            "city": city_api,
+            "passenger_lift": passenger_lift,
+            "cargo_lift": cargo_lift,
+            "parking": parking,
+            "build_year": build_year
+        }
+
+        try:
+            response = http_session().post(
+               f"{BACKEND_URL}/predict",
+                json=input_data,
+                timeout=30
+            )
+
+            if response.status_code == 200:
+                result = response.json()
+                predicted_price = result['predicted_price']
+
+                # Красиво отображаем результат
+                st.success("✅ Предсказание выполнено успешно!")
+
+                # Красивый вывод цены
+                st.markdown(f"""
+                <div style='
+                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+                    padding: 2rem;
+                    border-radius: 15px;
+                    text-align: center;
+                    color: white;
+                    margin: 1rem 0;
+                '>
+                    <h2 style='margin: 0; font-size: 2.5rem;'>💰 {predicted_price:,.0f} ₽</h2>
+                    <p style='margin: 0.5rem 0 0 0; opacity: 0.9;'>Предсказанная стоимость в {city_full}</p>
+                </div>
+                """, unsafe_allow_html=True)
+
+                # Вывод похожих объектов
+                if 'similar_listings' in result and result['similar_listings']:
+                    st.header("🏘️ Похожие объекты")
+
+                    similar_cols = st.columns(3)
+
+                    for idx, similar in enumerate(result['similar_listings']):
+                        with similar_cols[idx % 3]:
+                            st.markdown(f"""
+                            <div style='
+                                border: 1px solid #ddd;
+                                border-radius: 10px;
+                                padding: 1rem;
+                                margin: 0.5rem 0;
+                                background-color: #f9f9f9;
+                            '>
+                                <h4 style='margin-top: 0;'>Объект {idx + 1}</h4>
+                                <p><strong>💰 Цена:</strong> {similar['price']:,.0f} ₽</p>
+                                <p><strong>🚪 Комнат:</strong> {similar['rooms']}</p>
+                                <p><strong>📐 Площадь:</strong> {similar['total_area']} м²</p>
+                                <p><a href="{similar['link']}" target="_blank">🔗 Ссылка на объявление</a></p>
+                            </div>
+                            """, unsafe_allow_html=True)
+                else:
+                    st.info("ℹ️ Похожие объекты не найдены")
+
+                with st.expander("📊 Детали запроса"):
+                    st.write("**Параметры недвижимости:**")
+                    st.json({
+                        "Город": city_full,
+                        "Общая площадь": f"{total_area} м²",
+                        "Площадь кухни": f"{kitchen_area} м²",
+                        "Этаж": f"{floor} из {floors_total}",
+                        "Комнаты": rooms,
+                        "Ремонт": renovation,
+                        "Тип дома": house_type,
+                        "Год постройки": build_year,
+                        "Парковка": parking
+                    })
+                    st.write("**Полный ответ API:**")
+                    st.json(result)
+
+            else:
+                st.error(f"❌ Ошибка API: {response.status_code} - {response.text}")
+
+        except requests.exceptions.ConnectionError:
+            st.error(f"🚫 Не удалось подключиться к API. Убедитесь, что сервер запущен на {BACKEND_URL}")
+        except Exception as e:
+            st.error(f"❌ Произошла ошибка: {str(e)}")
+
+with tab_bulk:
+    st.header("Оценка списка квартир")
+    st.markdown(
+        "Файл CSV или XLSX, по строке на квартиру, колонки: "
+        + ", ".join(f"`{col}`" for col in INPUT_COLUMNS)
+        + ". Город — полным названием или как в API."
+    )
+    template = pd.DataFrame([{
+        "total_area": 65.5, "kitchen_area": 12.0, "floor": 5, "floors_total": 9, "rooms": "2",
+        "renovation": "евро", "house_type": "панельный", "city": "Москва", "passenger_lift": "1",
+        "cargo_lift": "нет", "parking": "открытая во дворе", "build_year": 2008
+    }])
+    st.download_button("📎 Шаблон CSV", result_file(template, 'csv'), file_name="template.csv", mime="text/csv")
+
+    uploaded = st.file_uploader("Файл с квартирами", type=['csv', 'xlsx'])
+    if uploaded is not None:
+        content = uploaded.getvalue()
+        try:
+            table = read_table(content, uploaded.name)
+        except Exception as e:
+            st.error(f"❌ Не удалось прочитать файл: {str(e)}")
+            st.stop()
+
+        rows, missing = prepare_rows(table)
+        if missing:
+            st.error("❌ В файле нет колонок: " + ", ".join(missing))
+            st.stop()
+        st.write(f"Строк в файле: {len(rows)}")
+        st.dataframe(table.head(20), use_container_width=True)
+
+        # результат живет в сессии: скачивание перезапускает скрипт, запросы не повторяются
+        file_key = (uploaded.name, hash(content))
+        if st.button("🎯 Оценить файл", type="primary"):
+            progress = st.progress(0.0, text="Отправка в API")
+            predictions = predict_rows(rows, progress)
+            st.session_state['bulk_result'] = (file_key, pd.concat([table.reset_index(drop=True), predictions], axis=1))
+
+        stored = st.session_state.get('bulk_result')
+        if stored is not None and stored[0] == file_key:
+            result_table = stored[1]
+            failed = int((result_table['status'] != 'success').sum())
+            st.success(f"✅ Оценено {len(result_table) - failed} из {len(result_table)}")
+            if failed:
+                st.warning(f"⚠️ Строк с ошибками: {failed} (колонка message)")
+            st.dataframe(result_table, use_container_width=True)
+
+            stem = os.path.splitext(uploaded.name)[0]
+            download_csv, download_xlsx = st.columns(2)
+            with download_csv:
+                st.download_button("⬇️ Скачать CSV", result_file(result_table, 'csv'),
+                                   file_name=f"{stem}_prices.csv", mime="text/csv")
+            with download_xlsx:
+                st.download_button("⬇️ Скачать XLSX", result_file(result_table, 'xlsx'),
+                                   file_name=f"{stem}_prices.xlsx",
+                                   mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
 with st.sidebar:
     st.header("ℹ️ Информация")
@@ -173,30 +345,34 @@ with st.sidebar:
     1. Заполните все параметры недвижимости
     2. Нажмите кнопку "Предсказать стоимость"
     3. Получите предсказанную цену и похожие объекты
-    
+
+    Для списка квартир — вкладка **Файл**: загрузите CSV/XLSX
+    и скачайте его с колонкой `predicted_price`.
+
     ### Доступные города:
     - **Москва**
-    - **Санкт-Петербург** 
+    - **Санкт-Петербург**
     - **Казань**
     - **Нижний Новгород**
     - **Новосибирск**
     - **Екатеринбург**
-    
+
     ### Примечание:
     Убедитесь, что API сервер запущен на порту 8000
     """)
-    
+
     st.header("🔗 Статус подключения")
-    try:
-        health_response = requests.get(f"{BACKEND_URL}/predict", timeout=5)
-        if health_response.status_code == 200:
-            st.success("✅ API доступен")
-            health_data = health_response.json()
-            st.metric("Модель загружена", "Да" if health_data.get('model_loaded') else "Нет")
-        else:
-            st.error("❌ API недоступен")
-    except:
+    health_data = fetch_health()
+    if health_data is not None:
+        st.success("✅ API доступен")
+        st.metric("Модель загружена", "Да" if health_data.get('model_loaded') else "Нет")
+        if health_data.get('model_version'):
+            st.caption(f"Версия модели: {health_data['model_version']}")
+    else:
         st.error("❌ Не удалось подключиться к API")
+    if st.button("🔄 Обновить статус"):
+        fetch_health.clear()
+        st.rerun()
 
 st.markdown("---")
-st.markdown("Real Estate Price Predictor • Powered by ML")
\ No newline at end of file
+st.markdown("Real Estate Price Predictor • Powered by ML")
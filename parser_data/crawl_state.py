@@ -0,0 +1,152 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+
+LISTING_ID_PATTERN = re.compile(r"_(\d+)$")
+
+
+def normalize_listing_url(url):
+    """Ссылка без query и fragment: ?context=... меняется от обхода к обходу"""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path.rstrip("/"), "", ""))
+
+
+def listing_id(url):
+    """ID объявления Авито из хвоста ссылки (..._1234567890), иначе нормализованная ссылка"""
+    path = urlsplit(url).path.rstrip("/")
+    match = LISTING_ID_PATTERN.search(path)
+    if match:
+        return match.group(1)
+    return normalize_listing_url(url)
+
+
+def content_hash(data):
+    payload = {k: v for k, v in data.items() if k != "Ссылка"}
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class CrawlState:
+    """Чекпоинты обхода в SQLite
+
+    listings — последняя версия каждого объявления по его ID,
+    pages — завершенные страницы выдачи по городам. Строки пишутся сразу
+    после разбора объявления, поэтому падение посреди города ничего не теряет,
+    а повторный запуск продолжает с незавершенных страниц.
+    """
+
+    def __init__(self, path, freshness_days=7.0, page_ttl_hours=12.0):
+        self.path = path
+        self.freshness = freshness_days * 86400
+        self.page_ttl = page_ttl_hours * 3600
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS listings (
+                listing_id TEXT PRIMARY KEY,
+                city TEXT NOT NULL,
+                url TEXT NOT NULL,
+                data TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                fetched_at REAL NOT NULL,
+                changed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS listings_city ON listings (city);
+            CREATE TABLE IF NOT EXISTS pages (
+                city TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                listings INTEGER NOT NULL,
+                completed_at REAL NOT NULL,
+                PRIMARY KEY (city, page)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def is_fresh(self, url, now=None):
+        """Объявление уже скачано в пределах окна свежести"""
+        now = now or time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fetched_at FROM listings WHERE listing_id = ?", (listing_id(url),)
+            ).fetchone()
+        return row is not None and now - row[0] < self.freshness
+
+    def save_listing(self, city, data, now=None):
+        """Записывает объявление; возвращает 'new', 'changed' или 'unchanged'"""
+        now = now or time.time()
+        url = normalize_listing_url(data["Ссылка"])
+        data = dict(data, Ссылка=url)
+        key = listing_id(url)
+        digest = content_hash(data)
+        payload = json.dumps(data, ensure_ascii=False)
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash FROM listings WHERE listing_id = ?", (key,)
+            ).fetchone()
+            if row is None:
+                status = "new"
+                self._conn.execute(
+                    "INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, city, url, payload, digest, now, now, now),
+                )
+            else:
+                status = "unchanged" if row[0] == digest else "changed"
+                self._conn.execute(
+                    "UPDATE listings SET city = ?, url = ?, data = ?, content_hash = ?, fetched_at = ?,"
+                    " changed_at = CASE WHEN content_hash = ? THEN changed_at ELSE ? END"
+                    " WHERE listing_id = ?",
+                    (city, url, payload, digest, now, digest, now, key),
+                )
+            self._conn.commit()
+        return status
+
+    def is_page_done(self, city, page, now=None):
+        now = now or time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT completed_at FROM pages WHERE city = ? AND page = ?", (city, page)
+            ).fetchone()
+        return row is not None and now - row[0] < self.page_ttl
+
+    def complete_page(self, city, page, listings, now=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                (city, page, listings, now or time.time()),
+            )
+            self._conn.commit()
+
+    def last_completed_page(self, city, now=None):
+        """Номер последней подряд завершенной страницы в пределах page_ttl"""
+        now = now or time.time()
+        with self._lock:
+            pages = {
+                page for page, in self._conn.execute(
+                    "SELECT page FROM pages WHERE city = ? AND completed_at > ?", (city, now - self.page_ttl)
+                )
+            }
+        last = 0
+        while last + 1 in pages:
+            last += 1
+        return last
+
+    def city_rows(self, city):
+        """Все сохраненные объявления города в порядке первого появления"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM listings WHERE city = ? ORDER BY first_seen, listing_id", (city,)
+            ).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
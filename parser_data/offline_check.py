@@ -0,0 +1,185 @@
+"""Офлайн-проверка парсера на сохраненных страницах из fixtures/ без сети и браузера
+
+    python parser_data/offline_check.py
+
+Локальный HTTP-сервер отдает fixtures/search_<N>.html как выдачу
+/moskva/kvartiry/prodam?p=N и fixtures/listing_<ID>.html как объявление
+/moskva/kvartiry/..._<ID>. Объявления без файла отвечают 404, FLAKY_LISTING
+в первый раз отвечает 503. Crawler с движком http проходит две страницы
+дважды с одним CrawlState и Parquet-датасетом во временном каталоге;
+проверяются разобранные поля, повторы только временных ошибок, открытая
+страница с неразобранным объявлением и то, что второй запуск качает только ее.
+Отдельный обход, у которого не запустился ни один воркер, должен упасть, а
+не зависнуть на полной очереди. Код выхода 0, если все проверки прошли.
+"""
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from crawl_state import CrawlState
+from parquet_sink import ParquetSink, read_listings
+from parser import FETCHERS, Crawler, HttpFetcher
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+CITY = 'moskva'
+PAGES = 2
+MISSING_LISTING = '1000000005'
+FLAKY_LISTING = '1000000006'
+
+# объявление -> поля, которые должны дойти до Parquet
+EXPECTED = {
+    '1000000001': {'Цена': 12500000, 'Количество комнат': '2', 'Общая площадь': 54.0, 'Площадь кухни': 9.5,
+                   'Этаж': 5, 'Этажей в доме': 12, 'Год постройки': 1984, 'Грузовой лифт': 1,
+                   'Ремонт': 'евро', 'Парковка': 'открытая во дворе'},
+    '1000000002': {'Цена': 6900000, 'Количество комнат': 'студия', 'Общая площадь': 24.0, 'Этаж': 3,
+                   'Этажей в доме': 9, 'Грузовой лифт': 0, 'Тип дома': 'кирпичный'},
+    '1000000003': {'Цена': 9300000, 'Общая площадь': 38.2, 'Этаж': 17, 'Пассажирский лифт': 2,
+                   'Тёплый пол': 'есть'},
+    '1000000004': {'Цена': 15800000, 'Высота потолков': 3.2, 'Год постройки': 1912, 'Пассажирский лифт': 0},
+    '1000000006': {'Цена': 10200000, 'Этаж': 4, 'Этажей в доме': 14, 'Парковка': 'за шлагбаумом во дворе'},
+}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    requests = Counter()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == f'/{CITY}/kvartiry/prodam':
+            page = parse_qs(parts.query).get('p', ['1'])[0]
+            key = f'search_{page}'
+        else:
+            match = re.search(r'_(\d+)$', parts.path)
+            key = f'listing_{match.group(1)}' if match else None
+
+        with self.lock:
+            self.requests[key] += 1
+            attempt = self.requests[key]
+        if key == f'listing_{FLAKY_LISTING}' and attempt == 1:
+            return self._send(503, b'')
+
+        path = os.path.join(FIXTURES_DIR, f'{key}.html')
+        if key is None or not os.path.isfile(path):
+            return self._send(404, b'Not found')
+        with open(path, 'rb') as f:
+            self._send(200, f.read())
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WorkerlessFetcher(HttpFetcher):
+    """Выдача грузится, а воркеры падают при старте, как без Chrome у движка selenium"""
+
+    def __init__(self, limiter, timeout=20):
+        if threading.current_thread().name.startswith('worker-'):
+            raise RuntimeError("no browser")
+        super().__init__(limiter, timeout)
+
+
+def crawl_without_workers(base_url, workdir):
+    """Обход, в котором не запустился ни один воркер: должен упасть, а не зависнуть"""
+    FETCHERS['workerless'] = WorkerlessFetcher
+    state = CrawlState(os.path.join(workdir, 'crawl_state_workerless.sqlite'))
+    # один воркер — очередь на 4 задачи, а ссылок на двух страницах больше
+    crawler = Crawler(state, engine='workerless', workers=1, rate=0, retries=0)
+    outcome = {}
+
+    def target():
+        try:
+            crawler.run([base_url], PAGES)
+        except RuntimeError as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    if not thread.is_alive():
+        state.close()
+    return not thread.is_alive(), outcome.get('error')
+
+
+def crawl(base_url, workdir):
+    state = CrawlState(os.path.join(workdir, 'crawl_state.sqlite'))
+    sink = ParquetSink(os.path.join(workdir, 'parquet'), row_group_size=2)
+    crawler = Crawler(state, engine='http', workers=2, rate=0, retries=2, backoff=0.01, sink=sink)
+    try:
+        frames = crawler.run([base_url], PAGES)
+        pages = {page: state.is_page_done(CITY, page) for page in range(1, PAGES + 1)}
+    finally:
+        sink.close()
+        state.close()
+    return crawler.stats, frames[CITY], pages
+
+
+def main():
+    # ожидаемые 404 и 503 парсер все равно покажет предупреждениями
+    logging.getLogger('parser').setLevel(logging.WARNING)
+    failures = []
+
+    def check(condition, message):
+        print(f"{'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}/{CITY}/kvartiry/prodam'
+
+    try:
+        with tempfile.TemporaryDirectory(prefix='parser_check_') as workdir:
+            stats, frame, pages = crawl(base_url, workdir)
+            requests = FixtureHandler.requests
+            check(stats['new'] == len(EXPECTED), f"first run: {stats['new']} new listings of {len(EXPECTED)}")
+            check(stats['failed'] == 1, f"first run: {stats['failed']} failed listing (404)")
+            check(requests['listing_1000000001'] == 1, "duplicate link with another context fetched once")
+            check(requests[f'listing_{MISSING_LISTING}'] == 1, "404 is not retried")
+            check(requests[f'listing_{FLAKY_LISTING}'] == 2, "503 is retried")
+            check(pages == {1: True, 2: False}, f"page with a failed listing stays open: {pages}")
+            check(len(frame) == len(EXPECTED), f"CSV frame has {len(frame)} rows")
+
+            parquet_dir = os.path.join(workdir, 'parquet')
+            leftovers = [name for _, _, files in os.walk(parquet_dir) for name in files if name.startswith('.')]
+            check(not leftovers, "no temporary Parquet files left")
+            df = read_listings(parquet_dir).set_index('listing_id')
+            check(sorted(df.index) == sorted(EXPECTED), f"Parquet has listings {sorted(df.index)}")
+            for key, fields in EXPECTED.items():
+                if key not in df.index:
+                    continue
+                wrong = {col: df.at[key, col] for col, value in fields.items() if df.at[key, col] != value}
+                check(not wrong, f"listing {key} fields parsed" + (f", wrong: {wrong}" if wrong else ""))
+
+            FixtureHandler.requests.clear()
+            stats, frame, pages = crawl(base_url, workdir)
+            fetched = sorted(key for key in FixtureHandler.requests if key.startswith('listing_'))
+            check(fetched == [f'listing_{MISSING_LISTING}'], f"second run refetches only the failed listing: {fetched}")
+            check('search_1' not in FixtureHandler.requests, "second run skips the completed page")
+            check(stats['skipped'] == 2, f"second run: {stats['skipped']} fresh listings skipped")
+
+            finished, error = crawl_without_workers(base_url, workdir)
+            check(finished and error is not None, f"crawl without workers fails instead of hanging: {error}")
+    finally:
+        server.shutdown()
+
+    check('selenium' not in sys.modules, "selenium is not imported by the http engine")
+    print(f"{len(failures)} checks failed" if failures else "All checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import json
+import os
+import re
+import threading
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from crawl_state import listing_id, normalize_listing_url
+
+
+NUMBER_PATTERN = re.compile(r"-?\d+(?:[.,]\d+)?")
+FLOOR_PATTERN = re.compile(r"(\d+)\s*из\s*(\d+)")
+
+DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+
+# числовые поля парсятся при записи, остальные строки хранятся словарем
+SCHEMA = pa.schema([
+    ("listing_id", pa.string()),
+    ("Ссылка", pa.string()),
+    ("Цена", pa.int64()),
+    ("Количество комнат", DICT_STRING),
+    ("Общая площадь", pa.float64()),
+    ("Площадь кухни", pa.float64()),
+    ("Жилая площадь", pa.float64()),
+    ("Высота потолков", pa.float64()),
+    ("Этаж", pa.int16()),
+    ("Этажей в доме", pa.int16()),
+    ("Год постройки", pa.int16()),
+    ("Пассажирский лифт", pa.int8()),
+    ("Грузовой лифт", pa.int8()),
+    ("Ремонт", DICT_STRING),
+    ("Тип дома", DICT_STRING),
+    ("Парковка", DICT_STRING),
+    ("Дополнительно", DICT_STRING),
+    ("Тип комнат", DICT_STRING),
+    ("Санузел", DICT_STRING),
+    ("Окна", DICT_STRING),
+    ("Мебель", DICT_STRING),
+    ("Техника", DICT_STRING),
+    ("Способ продажи", DICT_STRING),
+    ("Вид сделки", DICT_STRING),
+    ("В доме", DICT_STRING),
+    ("Двор", DICT_STRING),
+    ("Отделка", DICT_STRING),
+    ("Название новостройки", DICT_STRING),
+    ("Тип участия", DICT_STRING),
+    ("Срок сдачи", DICT_STRING),
+    ("Корпус, строение", DICT_STRING),
+    ("Стоимость ремонта", DICT_STRING),
+    ("Балкон или лоджия", DICT_STRING),
+    ("Тёплый пол", DICT_STRING),
+    ("Запланирован снос", DICT_STRING),
+    ("Прочее", pa.string()),
+    ("fetched_at", pa.timestamp("s")),
+])
+
+FLOAT_COLUMNS = [field.name for field in SCHEMA if pa.types.is_floating(field.type)]
+INT_COLUMNS = [field.name for field in SCHEMA if pa.types.is_integer(field.type)]
+STRING_COLUMNS = [field.name for field in SCHEMA if field.type == DICT_STRING]
+LIFT_COLUMNS = ["Пассажирский лифт", "Грузовой лифт"]
+
+
+def parse_number(value):
+    """'82.6 м²' -> 82.6, '2021.0' -> 2021.0, пусто/без цифр -> None"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return None if value != value else float(value)
+    match = NUMBER_PATTERN.search(str(value).replace("\xa0", "").replace(" ", ""))
+    return float(match.group(0).replace(",", ".")) if match else None
+
+
+def parse_listing(data, fetched_at=None):
+    """Сырой словарь объявления -> строка типизированной схемы SCHEMA"""
+    row = dict.fromkeys(SCHEMA.names)
+    extra = {}
+    for key, value in data.items():
+        if key in row:
+            row[key] = value
+        else:
+            extra[key] = value
+
+    link = data.get("Ссылка")
+    if link:
+        row["Ссылка"] = normalize_listing_url(link)
+        row["listing_id"] = listing_id(link)
+
+    floor = FLOOR_PATTERN.search(str(data.get("Этаж") or ""))
+    row["Этаж"] = int(floor.group(1)) if floor else parse_number(data.get("Этаж"))
+    if row["Этажей в доме"] is None and floor:
+        row["Этажей в доме"] = int(floor.group(2))
+
+    for col in LIFT_COLUMNS:
+        if row[col] == "нет":
+            row[col] = 0
+
+    for col in FLOAT_COLUMNS:
+        row[col] = parse_number(row[col])
+    for col in INT_COLUMNS:
+        number = parse_number(row[col])
+        row[col] = None if number is None else int(number)
+    for col in STRING_COLUMNS:
+        if row[col] is not None:
+            row[col] = str(row[col])
+
+    row["Прочее"] = json.dumps(extra, ensure_ascii=False) if extra else None
+    row["fetched_at"] = pd.Timestamp(fetched_at or pd.Timestamp.now()).floor("s").to_pydatetime()
+    return row
+
+
+class ParquetSink:
+    """Потоковая запись объявлений в датасет root/city=<город>/crawl_date=<дата>/
+
+    Строки буферизуются по городам; каждые row_group_size объявлений буфер
+    города пишется отдельным файлом part-<run_id>-<номер>.parquet: сначала во
+    временный .part-*.tmp (датасет не видит файлы с точкой в начале), затем
+    os.replace. В датасете поэтому только целые файлы с футером, а упавший
+    обход теряет лишь недописанные буферы. on_flush(city, records) вызывается
+    после того, как файл на месте: только с этого момента объявления можно
+    считать сохраненными.
+    """
+
+    def __init__(self, root, row_group_size=500, crawl_date=None, compression="zstd", on_flush=None):
+        self.root = root
+        self.row_group_size = row_group_size
+        self.crawl_date = crawl_date or pd.Timestamp.now().date().isoformat()
+        self.compression = compression
+        self.on_flush = on_flush
+        self.run_id = uuid.uuid4().hex[:8]
+        self._buffers = {}
+        self._parts = 0
+        self._lock = threading.Lock()
+        self.rows_written = 0
+
+    def _flush(self, city):
+        buffer = self._buffers.pop(city, None)
+        if not buffer:
+            return
+        directory = os.path.join(self.root, f"city={city}", f"crawl_date={self.crawl_date}")
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{self.run_id}-{self._parts:05d}.parquet"
+        self._parts += 1
+        tmp_path = os.path.join(directory, f".{name}.tmp")
+        table = pa.Table.from_pylist([row for row, _ in buffer], schema=SCHEMA)
+        try:
+            pq.write_table(table, tmp_path, compression=self.compression)
+            os.replace(tmp_path, os.path.join(directory, name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.rows_written += len(buffer)
+        if self.on_flush is not None:
+            # под self._lock: пока объявления отмечаются, новые строки города ждут
+            self.on_flush(city, [data for _, data in buffer])
+
+    def write(self, city, data):
+        row = parse_listing(data)
+        with self._lock:
+            buffer = self._buffers.setdefault(city, [])
+            buffer.append((row, data))
+            if len(buffer) >= self.row_group_size:
+                self._flush(city)
+
+    def flush(self):
+        """Пишет все буферы, не дожидаясь row_group_size"""
+        with self._lock:
+            for city in list(self._buffers):
+                self._flush(city)
+
+    def close(self):
+        self.flush()
+
+
+def read_listings(root, cities=None, columns=None, latest=True):
+    """Читает датасет парсера: только нужные города и столбцы
+
+    latest=True оставляет для каждого listing_id строку из последнего обхода.
+    """
+    dataset = ds.dataset(root, format="parquet", partitioning="hive")
+    filter_ = ds.field("city").isin(cities) if cities else None
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys(list(columns) + (["listing_id", "crawl_date", "fetched_at"] if latest else [])))
+    df = dataset.to_table(columns=read_columns, filter=filter_).to_pandas()
+
+    if latest and len(df):
+        df = (df.sort_values(["crawl_date", "fetched_at"], kind="stable")
+                .drop_duplicates("listing_id", keep="last")
+                .reset_index(drop=True))
+        if columns is not None:
+            df = df[list(columns)]
+    return df
@@ -1,24 +1,104 @@
 import time
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse
 import argparse
 import logging
+import queue
+import random
 import re
+import threading
 import pandas as pd
 import os
+import requests
+
+from crawl_state import CrawlState, normalize_listing_url
+from parquet_sink import ParquetSink
 
 logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(threadName)s - %(message)s"
 )
 logger = logging.getLogger(__name__)
 
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+PARAMS_CLASS = "params__paramsList___XzY3MG"
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket: rate запросов в секунду, burst подряд"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class HostRateLimiter:
+    """Отдельный token bucket на каждый хост"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        if self.rate <= 0:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+        bucket.acquire()
+
+
+class RetryableError(Exception):
+    """Временная ошибка загрузки: стоит повторить с паузой"""
+
+
+class FetchError(Exception):
+    """Постоянная ошибка загрузки (404, 403 и другие 4xx кроме 429): повтор не поможет"""
+
+
+def with_retries(fn, url, retries=3, backoff=1.0):
+    """Вызывает fn(url), повторяя при временных ошибках с экспоненциальной паузой
+
+    Временные — RetryableError (в нее же SeleniumFetcher переводит ошибки
+    браузера) и сетевые ошибки requests; FetchError и прочее пробрасываются сразу.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn(url)
+        except (RetryableError, requests.RequestException) as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * (1 + random.random() / 2)
+            logger.warning(f"Ошибка загрузки {url}: {e}. Повтор через {delay:.1f} с")
+            time.sleep(delay)
+
 
 def parse_apartment_details(driver, url):
+    from selenium.common.exceptions import NoSuchElementException, TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
     driver.get(url)
-    time.sleep(2)
     data = {}
 
     try:
@@ -40,7 +120,7 @@ def parse_apartment_details(driver, url):
     try:
         WebDriverWait(driver, 3).until(
             EC.presence_of_element_located(
-                (By.CLASS_NAME, "params__paramsList___XzY3MG")
+                (By.CLASS_NAME, PARAMS_CLASS)
             )
         )
 
@@ -66,18 +146,7 @@ def parse_apartment_details(driver, url):
 
         texts = driver.execute_script(script)
         logger.info(f"Найдено {len(texts)} параметров для объявления")
-
-        for text in texts:
-            if ":" in text:
-                parts = text.split(":", 1)
-                param = parts[0].strip()
-                value = parts[1].strip()
-
-                if param and value:
-                    data[param] = value
-            else:
-                logger.warning(f"Не собрана информация")
-
+        add_params(data, texts)
         logger.info(f"Успешно собрано {len(data)} параметров")
 
     except TimeoutException:
@@ -90,57 +159,174 @@ def parse_apartment_details(driver, url):
     return data
 
 
-def get_city_from_url(url):
-    """Извлекает название города из URL"""
-    pattern = r"https://www\.avito\.ru/([^/]+)/kvartiry/prodam"
-    match = re.search(pattern, url)
-    if match:
-        return match.group(1)
-    return "unknown_city"
+def add_params(data, texts):
+    """Разбирает строки вида 'Параметр: значение' в словарь объявления"""
+    for text in texts:
+        if ":" in text:
+            parts = text.split(":", 1)
+            param = parts[0].strip()
+            value = parts[1].strip()
 
+            if param and value:
+                data[param] = value
+        else:
+            logger.warning(f"Не собрана информация")
+
+
+class ListingPageParser(HTMLParser):
+    """Достает из HTML ссылки выдачи, цену и параметры объявления без браузера"""
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+        self.price = None
+        self.params = []
+        self._params_depth = 0
+        self._li_text = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'a' and attrs.get('data-marker') == 'item-title' and attrs.get('href'):
+            self.links.append(attrs['href'])
+        elif tag == 'span' and attrs.get('itemprop') == 'price' and self.price is None:
+            self.price = attrs.get('content')
+        elif tag == 'ul' and PARAMS_CLASS in (attrs.get('class') or '').split():
+            self._params_depth += 1
+        elif tag == 'li' and self._params_depth:
+            self._li_text = []
+
+    def handle_endtag(self, tag):
+        if tag == 'li' and self._li_text is not None:
+            text = ''.join(self._li_text).replace(' ', ' ').strip()
+            if text:
+                self.params.append(text)
+            self._li_text = None
+        elif tag == 'ul' and self._params_depth:
+            self._params_depth -= 1
+
+    def handle_data(self, data):
+        if self._li_text is not None:
+            self._li_text.append(data)
+
+
+class HttpFetcher:
+    """Загрузка страниц через requests: быстрее браузера и работает с локальными фикстурами"""
+
+    def __init__(self, limiter, timeout=20):
+        self.limiter = limiter
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+
+    def _get(self, url):
+        self.limiter.wait(url)
+        response = self.session.get(url, timeout=self.timeout)
+        if response.status_code == 429 or response.status_code >= 500:
+            raise RetryableError(f"HTTP {response.status_code}")
+        if response.status_code >= 400:
+            raise FetchError(f"HTTP {response.status_code}")
+        page = ListingPageParser()
+        page.feed(response.text)
+        return page
+
+    def listing_links(self, page_url):
+        page = self._get(page_url)
+        return [urljoin(page_url, href) for href in page.links]
+
+    def apartment_details(self, url):
+        page = self._get(url)
+        data = {}
+        if page.price:
+            data["Цена"] = int(page.price)
+        else:
+            logger.warning("Элемент с ценой не найден")
+        add_params(data, page.params)
+        data["Ссылка"] = url
+        return data
 
-def process_city(driver, base_url, num_pages, city_name):
-    """Обрабатывает один город и возвращает DataFrame"""
-    all_data = []
+    def close(self):
+        self.session.close()
 
-    for page in range(1, num_pages + 1):
-        page_url = f"{base_url}?p={page}"
-        logger.info(f"Обработка страницы {page}/{num_pages} для города {city_name}")
-        driver.get(page_url)
 
+class SeleniumFetcher:
+    """Загрузка страниц через headless Chrome, один драйвер на воркер
+
+    selenium импортируется только здесь: движок http и офлайн-проверка без него работают.
+    """
+
+    def __init__(self, limiter, page_timeout=20):
+        self.limiter = limiter
+        self.page_timeout = page_timeout
+        self.driver = create_driver()
+
+    def _call(self, fn, url):
+        from selenium.common.exceptions import WebDriverException
+
+        self.limiter.wait(url)
         try:
-            WebDriverWait(driver, 20).until(
-                EC.presence_of_element_located(
-                    (By.CSS_SELECTOR, 'a[data-marker="item-title"]')
-                )
+            return fn(url)
+        except WebDriverException as e:
+            # таймауты и падения браузера — временные, их повторит with_retries
+            raise RetryableError(f"{type(e).__name__}: {e}") from e
+
+    def _links(self, page_url):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        self.driver.get(page_url)
+        WebDriverWait(self.driver, self.page_timeout).until(
+            EC.presence_of_element_located(
+                (By.CSS_SELECTOR, 'a[data-marker="item-title"]')
             )
+        )
+        link_elements = self.driver.find_elements(
+            By.CSS_SELECTOR, 'a[data-marker="item-title"]'
+        )
+        return [elem.get_attribute("href") for elem in link_elements]
 
-            link_elements = driver.find_elements(
-                By.CSS_SELECTOR, 'a[data-marker="item-title"]'
-            )
-            links = []
-            for elem in link_elements:
-                href = elem.get_attribute("href")
-                if href and "kvartiry" in href:
-                    links.append(href)
+    def listing_links(self, page_url):
+        return self._call(self._links, page_url)
+
+    def apartment_details(self, url):
+        return self._call(lambda link: parse_apartment_details(self.driver, link), url)
 
-            links = list(set(links))
+    def close(self):
+        self.driver.quit()
 
-            logger.info(f"На странице {page} найдено {len(links)} объявлений")
 
-            for i, link in enumerate(links, 1):
-                logger.info(f"Парсинг объявления {i}/{len(links)} для города {city_name}")
-                details = parse_apartment_details(driver, link)
-                if details:
-                    all_data.append(details)
-                time.sleep(1)
+def create_driver():
+    from selenium import webdriver
 
-            logger.info(f"Страница {page} обработана, собрано {len(links)} объявлений")
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+
+    options.add_argument(f"--user-agent={USER_AGENT}")
+
+    return webdriver.Chrome(options=options)
+
+
+FETCHERS = {
+    'selenium': SeleniumFetcher,
+    'http': HttpFetcher,
+}
 
-        except TimeoutException:
-            logger.error(f"Таймаут при загрузке страницы {page} для города {city_name}")
-            continue
 
+def get_city_from_url(url):
+    """Извлекает название города из URL"""
+    pattern = r"https?://[^/]+/([^/]+)/kvartiry/prodam"
+    match = re.search(pattern, url)
+    if match:
+        return match.group(1)
+    return "unknown_city"
+
+
+def build_city_frame(all_data, city_name):
+    """Собирает DataFrame города: Цена и Ссылка первыми"""
     if all_data:
         df = pd.DataFrame(all_data)
 
@@ -156,42 +342,228 @@ def process_city(driver, base_url, num_pages, city_name):
         return pd.DataFrame()
 
 
-def main(urls, num_pages):
-    options = webdriver.ChromeOptions()
-    options.add_argument("--headless=new")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--blink-settings=imagesEnabled=false")
-
-    options.add_argument(
-        "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    )
-
-    driver = webdriver.Chrome(options=options)
+class Crawler:
+    """Пул воркеров, разбирающих объявления из общей очереди
+
+    Страницы выдачи обходятся продюсерами (по одному на город, города
+    параллельно), ссылки на объявления кладутся в очередь, N воркеров со
+    своими драйверами/сессиями забирают их. Темп запросов ограничивается
+    token bucket на хост вместо фиксированных пауз. Страница отмечается
+    завершенной, только когда успешно разобраны все ее объявления. Без sink
+    каждое объявление сразу пишется в CrawlState; с sink — только когда его
+    строка легла в Parquet-файл (on_flush), и страница закрывается тогда же:
+    после падения объявления из недописанного буфера скачаются заново.
+    """
+
+    def __init__(self, state, engine='selenium', workers=1, rate=0.5, burst=1, retries=3, backoff=1.0,
+                 parallel_cities=1, sink=None):
+        self.state = state
+        self.sink = sink
+        self.fetcher_cls = FETCHERS[engine]
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.parallel_cities = parallel_cities
+        self.limiter = HostRateLimiter(rate, burst)
+        self.tasks = queue.Queue(maxsize=workers * 4)
+        self.pending = {}
+        # страницы, все объявления которых ушли в sink, но еще лежат в его буфере
+        self.unflushed_pages = {}
+        self.pending_lock = threading.Lock()
+        self.stats = {'new': 0, 'changed': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0}
+        self.threads = []
+        self.worker_errors = []
+        if sink is not None:
+            sink.on_flush = self._save_listings
+
+    def _count(self, key):
+        with self.pending_lock:
+            self.stats[key] += 1
+
+    def _save_listings(self, city_name, records):
+        """Отмечает объявления в CrawlState; с sink вызывается после записи их файла"""
+        for details in records:
+            self._count(self.state.save_listing(city_name, details))
+        if self.sink is not None:
+            # все строки этих страниц были в буфере до сброса, значит уже в файле
+            with self.pending_lock:
+                pages = self.unflushed_pages.pop(city_name, [])
+            for page, listings in pages:
+                self.state.complete_page(city_name, page, listings)
+
+    def _page_progress(self, city_name, page, listings, ok):
+        """Вызывается после разбора объявления: закрывает страницу, когда все готово
+
+        Страница с хотя бы одним неразобранным объявлением остается открытой:
+        следующий запуск вернется к ней и скачает только несвежие объявления.
+        """
+        with self.pending_lock:
+            progress = self.pending[(city_name, page)]
+            progress['left'] -= 1
+            progress['failed'] += not ok
+            done = progress['left'] == 0
+            if done:
+                del self.pending[(city_name, page)]
+            complete = done and progress['failed'] == 0
+            if complete and self.sink is not None:
+                self.unflushed_pages.setdefault(city_name, []).append((page, listings))
+        if done and not complete:
+            logger.warning(f"Страница {page} для города {city_name} не закрыта: "
+                           f"не разобрано {progress['failed']} объявлений")
+        if complete and self.sink is None:
+            self.state.complete_page(city_name, page, listings)
+
+    def _worker(self):
+        try:
+            fetcher = self.fetcher_cls(self.limiter)
+        except Exception as e:
+            # например, нет Chrome или chromedriver: очередь разбирают остальные воркеры
+            logger.error(f"Воркер не запустился: {e}")
+            with self.pending_lock:
+                self.worker_errors.append(e)
+            return
+        try:
+            while True:
+                item = self.tasks.get()
+                if item is None:
+                    break
+                city_name, page, listings, link = item
+                ok = False
+                try:
+                    details = with_retries(fetcher.apartment_details, link, self.retries, self.backoff)
+                    if details and self.sink is not None:
+                        self.sink.write(city_name, details)
+                    elif details:
+                        self._save_listings(city_name, [details])
+                    ok = True
+                except Exception as e:
+                    logger.error(f"Не удалось разобрать объявление {link}: {e}")
+                    self._count('failed')
+                finally:
+                    self._page_progress(city_name, page, listings, ok)
+        finally:
+            fetcher.close()
+
+    def _produce_city(self, base_url, num_pages):
+        city_name = get_city_from_url(base_url)
+        start = self.state.last_completed_page(city_name) + 1
+        if start > 1:
+            logger.info(f"Город {city_name}: продолжаем со страницы {start}")
+        logger.info(f"Обработка города: {city_name}")
+        fetcher = self.fetcher_cls(self.limiter)
+        try:
+            for page in range(start, num_pages + 1):
+                if self.state.is_page_done(city_name, page):
+                    continue
+                page_url = f"{base_url}?p={page}"
+                logger.info(f"Обработка страницы {page}/{num_pages} для города {city_name}")
+                try:
+                    hrefs = with_retries(fetcher.listing_links, page_url, self.retries, self.backoff)
+                except Exception as e:
+                    logger.error(f"Не удалось загрузить страницу {page} для города {city_name}: {e}")
+                    continue
+
+                links = list(dict.fromkeys(
+                    normalize_listing_url(href) for href in hrefs if href and "kvartiry" in href
+                ))
+                stale = [link for link in links if not self.state.is_fresh(link)]
+                self._skip(len(links) - len(stale))
+                logger.info(f"На странице {page} найдено {len(links)} объявлений, новых или устаревших: {len(stale)}")
+
+                if not stale:
+                    self.state.complete_page(city_name, page, len(links))
+                    continue
+                with self.pending_lock:
+                    self.pending[(city_name, page)] = {'left': len(stale), 'failed': 0}
+                for link in stale:
+                    if not self._put((city_name, page, len(links), link)):
+                        raise RuntimeError(f"Все воркеры остановились, город {city_name} не обойден")
+        finally:
+            fetcher.close()
+
+    def _put(self, item):
+        """Кладет задачу в очередь; False, если живых воркеров нет и очередь никто не разберет"""
+        while any(thread.is_alive() for thread in self.threads):
+            try:
+                self.tasks.put(item, timeout=1.0)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _skip(self, count):
+        with self.pending_lock:
+            self.stats['skipped'] += count
+
+    def run(self, urls, num_pages):
+        """Обходит все города и возвращает {город: DataFrame} по всем сохраненным объявлениям"""
+        self.threads = [
+            threading.Thread(target=self._worker, name=f"worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
 
+        try:
+            with ThreadPoolExecutor(max_workers=self.parallel_cities, thread_name_prefix='city') as pool:
+                for future in [pool.submit(self._produce_city, url, num_pages) for url in urls]:
+                    future.result()
+        finally:
+            for _ in self.threads:
+                if not self._put(None):
+                    break
+            for thread in self.threads:
+                thread.join()
+            if self.sink is not None:
+                self.sink.flush()
+                # страницы без единой строки в буфере: сбрасывать для них нечего
+                with self.pending_lock:
+                    pages, self.unflushed_pages = self.unflushed_pages, {}
+                for city_name, city_pages in pages.items():
+                    for page, listings in city_pages:
+                        self.state.complete_page(city_name, page, listings)
+
+        if len(self.worker_errors) == self.workers:
+            raise RuntimeError(f"Ни один воркер не запустился: {self.worker_errors[0]}") from self.worker_errors[0]
+        logger.info(f"Итоги обхода: {self.stats}")
+        cities = [get_city_from_url(url) for url in urls]
+        return {city: build_city_frame(self.state.city_rows(city), city) for city in cities}
+
+
+def main(urls, num_pages, engine='selenium', workers=1, rate=0.5, burst=1, retries=3, backoff=1.0,
+         parallel_cities=1, output_dir='.', state_path=None, freshness_days=7.0, page_ttl_hours=12.0,
+         output_format='both', parquet_dir=None, row_group_size=500):
+    state = CrawlState(state_path or os.path.join(output_dir, 'crawl_state.sqlite'),
+                       freshness_days=freshness_days, page_ttl_hours=page_ttl_hours)
+    sink = None
+    if output_format in ('parquet', 'both'):
+        sink = ParquetSink(parquet_dir or os.path.join(output_dir, 'avito_parquet'), row_group_size=row_group_size)
+    crawler = Crawler(state, engine=engine, workers=workers, rate=rate, burst=burst, retries=retries,
+                      backoff=backoff, parallel_cities=parallel_cities, sink=sink)
     try:
-        for url in urls:
-            city_name = get_city_from_url(url)
-            logger.info(f"Обработка города: {city_name}")
-            
-            df_city = process_city(driver, url, num_pages, city_name)
-            
-            if not df_city.empty:
-                csv_filename = f"avito_apartments{city_name}.csv"
-                df_city.to_csv(csv_filename, index=False, encoding="utf-8")
-                logger.info(f"Данные для города {city_name} в {csv_filename}")
-                logger.info(f"Собрано {len(df_city)} объявлений для города {city_name}")
-
-                if "Цена" in df_city.columns:
-                    successful_prices = df_city["Цена"].notna().sum()
-                    logger.info(f"Успешно извлечено цен: {successful_prices} из {len(df_city)} для города {city_name}")
-            else:
-                logger.warning(f"Нет данных для сохранения города {city_name}")
-            time.sleep(2)
-
+        frames = crawler.run(urls, num_pages)
     finally:
-        driver.quit()
+        # sink первым: его on_flush еще пишет в state
+        if sink is not None:
+            sink.close()
+            logger.info(f"В Parquet записано {sink.rows_written} объявлений: {sink.root}")
+        state.close()
+
+    if output_format == 'parquet':
+        return
+
+    for city_name, df_city in frames.items():
+        if not df_city.empty:
+            csv_filename = os.path.join(output_dir, f"avito_apartments{city_name}.csv")
+            df_city.to_csv(csv_filename, index=False, encoding="utf-8")
+            logger.info(f"Данные для города {city_name} в {csv_filename}")
+            logger.info(f"Собрано {len(df_city)} объявлений для города {city_name}")
+
+            if "Цена" in df_city.columns:
+                successful_prices = df_city["Цена"].notna().sum()
+                logger.info(f"Успешно извлечено цен: {successful_prices} из {len(df_city)} для города {city_name}")
+        else:
+            logger.warning(f"Нет данных для сохранения города {city_name}")
 
 
 if __name__ == "__main__":
@@ -199,10 +571,31 @@ if __name__ == "__main__":
     parser.add_argument(
         "--pages", type=int, default=50, help="Количество страниц для парсинга"
     )
+    parser.add_argument(
+        "--urls", nargs="+", default=['https://www.avito.ru/nizhniy_novgorod/kvartiry/prodam'],
+        help="Ссылки на выдачу по городам (можно указать локальный сервер с фикстурами)"
+    )
+    parser.add_argument(
+        "--engine", choices=sorted(FETCHERS), default="selenium", help="Браузер или прямые HTTP-запросы"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Количество воркеров для объявлений")
+    parser.add_argument("--parallel-cities", type=int, default=1, help="Сколько городов обходить одновременно")
+    parser.add_argument("--rate", type=float, default=0.5, help="Запросов в секунду на хост (0 — без ограничения)")
+    parser.add_argument("--burst", type=int, default=1, help="Сколько запросов подряд разрешено без паузы")
+    parser.add_argument("--retries", type=int, default=3, help="Повторов при временных ошибках")
+    parser.add_argument("--backoff", type=float, default=1.0, help="Начальная пауза перед повтором, с")
+    parser.add_argument("--output-dir", default=".", help="Куда сохранять CSV")
+    parser.add_argument("--state", default=None, help="SQLite с чекпоинтами (по умолчанию output-dir/crawl_state.sqlite)")
+    parser.add_argument("--freshness-days", type=float, default=7.0, help="Не перекачивать объявления моложе N дней")
+    parser.add_argument("--page-ttl-hours", type=float, default=12.0, help="Сколько часов страница выдачи считается пройденной")
+    parser.add_argument("--format", choices=["csv", "parquet", "both"], default="both",
+                        help="CSV по городам, Parquet-датасет city=/crawl_date= или оба")
+    parser.add_argument("--parquet-dir", default=None, help="Корень Parquet-датасета (по умолчанию output-dir/avito_parquet)")
+    parser.add_argument("--row-group-size", type=int, default=500, help="Сбрасывать файл Parquet каждые N объявлений")
     args = parser.parse_args()
 
-    urls_to_parse = [
-        'https://www.avito.ru/nizhniy_novgorod/kvartiry/prodam'
-    ]
-
-    main(urls_to_parse, args.pages)
\ No newline at end of file
+    main(args.urls, args.pages, engine=args.engine, workers=args.workers, rate=args.rate,
+         burst=args.burst, retries=args.retries, backoff=args.backoff,
+         parallel_cities=args.parallel_cities, output_dir=args.output_dir, state_path=args.state,
+         freshness_days=args.freshness_days, page_ttl_hours=args.page_ttl_hours,
+         output_format=args.format, parquet_dir=args.parquet_dir, row_group_size=args.row_group_size)
@@ -0,0 +1,195 @@
+"""Дообучение модели из реестра на новых объявлениях (warm start) вместо полного поиска
+
+    python -m real_estate_predictor.training.incremental --registry models
+    python -m real_estate_predictor.training.incremental --registry models --full-every 7 --trials 50
+
+Новые объявления — строки датасета, которых нет в listings.npz базовой версии
+(последней в реестре или --base): ни в ее обучении, ни в отложенной выборке.
+--test-size из них уходит в отложенную выборку, остальные дообучают CatBoost
+базовой версии (init_model): к ее деревьям добавляется --iterations новых с
+теми же параметрами. Новая и базовая модели сравниваются на объявлениях,
+которых не видела ни одна из них: отложенная выборка базовой версии плюс новая.
+Версия публикуется, только если MAE не хуже базового больше чем на --tolerance.
+Отложенная выборка копится от версии к версии, поэтому старые объявления
+проверяются каждый раз: дообучение не может незаметно забыть прежний рынок.
+
+Каждые --full-every дообучений подряд (или с --full) вместо дообучения идет
+полное обучение training.train со study в <registry>/optuna.db. Имя study
+включает версию датасета и seed, поэтому trial'ы копятся, только пока датасет
+не изменился; на новом датасете (обычный случай — в нем появились новые
+объявления) поиск начинается в новом study с нуля.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from real_estate_predictor.backend.model_registry import LISTINGS_FILE, MODEL_FILE, ModelRegistry
+from real_estate_predictor.training.train import (
+    DATASET_PATH, categorical_columns, holdout_metrics, load_dataset, train
+)
+
+
+def incremental_depth(metadata):
+    """Сколько дообучений подряд прошло с последнего полного обучения"""
+    return (metadata.get('incremental') or {}).get('depth', 0)
+
+
+def continue_training(base_model, X_train, y_train, iterations, learning_rate, seed, thread_count, train_dir):
+    """Новые iterations деревьев поверх base_model, обученные на новых объявлениях"""
+    from catboost import CatBoostRegressor
+
+    params = base_model.get_params()
+    params.update(
+        iterations=iterations,
+        # без явного шага CatBoost подобрал бы его заново под размер новых данных
+        learning_rate=learning_rate or base_model.get_all_params()['learning_rate'],
+        random_seed=seed, thread_count=thread_count, verbose=False,
+        cat_features=categorical_columns(X_train), train_dir=train_dir, allow_writing_files=True,
+    )
+    model = CatBoostRegressor(**params)
+    model.fit(X_train, y_train, init_model=base_model)
+    return model
+
+
+def retrain(dataset, registry_root, base=None, iterations=200, learning_rate=None, test_size=0.2,
+            tolerance=0.0, min_new=100, seed=42, publish=True, city=None):
+    """Дообучает базовую версию на новых объявлениях; возвращает (версия или None, метаданные)"""
+    started = time.perf_counter()
+    root = os.path.join(registry_root, 'cities', city) if city else registry_root
+    registry = ModelRegistry(root)
+    versions = registry.list_versions()
+    base = base or (versions[-1] if versions else None)
+    if base is None:
+        raise LookupError(f"No model versions in {root}, run training.train first")
+    base_listings = registry.listings(base)
+    if base_listings is None:
+        raise LookupError(f"Version {base} has no {LISTINGS_FILE}, run training.train once to start the chain")
+    base_metadata = registry.metadata(base)
+    base_model = joblib.load(os.path.join(root, base, MODEL_FILE))
+
+    X, y, manifest, hashes = load_dataset(dataset)
+    if city is not None:
+        mask = (X['city'] == city).to_numpy()
+        X, y, hashes = X[mask], y[mask], hashes[mask]
+    known = np.concatenate([base_listings['train'], base_listings['holdout']])
+    new = ~np.isin(hashes.to_numpy(), known)
+    old_holdout = np.isin(hashes.to_numpy(), base_listings['holdout'])
+    new_rows = int(new.sum())
+    print(f"{new_rows} new listings since version {base} ({len(X)} in dataset)")
+
+    report = {'base_version': base, 'new_rows': new_rows}
+    if new_rows < min_new:
+        print(f"Fewer than {min_new} new listings, nothing to retrain")
+        return None, report
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X[new], y[new], test_size=test_size, shuffle=True, random_state=seed
+    )
+    X_eval, y_eval = pd.concat([X[old_holdout], X_test]), pd.concat([y[old_holdout], y_test])
+    cpus = os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory(prefix='catboost_') as train_dir:
+        model = continue_training(base_model, X_train, y_train, iterations, learning_rate, seed, cpus, train_dir)
+        metrics = holdout_metrics(y_eval.to_numpy(), model.predict(X_eval))
+        base_metrics = holdout_metrics(y_eval.to_numpy(), base_model.predict(X_eval))
+        # только новые объявления: сколько дало дообучение там, где база ошибалась
+        new_metrics = holdout_metrics(y_test.to_numpy(), model.predict(X_test))
+        base_new_metrics = holdout_metrics(y_test.to_numpy(), base_model.predict(X_test))
+        regressed = metrics['MAE'] > base_metrics['MAE'] * (1 + tolerance)
+        print(f"Holdout MAE ({len(X_eval)} rows): base {base_metrics['MAE']:.0f}, retrained {metrics['MAE']:.0f}; "
+              f"new listings only: base {base_new_metrics['MAE']:.0f}, retrained {new_metrics['MAE']:.0f}")
+
+        metadata = {
+            'source': 'training.incremental',
+            'dataset': dataset,
+            'dataset_version': manifest.get('version'),
+            'city': city,
+            'historical_age_fill': manifest.get('stats', {}).get('historical_age_fill',
+                                                                  base_metadata.get('historical_age_fill')),
+            'params': base_metadata.get('params'),
+            'incremental': {
+                'base_version': base,
+                'depth': incremental_depth(base_metadata) + 1,
+                'new_rows': new_rows,
+                'iterations': iterations,
+                'learning_rate': model.get_params()['learning_rate'],
+                'trees': model.tree_count_,
+                'tolerance': tolerance,
+            },
+            'metrics': {
+                'holdout': metrics,
+                'base_holdout': base_metrics,
+                'new_holdout': new_metrics,
+                'base_new_holdout': base_new_metrics,
+            },
+            'test_size': test_size,
+            'seed': seed,
+            'train_rows': len(X_train),
+            'test_rows': len(X_eval),
+            'wall_time_s': round(time.perf_counter() - started, 1),
+        }
+        if regressed:
+            print(f"MAE regressed beyond tolerance {tolerance:.1%}, version {base} stays the latest")
+            return None, metadata
+        if not publish:
+            return None, metadata
+        listings = {
+            'train': np.concatenate([base_listings['train'], hashes.loc[X_train.index].to_numpy()]),
+            'holdout': np.concatenate([base_listings['holdout'], hashes.loc[X_test.index].to_numpy()]),
+        }
+        version = registry.publish(model, metadata, train_dir=train_dir, export_data=X, listings=listings)
+    print(f"Model published to {root} as version {version}")
+    return version, metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Дообучение модели на новых объявлениях")
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--registry', default=os.getenv('MODEL_REGISTRY_DIR', 'models'))
+    parser.add_argument('--city', default=None, help="Модель города в <registry>/cities/<город>/")
+    parser.add_argument('--base', default=None, help="Базовая версия (по умолчанию последняя в реестре)")
+    parser.add_argument('--iterations', type=int, default=200, help="Сколько деревьев добавить")
+    parser.add_argument('--learning-rate', type=float, default=None, help="По умолчанию шаг базовой модели")
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--tolerance', type=float, default=0.0, help="Допустимый рост MAE, доля")
+    parser.add_argument('--min-new', type=int, default=100, help="Меньше новых объявлений — не дообучать")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-publish', action='store_true', help="Только дообучение и сравнение")
+    parser.add_argument('--full', action='store_true', help="Полное обучение training.train вместо дообучения")
+    parser.add_argument('--full-every', type=int, default=None,
+                        help="Полное обучение, если после последнего уже столько дообучений подряд")
+    parser.add_argument('--trials', type=int, default=50, help="Trial'ов Optuna для полного обучения")
+    args = parser.parse_args()
+
+    root = os.path.join(args.registry, 'cities', args.city) if args.city else args.registry
+    registry = ModelRegistry(root)
+    versions = registry.list_versions()
+    base = args.base or (versions[-1] if versions else None)
+    depth = incremental_depth(registry.metadata(base)) if base else 0
+    if args.full or base is None or (args.full_every and depth >= args.full_every):
+        print(f"Full training ({depth} incremental versions since the last one)")
+        fold_jobs = 5
+        jobs = max(1, (os.cpu_count() or 1) // fold_jobs)
+        version, metadata = train(
+            args.dataset, args.registry, os.path.join(args.registry, 'optuna.db'), n_trials=args.trials,
+            jobs=jobs, fold_jobs=fold_jobs, test_size=args.test_size, seed=args.seed,
+            publish=not args.no_publish, city=args.city
+        )
+    else:
+        version, metadata = retrain(
+            args.dataset, args.registry, base, args.iterations, args.learning_rate, args.test_size,
+            args.tolerance, args.min_new, args.seed, not args.no_publish, args.city
+        )
+    if version is None:
+        print(json.dumps(metadata, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+"""Подбор гиперпараметров CatBoost и публикация модели в реестр (замена model_training.ipynb)
+
+    python -m real_estate_predictor.training.train \\
+        --dataset "real_estate_predictor/EDA&model_train/ready_to_train.csv" \\
+        --registry models --trials 50 --jobs 4
+
+Trial'ы Optuna идут параллельно в потоках (CatBoost отпускает GIL), study
+хранится в SQLite (--storage), поэтому прерванный поиск продолжается с того
+же места: зависшие trial'ы прошлого запуска по heartbeat помечаются упавшими и
+перезапускаются. Pool'ы фолдов строятся и квантуются один раз на весь поиск,
+фолды одного trial'а обучаются одновременно. Плохие trial'ы останавливаются
+по метрике первого фолда на валидации (MedianPruner). Лучшие параметры
+дообучаются на train-части с числом деревьев, равным медиане лучших итераций
+фолдов (CV оценивал их с ранней остановкой), модель оценивается на отложенной
+выборке и публикуется в реестр вместе с метриками и historical_age_fill из
+манифеста датасета.
+С --city модель учится на объявлениях одного города и публикуется в
+<registry>/cities/<город>/ — оттуда ее подхватывает маршрутизатор моделей API.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import KFold, train_test_split
+
+from real_estate_predictor.backend.feature_encoder import FEATURE_COLUMNS
+from real_estate_predictor.backend.model_registry import ModelRegistry
+
+
+DATASET_PATH = 'real_estate_predictor/EDA&model_train/ready_to_train.csv'
+
+EVAL_METRIC = 'MAE'
+# шаг отчета в pruner: каждый вызов trial.report пишет в SQLite
+REPORT_EVERY = 10
+
+
+def search_space(trial):
+    """Пространство поиска из optimize_catboost в model_training.ipynb"""
+    return {
+        'iterations': trial.suggest_int('iterations', 300, 1000),
+        'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.3),
+        'depth': trial.suggest_int('depth', 4, 8),
+        'l2_leaf_reg': trial.suggest_float('l2_leaf_reg', 1, 10),
+        'random_strength': trial.suggest_float('random_strength', 0.1, 2),
+        'bagging_temperature': trial.suggest_float('bagging_temperature', 0, 1),
+        'min_data_in_leaf': trial.suggest_int('min_data_in_leaf', 5, 20),
+    }
+
+
+def listing_hashes(links):
+    """uint64-хеши объявлений по ссылке без query: context в ссылке меняется от обхода к обходу"""
+    return pd.util.hash_pandas_object(links.str.split('?').str[0], index=False)
+
+
+def load_dataset(path):
+    """Признаки, log1p(цена), манифест ETL (если лежит рядом) и хеши объявлений"""
+    df = pd.read_csv(path)
+    manifest_path = os.path.splitext(path)[0] + '.manifest.json'
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        print(f"No dataset manifest at {manifest_path}")
+        manifest = {}
+    return df[FEATURE_COLUMNS], np.log1p(df['price']), manifest, listing_hashes(df['link'])
+
+
+def categorical_columns(X):
+    return X.select_dtypes(include=['object', 'category']).columns.tolist()
+
+
+def build_folds(X, y, n_splits, seed):
+    """Pool'ы (train квантуется один раз) для каждого фолда KFold"""
+    from catboost import Pool
+
+    cat_features = categorical_columns(X)
+    folds = []
+    for train_idx, valid_idx in KFold(n_splits=n_splits, shuffle=True, random_state=seed).split(X):
+        train = Pool(X.iloc[train_idx], y.iloc[train_idx], cat_features=cat_features)
+        train.quantize()
+        valid = Pool(X.iloc[valid_idx], y.iloc[valid_idx], cat_features=cat_features)
+        folds.append((train, valid))
+    return folds
+
+
+class PruningCallback:
+    """Колбэк CatBoost: метрика валидации -> trial.report, остановка при should_prune
+
+    stop — общий Event фолдов trial'а: остальные фолды прекращают обучение,
+    как только один из них решил, что trial бесперспективен.
+    """
+
+    def __init__(self, trial, stop, report=True, every=REPORT_EVERY):
+        self.trial = trial
+        self.stop = stop
+        self.report = report
+        self.every = every
+        self.pruned = False
+
+    def after_iteration(self, info):
+        if self.stop.is_set():
+            return False
+        if self.report and info.iteration % self.every == 0:
+            self.trial.report(info.metrics['validation'][EVAL_METRIC][-1], info.iteration)
+            if self.trial.should_prune():
+                self.pruned = True
+                self.stop.set()
+                return False
+        return True
+
+
+class Objective:
+    """CV-оценка trial'а: фолды обучаются одновременно в своем пуле потоков"""
+
+    def __init__(self, folds, fold_jobs, thread_count, seed, early_stopping_rounds):
+        self.folds = folds
+        self.fold_jobs = fold_jobs
+        self.thread_count = thread_count
+        self.seed = seed
+        self.early_stopping_rounds = early_stopping_rounds
+
+    def fit_fold(self, params, fold, callback):
+        from catboost import CatBoostRegressor
+
+        train, valid = fold
+        model = CatBoostRegressor(
+            **params, eval_metric=EVAL_METRIC, random_seed=self.seed, thread_count=self.thread_count,
+            early_stopping_rounds=self.early_stopping_rounds, verbose=False, allow_writing_files=False
+        )
+        model.fit(train, eval_set=valid, callbacks=[callback])
+        return model.get_best_score()['validation'][EVAL_METRIC], model.get_best_iteration()
+
+    def __call__(self, trial):
+        import optuna
+
+        params = search_space(trial)
+        stop = threading.Event()
+        # в pruner отчитывается только первый фолд: шаги trial.report должны идти по порядку
+        callbacks = [PruningCallback(trial, stop, report=(i == 0)) for i in range(len(self.folds))]
+        with ThreadPoolExecutor(max_workers=self.fold_jobs, thread_name_prefix=f'trial{trial.number}') as pool:
+            results = list(pool.map(lambda args: self.fit_fold(params, *args), zip(self.folds, callbacks)))
+
+        if any(callback.pruned for callback in callbacks):
+            raise optuna.TrialPruned()
+
+        scores = [score for score, _ in results]
+        trial.set_user_attr('cv_mae_std', float(np.std(scores)))
+        trial.set_user_attr('best_iterations', [int(iteration) for _, iteration in results])
+        return float(np.mean(scores))
+
+
+def create_study(storage_path, study_name, seed):
+    import optuna
+    from optuna.storages import RDBStorage, RetryFailedTrialCallback
+
+    # heartbeat в Optuna помечен экспериментальным и предупреждает при каждом запуске
+    warnings.filterwarnings('ignore', category=optuna.exceptions.ExperimentalWarning)
+
+    directory = os.path.dirname(storage_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    storage = RDBStorage(
+        f'sqlite:///{storage_path}',
+        # trial без heartbeat дольше grace_period (убитый процесс) помечается FAIL и повторяется
+        heartbeat_interval=30,
+        grace_period=120,
+        failed_trial_callback=RetryFailedTrialCallback(max_retry=1),
+    )
+    return optuna.create_study(
+        study_name=study_name,
+        storage=storage,
+        direction='minimize',
+        sampler=optuna.samplers.TPESampler(seed=seed),
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=50),
+        load_if_exists=True,
+    )
+
+
+def finished_trials(study):
+    import optuna
+
+    return [t for t in study.get_trials(deepcopy=False)
+            if t.state in (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)]
+
+
+def run_search(study, objective, n_trials, jobs, timeout=None):
+    """Дозапускает поиск до n_trials завершенных trial'ов (COMPLETE + PRUNED)"""
+    import optuna
+    from optuna.study import MaxTrialsCallback
+
+    done = len(finished_trials(study))
+    if done >= n_trials:
+        print(f"Study {study.study_name}: {done} trials already finished, search skipped")
+        return
+    print(f"Study {study.study_name}: {done}/{n_trials} trials finished, running {n_trials - done} more "
+          f"with {jobs} parallel jobs")
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    study.optimize(
+        objective,
+        n_trials=n_trials - done,
+        n_jobs=jobs,
+        timeout=timeout,
+        callbacks=[MaxTrialsCallback(n_trials, states=(optuna.trial.TrialState.COMPLETE,
+                                                       optuna.trial.TrialState.PRUNED))],
+        gc_after_trial=False,
+    )
+
+
+def holdout_metrics(y_true_log, y_pred_log):
+    """Метрики на отложенной выборке в рублях, как final_training_and_evaluation"""
+    y_true = np.expm1(y_true_log)
+    y_pred = np.expm1(y_pred_log)
+    return {
+        'MAE': float(mean_absolute_error(y_true, y_pred)),
+        'RMSE': float(np.sqrt(mean_squared_error(y_true, y_pred))),
+        'R2': float(r2_score(y_true, y_pred)),
+        'MAPE': float(np.mean(np.abs((y_true - y_pred) / y_true)) * 100),
+        'MAE_log': float(mean_absolute_error(y_true_log, y_pred_log)),
+    }
+
+
+def final_iterations(trial):
+    """Деревьев в финальной модели: медиана лучших итераций фолдов по early stopping
+
+    CV оценивал trial с ранней остановкой, поэтому финальная модель без нее с
+    iterations из пространства поиска была бы переобучена относительно оценки.
+    У trial'ов без best_iterations (старые study) остается iterations из параметров.
+    """
+    iterations = trial.user_attrs.get('best_iterations')
+    if not iterations:
+        return trial.params['iterations']
+    # best_iteration считается с нуля: деревьев на одно больше
+    return int(round(np.median(iterations))) + 1
+
+
+def train_final(params, X_train, y_train, seed, thread_count, train_dir):
+    from catboost import CatBoostRegressor
+
+    model = CatBoostRegressor(
+        **params, random_seed=seed, thread_count=thread_count, verbose=False,
+        cat_features=categorical_columns(X_train), train_dir=train_dir
+    )
+    model.fit(X_train, y_train)
+    return model
+
+
+def train(dataset, registry_root, storage, study_name=None, n_trials=50, jobs=1, fold_jobs=None,
+          n_splits=5, test_size=0.2, seed=42, early_stopping_rounds=100, timeout=None, publish=True, city=None):
+    started = time.perf_counter()
+    X, y, manifest, hashes = load_dataset(dataset)
+    dataset_version = manifest.get('version')
+    if city is not None:
+        mask = (X['city'] == city).to_numpy()
+        if not mask.any():
+            raise ValueError(f"No listings for city {city} in {dataset}")
+        X, y, hashes = X[mask], y[mask], hashes[mask]
+        registry_root = os.path.join(registry_root, 'cities', city)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, shuffle=True, random_state=seed)
+
+    fold_jobs = fold_jobs or n_splits
+    cpus = os.cpu_count() or 1
+    thread_count = max(1, cpus // (jobs * fold_jobs))
+
+    study_name = study_name or f'catboost-{dataset_version or "unversioned"}-seed{seed}' + (f'-{city}' if city else '')
+    study = create_study(storage, study_name, seed)
+    if n_trials > 0:
+        folds = build_folds(X_train, y_train, n_splits, seed)
+        objective = Objective(folds, fold_jobs, thread_count, seed, early_stopping_rounds)
+        run_search(study, objective, n_trials, jobs, timeout)
+
+    best = study.best_trial
+    print(f"Best trial #{best.number}: CV {EVAL_METRIC} {best.value:.4f}, params {best.params}")
+
+    iterations = final_iterations(best)
+    print(f"Final model: {iterations} iterations (median best iteration over folds, "
+          f"search value {best.params['iterations']})")
+
+    with tempfile.TemporaryDirectory(prefix='catboost_') as train_dir:
+        model = train_final(dict(best.params, iterations=iterations), X_train, y_train, seed, cpus, train_dir)
+        metrics = holdout_metrics(y_test.to_numpy(), model.predict(X_test))
+        print("Holdout: " + ", ".join(f"{name} {value:.4f}" for name, value in metrics.items()))
+
+        trials = finished_trials(study)
+        metadata = {
+            'source': 'training.train',
+            'dataset': dataset,
+            'dataset_version': dataset_version,
+            'city': city,
+            # средний возраст старых домов по городу из ETL: API подставляет его в house_age
+            'historical_age_fill': manifest.get('stats', {}).get('historical_age_fill'),
+            'params': best.params,
+            'final_iterations': iterations,
+            'metrics': {'holdout': metrics},
+            'cv': {
+                'metric': EVAL_METRIC,
+                'folds': n_splits,
+                'mean': best.value,
+                'std': best.user_attrs.get('cv_mae_std'),
+                'best_iterations': best.user_attrs.get('best_iterations'),
+            },
+            'study': {
+                'name': study_name,
+                'storage': storage,
+                'best_trial': best.number,
+                'trials': len(trials),
+                'pruned': sum(t.state.name == 'PRUNED' for t in trials),
+            },
+            'test_size': test_size,
+            'seed': seed,
+            'train_rows': len(X_train),
+            'test_rows': len(X_test),
+            'wall_time_s': round(time.perf_counter() - started, 1),
+        }
+        if not publish:
+            return None, metadata
+        listings = {'train': hashes.loc[X_train.index].to_numpy(), 'holdout': hashes.loc[X_test.index].to_numpy()}
+        version = ModelRegistry(registry_root).publish(model, metadata, train_dir=train_dir, export_data=X_train,
+                                                       listings=listings)
+    print(f"Model published to {registry_root} as version {version}")
+    return version, metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подбор гиперпараметров CatBoost и публикация модели")
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--registry', default=os.getenv('MODEL_REGISTRY_DIR', 'models'))
+    parser.add_argument('--storage', default=None, help="SQLite-файл study (по умолчанию <registry>/optuna.db)")
+    parser.add_argument('--study-name', default=None, help="По умолчанию catboost-<версия датасета>-seed<seed>")
+    parser.add_argument('--trials', type=int, default=50, help="Сколько trial'ов должно быть завершено в study")
+    parser.add_argument('--jobs', type=int, default=None, help="Параллельных trial'ов (по умолчанию ядра / фолды)")
+    parser.add_argument('--fold-jobs', type=int, default=None, help="Одновременно обучаемых фолдов")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--early-stopping', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=None, help="Секунд на поиск в этом запуске")
+    parser.add_argument('--no-publish', action='store_true', help="Только поиск и оценка, без записи в реестр")
+    parser.add_argument('--city', default=None, help="Модель одного города в <registry>/cities/<город>/")
+    args = parser.parse_args()
+
+    fold_jobs = args.fold_jobs or args.folds
+    jobs = args.jobs or max(1, (os.cpu_count() or 1) // fold_jobs)
+    storage = args.storage or os.path.join(args.registry, 'optuna.db')
+    version, metadata = train(
+        args.dataset, args.registry, storage, args.study_name, args.trials, jobs, fold_jobs,
+        args.folds, args.test_size, args.seed, args.early_stopping, args.timeout, not args.no_publish, args.city
+    )
+    if version is None:
+        print(json.dumps(metadata, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()